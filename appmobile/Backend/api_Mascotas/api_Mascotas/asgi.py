@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "api_Mascotas.settings")
 
 application = get_asgi_application()
+
+# Precarga y mantiene al día el buffer de ubicaciones recientes de este proceso
+from location.recent import start_recent_tracks  # noqa: E402
+
+start_recent_tracks()
@@ -0,0 +1,94 @@
+"""
+Enrutamiento de lecturas hacia la réplica opcional.
+
+``ReplicaRoutingMiddleware`` marca los GET de los endpoints listados en
+``DATABASE_REPLICA_URL_NAMES`` para que ``ReplicaRouter`` los lea de la base
+``replica``. Después de un POST/PUT/PATCH/DELETE exitoso el cliente recibe una
+cookie que lo mantiene en la base principal durante
+``DATABASE_READ_YOUR_WRITES_SECONDS`` para que siempre vea sus propias escrituras.
+"""
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+REPLICA = 'replica'
+STICKY_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and replica_configured():
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # La réplica tiene los mismos datos que la base principal
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+            # Sin I/O: bajo ASGI la versión async evita que Django lo ejecute en un hilo
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _use_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        return self.sticky(request, response)
+
+    async def __acall__(self, request):
+        token = _use_replica.set(False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        return self.sticky(request, response)
+
+    def sticky(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400 and replica_configured():
+            response.set_cookie(
+                STICKY_COOKIE,
+                '1',
+                max_age=getattr(settings, 'DATABASE_READ_YOUR_WRITES_SECONDS', 10),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        self.route(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self.route(request)
+
+    def route(self, request):
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        _use_replica.set(
+            request.method in SAFE_METHODS
+            and STICKY_COOKIE not in request.COOKIES
+            and url_name in getattr(settings, 'DATABASE_REPLICA_URL_NAMES', [])
+        )
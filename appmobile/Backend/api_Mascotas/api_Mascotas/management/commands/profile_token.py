@@ -0,0 +1,8 @@
+from django.core.management.base import BaseCommand
+from api_Mascotas.profiling import make_profile_token
+
+class Command(BaseCommand):
+    help = 'Genera un valor firmado para el header X-Profile que activa el perfilado de un request'
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_profile_token())
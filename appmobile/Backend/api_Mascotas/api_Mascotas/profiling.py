@@ -0,0 +1,333 @@
+"""
+Perfilado bajo demanda de requests.
+
+Un request se perfila si trae el header ``X-Profile`` firmado (ver el comando
+``profile_token``), si cae en el porcentaje de muestreo configurado o si un
+usuario staff agrega ``?_perfil=1``. El perfil se guarda en disco en formato
+speedscope y collapsed-stack, junto con el reparto de tiempo entre BD,
+serialización, render y vista, y se consulta en ``/admin/perfiles/``.
+"""
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core import signing
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
+
+from .query_budget import QueryCounter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SALT = 'api_Mascotas.profiling'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_QUERY_FLAG = '_perfil'
+
+# Categorías de tiempo: la primera coincidencia desde la hoja de la pila gana
+CATEGORIAS = (
+    ('bd', ('django/db/', 'psycopg')),
+    ('serializacion', ('rest_framework/serializers.py', 'rest_framework/fields.py',
+                       'rest_framework/relations.py')),
+    ('render', ('rest_framework/renderers.py', 'json/encoder.py', 'django/template/')),
+)
+CATEGORIA_VISTA = 'vista'
+
+_PROFILE_NAME = re.compile(r'^[0-9T\-]+_[0-9a-f]{8}\.(speedscope\.json|collapsed\.txt|meta\.json)$')
+
+
+def make_profile_token():
+    """Genera un valor firmado para el header X-Profile"""
+    return signing.dumps('perfil', salt=PROFILE_SALT)
+
+
+def profiles_dir():
+    return getattr(settings, 'PROFILING_DIR', settings.BASE_DIR / 'perfiles')
+
+
+@lru_cache(maxsize=4096)
+def frame_label(code):
+    filename = code.co_filename
+    for prefix in sys.path:
+        if prefix and filename.startswith(prefix):
+            filename = filename[len(prefix):].lstrip(os.sep)
+            break
+    return (code.co_name, filename, code.co_firstlineno)
+
+
+class SamplingProfiler:
+    """Toma muestras periódicas de la pila del hilo que atiende el request"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += now - last
+            last = now
+
+    def __enter__(self):
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._sampler.join()
+        return False
+
+
+class TracingProfiler:
+    """Perfilador determinista: mide el tiempo exacto de cada pila con sys.setprofile"""
+
+    def __init__(self):
+        self.stacks = Counter()
+        self._stack = []
+        self._last = None
+
+    def _callback(self, frame, event, arg):
+        now = time.perf_counter()
+        if self._stack:
+            self.stacks[tuple(self._stack)] += now - self._last
+        if event == 'call':
+            self._stack.append(frame_label(frame.f_code))
+        elif event == 'return' and self._stack:
+            self._stack.pop()
+        elif event == 'c_call':
+            self._stack.append((getattr(arg, '__qualname__', repr(arg)), '<built-in>', 0))
+        elif event in ('c_return', 'c_exception') and self._stack:
+            self._stack.pop()
+        self._last = time.perf_counter()
+
+    def __enter__(self):
+        self._last = time.perf_counter()
+        sys.setprofile(self._callback)
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.setprofile(None)
+        return False
+
+
+def categorize(stack):
+    for frame in reversed(stack):
+        filename = frame[1].replace(os.sep, '/')
+        for categoria, patrones in CATEGORIAS:
+            if any(patron in filename for patron in patrones):
+                return categoria
+    return CATEGORIA_VISTA
+
+
+def time_split(stacks, wall):
+    """Reparte el tiempo total del request según la categoría de cada pila"""
+    por_categoria = Counter()
+    for stack, weight in stacks.items():
+        por_categoria[categorize(stack)] += weight
+    total = sum(por_categoria.values()) or 1
+    categorias = [c for c, _ in CATEGORIAS] + [CATEGORIA_VISTA]
+    return {c: round(wall * por_categoria[c] / total * 1000, 2) for c in categorias}
+
+
+def to_speedscope(stacks, name):
+    frames = []
+    index = {}
+    samples = []
+    weights = []
+    for stack, weight in stacks.items():
+        sample = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({'name': frame[0], 'file': frame[1], 'line': frame[2]})
+            sample.append(index[frame])
+        samples.append(sample)
+        weights.append(weight)
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'api_Mascotas.profiling',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        }],
+    }
+
+
+def to_collapsed(stacks):
+    lines = []
+    for stack, weight in stacks.most_common():
+        path = ';'.join(f'{name} ({filename}:{line})' for name, filename, line in stack)
+        lines.append(f'{path} {max(1, int(weight * 1_000_000))}')
+    return '\n'.join(lines) + '\n'
+
+
+def prune_profiles(directory):
+    max_files = getattr(settings, 'PROFILING_MAX_PROFILES', 200)
+    metas = sorted(directory.glob('*.meta.json'))
+    for meta in metas[:max(0, len(metas) - max_files)]:
+        base = meta.name[:-len('.meta.json')]
+        for path in directory.glob(f'{base}.*'):
+            path.unlink(missing_ok=True)
+
+
+class ProfilingMiddleware:
+    """Ejecuta la vista bajo un perfilador cuando el request lo solicita"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def trigger(self, request):
+        token = request.META.get(PROFILE_HEADER)
+        if token:
+            try:
+                signing.loads(
+                    token,
+                    salt=PROFILE_SALT,
+                    max_age=getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600)
+                )
+                return 'header'
+            except signing.BadSignature:
+                logger.warning(f"Header X-Profile inválido en {request.path}")
+        if request.GET.get(PROFILE_QUERY_FLAG) == '1':
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_staff:
+                return 'staff'
+        if random.random() < getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0):
+            return 'muestreo'
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        motivo = self.trigger(request)
+        if not motivo:
+            return self.get_response(request)
+
+        if getattr(settings, 'PROFILING_MODE', 'muestreo') == 'determinista':
+            profiler = TracingProfiler()
+        else:
+            profiler = SamplingProfiler(getattr(settings, 'PROFILING_INTERVAL', 0.001))
+
+        start = time.perf_counter()
+        with QueryCounter() as counter:
+            with profiler:
+                response = self.get_response(request)
+        wall = time.perf_counter() - start
+
+        try:
+            profile_id = self.store(request, response, profiler.stacks, wall, counter, motivo)
+            response['X-Profile-Id'] = profile_id
+        except OSError as e:
+            logger.error(f"❌ No se pudo guardar el perfil de {request.path}: {str(e)}")
+        return response
+
+    async def __acall__(self, request):
+        # Los perfiladores siguen un solo hilo; en el event loop mezclarían requests concurrentes
+        if self.trigger(request):
+            logger.info(f"Perfilado no disponible bajo ASGI, se atiende {request.path} sin perfil")
+        return await self.get_response(request)
+
+    def store(self, request, response, stacks, wall, counter, motivo):
+        directory = profiles_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        profile_id = f"{timezone.now().strftime('%Y%m%dT%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        name = f'{request.method} {request.path}'
+
+        meta = {
+            'id': profile_id,
+            'request': name,
+            'status': response.status_code,
+            'motivo': motivo,
+            'modo': getattr(settings, 'PROFILING_MODE', 'muestreo'),
+            'total_ms': round(wall * 1000, 2),
+            'consultas': counter.count,
+            'bd_ms_exacto': round(counter.duration * 1000, 2),
+            'reparto_ms': time_split(stacks, wall),
+            'fecha': timezone.now().isoformat(),
+        }
+        (directory / f'{profile_id}.speedscope.json').write_text(json.dumps(to_speedscope(stacks, name)))
+        (directory / f'{profile_id}.collapsed.txt').write_text(to_collapsed(stacks))
+        (directory / f'{profile_id}.meta.json').write_text(json.dumps(meta))
+        prune_profiles(directory)
+        logger.info(f"Perfil {profile_id} guardado para {name}: {meta['reparto_ms']}")
+        return profile_id
+
+
+@staff_member_required
+def profiles_index(request):
+    """Lista los perfiles guardados, del más reciente al más antiguo"""
+    directory = profiles_dir()
+    metas = []
+    if directory.exists():
+        for path in sorted(directory.glob('*.meta.json'), reverse=True):
+            try:
+                metas.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+
+    rows = format_html_join(
+        '\n',
+        '<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td>'
+        '<td><a href="{}.speedscope.json">speedscope</a> · <a href="{}.collapsed.txt">collapsed</a></td></tr>',
+        (
+            (
+                m['fecha'], m['request'], m['status'], m['motivo'], m['total_ms'], m['consultas'],
+                ', '.join(f'{k}: {v} ms' for k, v in m['reparto_ms'].items()),
+                m['id'], m['id'],
+            )
+            for m in metas
+        ),
+    )
+    html = format_html(
+        '<html><head><title>Perfiles</title></head><body><h1>Perfiles de requests</h1>'
+        '<p>Abrir los archivos speedscope en https://www.speedscope.app</p>'
+        '<table border="1" cellpadding="4"><tr><th>Fecha</th><th>Request</th><th>Status</th>'
+        '<th>Motivo</th><th>Total (ms)</th><th>Consultas</th><th>Reparto</th><th>Archivos</th></tr>'
+        '{}</table></body></html>',
+        rows,
+    )
+    return HttpResponse(html)
+
+
+@staff_member_required
+def profile_download(request, name):
+    """Descarga un archivo de perfil"""
+    if not _PROFILE_NAME.match(name):
+        raise Http404('Perfil no encontrado')
+    path = profiles_dir() / name
+    if not path.exists():
+        raise Http404('Perfil no encontrado')
+    return FileResponse(path.open('rb'), as_attachment=name.endswith('.txt'))
@@ -0,0 +1,182 @@
+"""
+Conteo y huella de las consultas SQL de cada request.
+
+Las vistas declaran su presupuesto con ``@query_budget(n)``. El middleware
+agrega el conteo a la respuesta y marca los endpoints que exceden su
+presupuesto o repiten la misma forma de consulta (N+1). Los tests usan
+``QueryBudgetTestMixin`` para hacer cumplir los presupuestos.
+
+Bajo ASGI las consultas del ORM async corren en el hilo ``thread_sensitive``
+del request, así que el contador se instala en ese mismo hilo.
+"""
+import hashlib
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.urls import resolve
+
+logger = logging.getLogger(__name__)
+
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS_IN = re.compile(r"\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)")
+_ESPACIOS = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """Normaliza una consulta para que las que solo cambian en parámetros tengan la misma forma"""
+    sql = _LITERALES.sub('?', sql)
+    sql = _LISTAS_IN.sub('(...)', sql)
+    return _ESPACIOS.sub(' ', sql).strip()
+
+
+def query_budget(max_queries):
+    """Declara el número máximo de consultas SQL de una vista o método de vista"""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def get_view_budget(view_func, method):
+    """Obtiene el presupuesto declarado para una vista (función o método de APIView)"""
+    budget = getattr(view_func, 'query_budget', None)
+    view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+    if view_class is not None:
+        handler = getattr(view_class, method.lower(), None)
+        budget = getattr(handler, 'query_budget', budget)
+    return budget
+
+
+class QueryCounter:
+    """Registra huella y duración de cada consulta ejecutada dentro del bloque"""
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((fingerprint(sql), time.perf_counter() - start))
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+        return False
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.queries)
+
+    def repeated(self, threshold):
+        """Formas de consulta repetidas al menos ``threshold`` veces (sospechosas de N+1)"""
+        shapes = Counter(shape for shape, _ in self.queries)
+        return [(shape, n) for shape, n in shapes.most_common() if n >= threshold]
+
+
+def short_hash(shape):
+    return hashlib.sha1(shape.encode('utf-8')).hexdigest()[:10]
+
+
+class QueryBudgetMiddleware:
+    """Cuenta las consultas de cada request y señala presupuestos excedidos y N+1"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', True):
+            return self.get_response(request)
+
+        with QueryCounter() as counter:
+            response = self.get_response(request)
+        return self.report(request, response, counter)
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', True):
+            return await self.get_response(request)
+
+        counter = QueryCounter()
+        await sync_to_async(counter.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(counter.__exit__)(None, None, None)
+        return self.report(request, response, counter)
+
+    def report(self, request, response, counter):
+        # La vista resuelta la deja el handler en el request (sin process_view: bajo ASGI sería otro salto de hilo)
+        match = request.resolver_match
+        budget = get_view_budget(match.func, request.method) if match else None
+        repeated = counter.repeated(getattr(settings, 'QUERY_BUDGET_REPEAT_THRESHOLD', 3))
+        exceeded = budget is not None and counter.count > budget
+
+        response['X-Query-Count'] = str(counter.count)
+        if exceeded:
+            response['X-Query-Budget-Exceeded'] = f'{counter.count}/{budget}'
+        if repeated:
+            shape, n = repeated[0]
+            response['X-Query-Repeated'] = f'{n}x {short_hash(shape)}'
+
+        if (exceeded or repeated) and random.random() < getattr(settings, 'QUERY_BUDGET_LOG_SAMPLE_RATE', 1.0):
+            logger.warning(
+                "Presupuesto de consultas en %s %s: %s consultas (presupuesto %s, %.1f ms). Repetidas: %s",
+                request.method,
+                request.path,
+                counter.count,
+                budget,
+                counter.duration * 1000,
+                '; '.join(f'{n}x [{short_hash(shape)}] {shape}' for shape, n in repeated[:3]) or 'ninguna',
+            )
+        return response
+
+
+class QueryBudgetTestMixin:
+    """Mixin para TestCase que hace cumplir el presupuesto declarado por cada endpoint"""
+
+    repeated_query_threshold = 3
+
+    def assertWithinQueryBudget(self, path, method='get', data=None, **extra):
+        budget = get_view_budget(resolve(path).func, method)
+        self.assertIsNotNone(budget, f'{method.upper()} {path} no declara query_budget')
+
+        with QueryCounter() as counter:
+            response = getattr(self.client, method)(path, data, **extra)
+
+        self.assertLessEqual(
+            counter.count,
+            budget,
+            f'{method.upper()} {path} ejecutó {counter.count} consultas (presupuesto {budget})',
+        )
+        repeated = counter.repeated(self.repeated_query_threshold)
+        self.assertFalse(
+            repeated,
+            f'{method.upper()} {path} repite consultas (N+1): '
+            + '; '.join(f'{n}x {shape}' for shape, n in repeated),
+        )
+        return response
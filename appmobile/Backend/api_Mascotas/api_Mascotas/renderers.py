@@ -0,0 +1,27 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer de DRF sobre orjson, con la misma salida compacta"""
+
+    # Las fechas y tipos no nativos pasan por el encoder de DRF para conservar su formato
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    _default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self._default, option=self.options)
+        except (orjson.JSONEncodeError, TypeError):
+            # Casos que orjson no cubre (p. ej. enteros de más de 64 bits)
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Igual que DRF: escapar separadores de línea de JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
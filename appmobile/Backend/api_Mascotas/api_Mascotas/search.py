@@ -0,0 +1,63 @@
+"""
+Búsqueda de texto sin distinguir mayúsculas ni tildes, con índice GIN.
+
+``normalizar_busqueda`` (función SQL IMMUTABLE creada en la migración
+dueño/0002_busqueda) pasa el texto a minúsculas y le quita las tildes. Los modelos indexan ``to_tsvector('simple', ...)`` de sus campos
+normalizados (``search_vector``), y ``search`` filtra con la misma expresión,
+así Postgres usa el índice en vez de recorrer la tabla.
+
+Cada palabra buscada es un prefijo (``'lu':*`` encuentra "Luna"); el ranking
+pesa más los nombres (peso A) que el resto de campos (peso B).
+"""
+import re
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import Func, TextField, Value
+from rest_framework.pagination import PageNumberPagination
+
+CONFIG = 'simple'  # Sin stemming: nombres propios, correos y teléfonos
+
+# Caracteres que sobran en una palabra de tsquery (comillas y operadores)
+_PALABRAS = re.compile(r"[^\s'\\&|!():*<>]+")
+
+
+class Normalizar(Func):
+    function = 'normalizar_busqueda'
+    output_field = TextField()
+
+
+def search_vector(principales, secundarios):
+    """Documento de búsqueda: los campos ``principales`` con peso A y los ``secundarios`` con peso B"""
+    return (
+        SearchVector(*[Normalizar(campo) for campo in principales], config=CONFIG, weight='A')
+        + SearchVector(*[Normalizar(campo) for campo in secundarios], config=CONFIG, weight='B')
+    )
+
+
+def search_query(texto):
+    """tsquery con cada palabra del texto como prefijo, o None si no hay palabras"""
+    palabras = _PALABRAS.findall(texto or '')
+    if not palabras:
+        return None
+    consulta = ' & '.join(f"'{palabra}':*" for palabra in palabras)
+    return SearchQuery(Normalizar(Value(consulta)), config=CONFIG, search_type='raw')
+
+
+def search(queryset, vector, texto):
+    """Filas que contienen todas las palabras de ``texto``, de la más a la menos relevante"""
+    consulta = search_query(texto)
+    if consulta is None:
+        return queryset.none()
+    return queryset.annotate(documento=vector, relevancia=SearchRank(vector, consulta)).filter(
+        documento=consulta
+    ).order_by('-relevancia', 'id')
+
+
+class SearchPagination(PageNumberPagination):
+    """Páginas de ``SEARCH_PAGE_SIZE`` resultados; el cliente puede pedir otro tamaño con ``tamano``"""
+    page_size_query_param = 'tamano'
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        self.page_size = getattr(settings, 'SEARCH_PAGE_SIZE', 20)
+        return super().get_page_size(request)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -50,10 +51,13 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     "django.middleware.security.SecurityMiddleware",
+    "api_Mascotas.query_budget.QueryBudgetMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "api_Mascotas.profiling.ProfilingMiddleware",
+    "api_Mascotas.db_router.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -79,6 +83,17 @@ TEMPLATES = [
 WSGI_APPLICATION = "api_Mascotas.wsgi.application"
 
 
+# Pool de conexiones de psycopg 3 (Django 5.1). Con pool, CONN_MAX_AGE debe quedar en 0:
+# cerrar la conexión la devuelve al pool y, con CONN_HEALTH_CHECKS, cada préstamo se valida
+# con ConnectionPool.check_connection; así el servidor web y el bridge MQTT sobreviven a
+# reinicios de Postgres. Tamaño ajustable con DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE.
+DATABASE_POOL_OPTIONS = {
+    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+    'timeout': 10,  # Segundos de espera por una conexión libre
+    'max_idle': 300,  # Cerrar conexiones ociosas después de 5 minutos
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -87,6 +102,49 @@ DATABASES = {
         'PASSWORD': '12345678',
         'HOST': 'localhost',
         'PORT': '5432',
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pool': DATABASE_POOL_OPTIONS,
+        },
+    }
+}
+
+# Réplica de lectura opcional para los GET de lectura intensiva
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DB_REPLICA_HOST'],
+        'PORT': os.environ.get('DB_REPLICA_PORT', '5432'),
+        'OPTIONS': {
+            'pool': dict(DATABASE_POOL_OPTIONS),
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    }
+
+DATABASE_ROUTERS = ['api_Mascotas.db_router.ReplicaRouter']
+
+# Endpoints (nombre de URL) cuyos GET pueden leerse de la réplica
+DATABASE_REPLICA_URL_NAMES = [
+    'get-latest-locations',
+    'get-latest-locations-async',
+    'location-snapshot',
+    'location-playback',
+    'location-track',
+    'mascotas_list',
+    'dueños_list',
+]
+
+# Segundos que un cliente lee de la base principal después de escribir (read-your-writes)
+DATABASE_READ_YOUR_WRITES_SECONDS = 10
+
+# Caché compartida por los workers web y el bridge (trayectos remuestreados, location/resample.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 5_000},
     }
 }
 
@@ -139,6 +197,13 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 APPEND_SLASH = False
 
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api_Mascotas.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
 # Configuración de Celery para tareas programadas
 CELERY_BEAT_SCHEDULE = {
     'clean-old-locations': {
@@ -148,4 +213,120 @@ CELERY_BEAT_SCHEDULE = {
             'expires': 60,  # La tarea expira después de 60 segundos
         },
     },
+    'clean-old-device-status': {
+        'task': 'location.tasks.clean_old_device_status',
+        'schedule': timedelta(days=1),
+        'options': {
+            'expires': 60,
+        },
+    },
+    'detect-visits': {
+        'task': 'location.tasks.detect_visits',
+        'schedule': timedelta(minutes=1),
+        'options': {
+            'expires': 50,
+        },
+    },
+    'clean-heatmap-cache': {
+        'task': 'location.tasks.clean_heatmap_cache',
+        'schedule': timedelta(days=1),
+        'options': {
+            'expires': 60,
+        },
+    },
 }
+
+# Búsqueda de mascotas y dueños (ver api_Mascotas/search.py)
+SEARCH_PAGE_SIZE = 20  # Resultados por página; el cliente puede pedir hasta 100 con ?tamano=
+
+# Presupuesto de consultas SQL por endpoint (ver api_Mascotas/query_budget.py)
+QUERY_BUDGET_ENABLED = True
+QUERY_BUDGET_REPEAT_THRESHOLD = 3  # Misma forma de consulta repetida N veces = posible N+1
+QUERY_BUDGET_LOG_SAMPLE_RATE = 1.0 if DEBUG else 0.1
+
+# Perfilado bajo demanda (ver api_Mascotas/profiling.py)
+PROFILING_MODE = 'muestreo'  # 'muestreo' o 'determinista'
+PROFILING_INTERVAL = 0.001  # Segundos entre muestras en modo muestreo
+PROFILING_SAMPLE_RATE = 0.0  # Fracción de requests perfilados sin pedirlo
+PROFILING_TOKEN_MAX_AGE = 3600  # Vigencia en segundos del header X-Profile firmado
+PROFILING_DIR = BASE_DIR / 'perfiles'
+PROFILING_MAX_PROFILES = 200
+
+# Bridge MQTT: los workers de run_mqtt_workers comparten la suscripción $share/<grupo>/ubicacion.
+# En EMQX conviene broker.shared_subscription_strategy = hash_clientid, así cada collar
+# se entrega siempre al mismo worker; el advisory lock por mascota cubre los reinicios.
+MQTT_SHARED_GROUP = 'mascotas-bridge'
+MQTT_DEDUP_WINDOW = 10_000  # Identidades de fix recientes que el bridge recuerda para descartar reenvíos
+MQTT_RECONNECT_BASE_DELAY = 1  # Segundos; el retraso de reconexión crece x2 por intento con jitter completo
+MQTT_RECONNECT_MAX_DELAY = 120  # Tope del retraso de reconexión
+MQTT_DRAIN_TIMEOUT = 20  # Segundos que el bridge espera a vaciar el spool al recibir SIGTERM
+MQTT_PROBE_PORT = None  # Puerto base de /healthz y /readyz (worker N usa base + N); None las desactiva
+MQTT_READY_MAX_LAG = 60  # Segundos de retraso del spool a partir de los cuales /readyz responde 503
+
+# Spool local de escritura anticipada del bridge MQTT (ver location/spool.py)
+LOCATION_SPOOL_DIR = BASE_DIR / 'spool'
+LOCATION_SPOOL_MAX_FIXES = 200_000  # Tope de fixes pendientes (~40 MB); luego se descartan los más antiguos
+LOCATION_SPOOL_BATCH_SIZE = 500  # Fixes por INSERT al vaciar el spool
+LOCATION_SPOOL_MAX_BACKOFF = 30  # Segundos máximos entre reintentos con la BD caída
+LOCATION_BACKLOG_THRESHOLD = 2_000  # Pendientes a partir de los cuales se guarda primero la última posición de cada mascota
+LOCATION_SPOOL_HISTORY_BATCH_SIZE = 2_000  # Fixes por INSERT del historial atrasado cuando hay backlog
+
+# Filtro de movimiento en la ingesta (ver location/deadband.py)
+LOCATION_DEADBAND_METERS = 15  # Desplazamientos menores se consideran ruido del GPS; 0 desactiva el filtro
+LOCATION_HEARTBEAT_SECONDS = 300  # Con la mascota quieta se guarda igual un fix cada 5 minutos
+
+# Buffer en memoria de los fixes recientes de cada mascota en los procesos web (ver location/recent.py)
+LOCATION_RECENT_BUFFER_SIZE = 200  # Fixes por mascota (~30 min a 10 s); 0 lo desactiva
+LOCATION_RECENT_WARM_MINUTES = 60  # Ventana que se precarga al arrancar; consultas más largas van a la BD
+
+# Reproducción de la flota (ver location/snapshot.py)
+LOCATION_PLAYBACK_MAX_FRAMES = 1440  # Fotos por request (un día a un paso de 60 s)
+
+# Trayectos remuestreados para animar el mapa (ver location/resample.py)
+LOCATION_RESAMPLE_MAX_GAP_SECONDS = 120  # Más tiempo entre dos fixes (con movimiento) es un hueco sin interpolar
+LOCATION_RESAMPLE_MAX_SAMPLES = 86_400  # Muestras por request (un día a un paso de 1 s)
+LOCATION_RESAMPLE_CACHE_SECONDS = 86_400  # Vigencia de un trayecto cacheado de un rango cerrado
+
+# Mapa de calor por teselas (ver location/heatmap.py)
+LOCATION_HEATMAP_BINS = 64  # Celdas por lado de cada tesela
+LOCATION_HEATMAP_DAYS = 7  # Días (completos, con hoy) del rango por defecto
+LOCATION_HEATMAP_MAX_ZOOM = 18
+LOCATION_HEATMAP_CACHE_DIR = BASE_DIR / 'heatmap'
+LOCATION_HEATMAP_CACHE_DAYS = 7  # Las teselas sin actualizar en este tiempo se borran (tarea clean_heatmap_cache)
+
+# Detección de estancias (ver location/visits.py)
+LOCATION_VISIT_RADIUS_M = 50  # Tamaño de celda de la grilla; un grupo abarca su celda y las vecinas
+LOCATION_VISIT_MIN_SECONDS = 600  # Duración mínima de una estancia
+LOCATION_VISIT_MAX_GAP_SECONDS = 900  # Silencio que corta una estancia (con la mascota quieta llega un fix cada 5 min)
+LOCATION_VISIT_LOOKBACK_HOURS = 6  # Máximo que se relee si el detector estuvo detenido
+
+# Encuentros entre mascotas (ver location/proximity.py)
+LOCATION_PROXIMITY_METERS = 25  # Distancia a la que empieza un encuentro
+LOCATION_PROXIMITY_EXIT_METERS = 50  # Distancia a la que termina (histéresis); también es la celda de la grilla
+LOCATION_PROXIMITY_MAX_AGE_SECONDS = 600  # Una mascota sin reportar en este tiempo sale de la grilla
+LOCATION_PROXIMITY_MAX_RADIUS = 5_000  # Radio máximo de la consulta de mascotas cercanas
+
+# Intervalo de reporte adaptativo de los collares (ver location/reporting.py)
+MQTT_DOWNLINK_PREFIX = 'dispositivos'  # El bridge publica en <prefijo>/<device_id>/config
+LOCATION_STATIONARY_SPEED_MPS = 0.3  # Por debajo la mascota se considera quieta
+LOCATION_RUNNING_SPEED_MPS = 2.5  # Por encima la mascota se considera corriendo
+LOCATION_INTERVAL_STATIONARY = 60  # Segundos entre fixes con la mascota quieta
+LOCATION_INTERVAL_WALKING = 15
+LOCATION_INTERVAL_RUNNING = 5
+LOCATION_INTERVAL_ALERT = 5  # Con una alerta activa (ReportingController.set_alert)
+LOCATION_INTERVAL_MIN_CHANGE_SECONDS = 30  # Espera antes de espaciar otra vez el reporte; acelerar es inmediato
+
+# Telemetría de los collares desde el topic sistema (ver location/telemetry.py)
+DEVICE_STATUS_FLUSH_SECONDS = 10  # Cada cuánto se guardan por lotes los estados recibidos
+DEVICE_STATUS_BUFFER_SIZE = 10_000  # Estados retenidos en memoria con la BD caída
+DEVICE_STATUS_RETENTION_DAYS = 7
+DEVICE_RSSI_DEGRADED = -80  # dBm promedio por debajo del cual el enlace se considera malo
+DEVICE_MAX_RECONNECTS = 3  # Reconexiones al broker en la ventana consultada
+DEVICE_MAX_PUBLISH_FAILURES = 5  # Publicaciones de fixes fallidas en la ventana consultada
+DEVICE_LOW_BATTERY = 15  # Porcentaje
+DEVICE_SILENT_SECONDS = 300  # Sin heartbeat en este tiempo = collar sin enlace
+
+# Validación de los lotes de ingesta (ver location/validation.py)
+LOCATION_MAX_SPEED_MPS = 40  # Velocidad implícita máxima entre fixes (~144 km/h, mascota en auto)
+LOCATION_MAX_HDOP = 5  # Dilución horizontal de precisión máxima aceptada
+LOCATION_MIN_SATELLITES = 4  # Satélites mínimos para un fix 3D
@@ -20,8 +20,11 @@ from django.urls import path, include
 from mascotas import urls as mascotas_urls
 from dueño import urls as dueño_urls
 from location import urls as location_urls
+from api_Mascotas.profiling import profiles_index, profile_download
 
 urlpatterns = [
+    path("admin/perfiles/", profiles_index, name="profiles-index"),
+    path("admin/perfiles/<str:name>", profile_download, name="profile-download"),
     path("admin/", admin.site.urls),
     path('mascotas/', include(mascotas_urls)),
     path('dueño/', include(dueño_urls)),
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.3 on 2026-10-19 18:15
+
+import api_Mascotas.search
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Letras con tilde de los nombres en español y su versión sin tilde. Se reemplazan con
+# replace() encadenados en vez de translate(): así funciona igual con bases UTF8 y
+# SQL_ASCII (donde translate y lower operan por bytes). La función queda IMMUTABLE
+# sin la extensión unaccent, y puede usarse en índices
+TILDES = 'áàâäãéèêëíìîïóòôöõúùûüñç'
+SIN_TILDES = 'aaaaaeeeeiiiiooooouuuunc'
+
+
+def normalizar_sql():
+    expresion = 'lower(texto)'
+    for con, sin in zip(TILDES + TILDES.upper(), SIN_TILDES * 2):
+        expresion = f"replace({expresion}, '{con}', '{sin}')"
+    return (
+        'CREATE OR REPLACE FUNCTION normalizar_busqueda(texto text) RETURNS text '
+        f'LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$ SELECT {expresion} $$;'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dueño", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunSQL(normalizar_sql(), 'DROP FUNCTION IF EXISTS normalizar_busqueda(text);'),
+        migrations.AddIndex(
+            model_name="dueño",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.CombinedSearchVector(
+                    django.contrib.postgres.search.SearchVector(
+                        api_Mascotas.search.Normalizar("nombre"),
+                        api_Mascotas.search.Normalizar("apellido"),
+                        config="simple",
+                        weight="A",
+                    ),
+                    "||",
+                    django.contrib.postgres.search.SearchVector(
+                        api_Mascotas.search.Normalizar("email"),
+                        api_Mascotas.search.Normalizar("telefono"),
+                        config="simple",
+                        weight="B",
+                    ),
+                    django.contrib.postgres.search.SearchConfig("simple"),
+                ),
+                name="dueno_busqueda_idx",
+            ),
+        ),
+    ]
@@ -1,5 +1,10 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
 from datetime import datetime
+from api_Mascotas.search import search_vector
+
+# Documento de búsqueda de dueños (ver api_Mascotas/search.py)
+DUEÑO_BUSQUEDA = (['nombre', 'apellido'], ['email', 'telefono'])
 
 # Create your models here.
 class Dueño(models.Model):
@@ -12,5 +17,10 @@ class Dueño(models.Model):
     ciudad = models.CharField(max_length=100)
     fecha_creacion = models.DateTimeField(default=datetime.now)
 
+    class Meta:
+        indexes = [
+            GinIndex(search_vector(*DUEÑO_BUSQUEDA), name='dueno_busqueda_idx'),
+        ]
+
     def __str__(self):
         return f"{self.nombre} {self.apellido}"
@@ -1,3 +1,4 @@
+from django.urls import reverse
 from rest_framework import serializers
 from .models import Dueño
 from mascotas.models import Mascota
@@ -7,6 +8,18 @@ class MascotaSimpleSerializer(serializers.ModelSerializer):
         model = Mascota
         fields = ['id', 'nombre', 'especie', 'raza', 'imagen', 'fecha_nacimiento']
 
+class ImagenUrlField(serializers.Field):
+    """URL de la imagen de la mascota; requiere la anotación ``tiene_imagen`` (mascotas.models)"""
+
+    def __init__(self, **kwargs):
+        super().__init__(source='*', read_only=True, **kwargs)
+
+    def to_representation(self, obj):
+        if not obj.tiene_imagen:
+            return None
+        return self.context['request'].build_absolute_uri(reverse('mascotas_imagen', args=[obj.id]))
+
+
 class DueñoSimpleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Dueño
@@ -24,3 +37,47 @@ class DueñoSerializer(serializers.ModelSerializer):
         data = super().to_representation(instance)
         data['fecha_creacion'] = instance.fecha_creacion.strftime('%Y-%m-%d')
         return data
+
+
+class MascotaDashboardSerializer(serializers.ModelSerializer):
+    """Mascota del tablero del dueño: la imagen va como URL, no como base64"""
+    imagen_url = ImagenUrlField()
+    ultima_ubicacion = serializers.SerializerMethodField()
+    resumen_hoy = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Mascota
+        fields = ['id', 'nombre', 'especie', 'raza', 'fecha_nacimiento', 'imagen_url', 'ultima_ubicacion', 'resumen_hoy']
+
+    def get_ultima_ubicacion(self, obj):
+        ultima_location = obj.ultima_ubicacion
+        if ultima_location:
+            return {
+                'id': ultima_location.id,
+                'latitude': ultima_location.latitude,
+                'longitude': ultima_location.longitude,
+                'created_at': ultima_location.created_at
+            }
+        return None
+
+    def get_resumen_hoy(self, obj):
+        resumen = self.context['resumenes'].get(obj.id) or {
+            'fixes': 0, 'primer_fix': None, 'ultimo_fix': None, 'distancia_m': 0.0,
+        }
+        return {**resumen, 'visitas': obj.visitas_hoy}
+
+
+class DueñoDashboardSerializer(serializers.ModelSerializer):
+    mascotas = MascotaDashboardSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Dueño
+        fields = ['id', 'nombre', 'apellido', 'email', 'telefono', 'direccion', 'ciudad', 'mascotas']
+
+
+class DueñoBusquedaSerializer(serializers.ModelSerializer):
+    relevancia = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Dueño
+        fields = ['id', 'nombre', 'apellido', 'email', 'telefono', 'ciudad', 'relevancia']
@@ -1,3 +1,106 @@
+import base64
+from datetime import timedelta
 from django.test import TestCase
+from django.utils import timezone
+from api_Mascotas.query_budget import QueryBudgetTestMixin
+from location.models import Location, Visit
+from location.summary import start_of_day
+from mascotas.models import Mascota
+from .models import Dueño
 
 # Create your tests here.
+
+class DueñoQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(4):
+            dueño = Dueño.objects.create(
+                nombre=f'Dueño {i}', apellido='Pérez', email=f'd{i}@example.com',
+                telefono='3000000000', direccion='Calle 1', ciudad='Bogotá'
+            )
+            for j in range(2):
+                Mascota.objects.create(
+                    nombre=f'Mascota {i}-{j}', peso=8, edad=2, especie='Gato',
+                    raza='Criollo', dueño=dueño
+                )
+
+    def test_lista_dentro_del_presupuesto(self):
+        response = self.assertWithinQueryBudget('/dueño/dueños_list')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(len(response.data[0]['mascotas']), 2)
+
+
+class DueñoDashboardTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dueño = Dueño.objects.create(
+            nombre='Ana', apellido='Gómez', email='ana@example.com',
+            telefono='3000000000', direccion='Calle 1', ciudad='Bogotá'
+        )
+        cls.imagen = base64.b64encode(b'\x89PNG' + b'0' * 5000).decode()
+        cls.con_foto = Mascota.objects.create(
+            nombre='Luna', peso=8, edad=2, especie='Gato', raza='Criollo', dueño=cls.dueño, imagen=cls.imagen
+        )
+        cls.sin_foto = Mascota.objects.create(
+            nombre='Toby', peso=12, edad=4, especie='Perro', raza='Criollo', dueño=cls.dueño
+        )
+        cls.inicio = start_of_day()
+        # Tres fixes hoy separados ~111 m (0.001° de latitud) y uno de ayer que no cuenta
+        for minutos, latitude in ((-60, 4.5), (1, 4.600), (2, 4.601), (3, 4.602)):
+            location = Location.objects.create(mascota=cls.con_foto, latitude=latitude, longitude=-74.08)
+            Location.objects.filter(pk=location.pk).update(created_at=cls.inicio + timedelta(minutes=minutos))
+        Visit.objects.create(
+            mascota=cls.con_foto, latitude=4.6, longitude=-74.08, llegada=cls.inicio + timedelta(minutes=1),
+            salida=cls.inicio + timedelta(minutes=20), fixes=3, abierta=False
+        )
+
+    def test_tablero_en_consultas_fijas(self):
+        url = f'/dueño/{self.dueño.id}/dashboard'
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.imagen, response.content.decode())
+        luna, toby = response.data['mascotas']
+        self.assertEqual(luna['imagen_url'], f'http://testserver/mascotas/mascotas_imagen/{self.con_foto.id}')
+        self.assertIsNone(toby['imagen_url'])
+        self.assertEqual(luna['ultima_ubicacion']['latitude'], 4.602)
+        resumen = luna['resumen_hoy']
+        self.assertEqual((resumen['fixes'], resumen['visitas']), (3, 1))
+        self.assertAlmostEqual(resumen['distancia_m'], 222.4, delta=0.5)
+        self.assertEqual(resumen['primer_fix'], self.inicio + timedelta(minutes=1))
+        self.assertEqual(toby['resumen_hoy']['fixes'], 0)
+        self.assertIsNone(toby['ultima_ubicacion'])
+        self.assertWithinQueryBudget(url)
+
+    def test_dueño_inexistente(self):
+        self.assertEqual(self.client.get('/dueño/999999/dashboard').status_code, 404)
+
+
+class DueñoBusquedaTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for nombre, apellido, email, telefono in (
+            ('José', 'Núñez', 'jose@example.com', '3101234567'),
+            ('Ana', 'Gómez', 'ana.gomez@example.com', '3209876543'),
+            ('Ángela', 'Ruiz', 'angela@correo.co', '3001112233'),
+        ):
+            Dueño.objects.create(
+                nombre=nombre, apellido=apellido, email=email, telefono=telefono,
+                direccion='Calle 1', ciudad='Bogotá'
+            )
+
+    def buscar(self, q):
+        return [d['nombre'] for d in self.client.get('/dueño/dueños_buscar', {'q': q}).data['results']]
+
+    def test_por_nombre_apellido_email_y_telefono(self):
+        self.assertEqual(self.buscar('jose nunez'), ['José'])
+        self.assertEqual(self.buscar('ANGELA'), ['Ángela'])
+        self.assertEqual(self.buscar('ana.gomez@'), ['Ana'])
+        self.assertEqual(self.buscar('320'), ['Ana'])
+        self.assertEqual(self.buscar('zz'), [])
+
+    def test_dentro_del_presupuesto(self):
+        response = self.assertWithinQueryBudget('/dueño/dueños_buscar', data={'q': 'gomez'})
+        self.assertEqual(response.data['count'], 1)
+        self.assertGreater(response.data['results'][0]['relevancia'], 0)
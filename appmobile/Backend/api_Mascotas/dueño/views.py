@@ -2,19 +2,28 @@ from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Dueño
-from .serializer import DueñoSerializer
+from .models import DUEÑO_BUSQUEDA, Dueño
+from .serializer import DueñoBusquedaSerializer, DueñoDashboardSerializer, DueñoSerializer
+from django.db.models import Count, Prefetch, Q
 from django.shortcuts import get_object_or_404
+from rest_framework.decorators import api_view
+from api_Mascotas.query_budget import query_budget
+from mascotas.models import Mascota, prefetch_ultima_ubicacion, tiene_imagen
+from api_Mascotas.search import SearchPagination, search, search_vector
+from location.summary import day_summary, start_of_day
 
 # Create your views here.
 class DueñosList(APIView):
+    @query_budget(2)
     def get(self, request, pk=None):
+        # Las mascotas anidadas se cargan en una sola consulta adicional
+        dueños_qs = Dueño.objects.prefetch_related('mascotas')
         if pk:
-            dueño = get_object_or_404(Dueño, id=pk)
+            dueño = get_object_or_404(dueños_qs, id=pk)
             serializer = DueñoSerializer(dueño)
             return Response(serializer.data)
         else:
-            dueños = Dueño.objects.all()
+            dueños = dueños_qs.all()
             serializer = DueñoSerializer(dueños, many=True)
             return Response(serializer.data)
 
@@ -36,4 +45,30 @@ class DueñosList(APIView):
     def delete(self, request, *args, **kwargs):
         dueño = get_object_or_404(Dueño, id=kwargs['pk'])
         dueño.delete()
-        return Response("Dueño eliminado correctamente", status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response("Dueño eliminado correctamente", status=status.HTTP_204_NO_CONTENT)
+
+
+@query_budget(4)
+@api_view(['GET'])
+def dueño_dashboard(request, pk):
+    """Dueño con sus mascotas, la última posición y el resumen de hoy de cada una"""
+    inicio = start_of_day()
+    # La imagen (base64) no se lee: el tablero solo entrega su URL
+    mascotas = Mascota.objects.defer('imagen').annotate(
+        tiene_imagen=tiene_imagen(),
+        visitas_hoy=Count('visitas', filter=Q(visitas__salida__gte=inicio)),
+    ).prefetch_related(prefetch_ultima_ubicacion()).order_by('id')
+    dueño = get_object_or_404(Dueño.objects.prefetch_related(Prefetch('mascotas', queryset=mascotas)), id=pk)
+    resumenes = day_summary([mascota.id for mascota in dueño.mascotas.all()], inicio)
+    serializer = DueñoDashboardSerializer(dueño, context={'request': request, 'resumenes': resumenes})
+    return Response(serializer.data)
+
+
+@query_budget(2)
+@api_view(['GET'])
+def buscar_dueños(request):
+    """Dueños por nombre, apellido, email o teléfono (``q``), paginados y por relevancia"""
+    dueños = search(Dueño.objects.all(), search_vector(*DUEÑO_BUSQUEDA), request.query_params.get('q'))
+    paginator = SearchPagination()
+    pagina = paginator.paginate_queryset(dueños, request)
+    return paginator.get_paginated_response(DueñoBusquedaSerializer(pagina, many=True).data)
@@ -0,0 +1,29 @@
+"""
+Configuración de gunicorn para servir la API.
+
+    gunicorn -c gunicorn.conf.py                      # ASGI con workers de uvicorn (por defecto)
+    GUNICORN_MODE=wsgi gunicorn -c gunicorn.conf.py   # WSGI con hilos
+
+Bajo ASGI las vistas de location/async_views.py atienden muchos polls por
+worker sin ocupar un hilo cada uno; las vistas DRF síncronas siguen
+funcionando (Django las ejecuta en un hilo). Cada worker tiene su propio pool
+de conexiones: DB_POOL_MAX_SIZE x workers no debe superar max_connections.
+"""
+import multiprocessing
+import os
+
+modo = os.environ.get('GUNICORN_MODE', 'asgi')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+timeout = 30
+graceful_timeout = 20
+keepalive = 5
+
+if modo == 'asgi':
+    wsgi_app = 'api_Mascotas.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'api_Mascotas.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', 8))
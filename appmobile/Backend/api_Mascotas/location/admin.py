@@ -1,3 +1,27 @@
 from django.contrib import admin
+from .models import DeviceStatus, Encounter, LocationQuarantine, Visit
 
 # Register your models here.
+
+@admin.register(LocationQuarantine)
+class LocationQuarantineAdmin(admin.ModelAdmin):
+    list_display = ('mascota', 'motivo', 'latitude', 'longitude', 'device_time', 'detalle', 'created_at')
+    list_filter = ('motivo',)
+
+
+@admin.register(DeviceStatus)
+class DeviceStatusAdmin(admin.ModelAdmin):
+    list_display = ('device_id', 'mascota', 'tipo', 'rssi', 'bateria', 'satelites', 'version', 'fallos_publicacion', 'received_at')
+    list_filter = ('tipo', 'version')
+    search_fields = ('device_id',)
+
+
+@admin.register(Visit)
+class VisitAdmin(admin.ModelAdmin):
+    list_display = ('mascota', 'latitude', 'longitude', 'llegada', 'salida', 'fixes', 'abierta')
+    list_filter = ('abierta',)
+
+
+@admin.register(Encounter)
+class EncounterAdmin(admin.ModelAdmin):
+    list_display = ('mascota_a', 'mascota_b', 'inicio', 'fin', 'distancia_minima')
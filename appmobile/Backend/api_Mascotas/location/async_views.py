@@ -0,0 +1,147 @@
+"""
+Variantes async de los endpoints de ubicaciones para servir bajo ASGI.
+
+DRF 3.15 no admite handlers async, así que son vistas de Django que devuelven
+el mismo JSON (``render_locations`` + orjson) que sus equivalentes de
+``views.py``. Un poll esperando a la BD ya no ocupa un hilo del servidor: las
+lecturas usan el ORM async (``afirst``, ``async for``) y el event loop atiende
+a los demás clientes mientras tanto.
+
+La escritura del POST móvil sigue pasando por la ingesta común
+(``save_location``) con ``sync_to_async``: usa transacciones y advisory locks,
+que el ORM async no ofrece.
+"""
+import orjson
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from api_Mascotas.query_budget import query_budget
+from api_Mascotas.renderers import ORJSONRenderer
+from .deadband import deadband_filter
+from .fast import CREATED_AT, DEVICE_TIME, render_locations
+from .latency import record_delivery
+from .models import Location
+from .recent import recent_tracks
+from .serializer import LocationSerializer
+from .views import last_location_query, mobile_location_data, recent_locations_query, save_location
+
+
+def json_response(data, status=200):
+    return HttpResponse(ORJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+async def aexisting_location(validated_data):
+    """Versión async de views.existing_location"""
+    device_id = validated_data.get('device_id')
+    seq = validated_data.get('seq')
+    if device_id and seq is not None:
+        return await Location.objects.filter(device_id=device_id, seq=seq).afirst()
+    if validated_data.get('device_time'):
+        return await Location.objects.filter(
+            mascota=validated_data['mascota'],
+            device_time=validated_data['device_time']
+        ).afirst()
+    return None
+
+
+async def arecent_locations(minutos, mascota_id=None, last_id=0):
+    """Versión async de views.recent_locations"""
+    rows = recent_tracks.recent(minutos, mascota_id, last_id)
+    if rows is None:
+        rows = [row async for row in recent_locations_query(minutos, mascota_id, last_id)]
+    return rows
+
+
+@query_budget(1)
+@require_GET
+async def location_list(request, mascota_id=None):
+    """LocationView.get en async: recientes de todas las mascotas, historial o última de una"""
+    try:
+        mascota_id = mascota_id or request.GET.get('mascota_id')
+        minutos = int(request.GET.get('minutos', 30))
+
+        if mascota_id and request.GET.get('ultima', 'false').lower() == 'true':
+            encontrada, location = recent_tracks.last(mascota_id)
+            if not encontrada:
+                location = await last_location_query(mascota_id).afirst()
+            if location:
+                record_delivery([(location[CREATED_AT], location[DEVICE_TIME])])
+                return json_response(render_locations([location])[0])
+            return json_response({'mensaje': 'No se encontró ubicación para esta mascota'}, status=404)
+
+        locations = await arecent_locations(minutos, mascota_id)
+        return json_response(render_locations(locations))
+    except Exception as e:
+        print(f"Error en location_list async: {str(e)}")
+        return json_response({'error': str(e)}, status=500)
+
+
+@query_budget(1)
+@require_GET
+async def latest_locations(request):
+    """get_latest_locations en async: el poll incremental de los mapas"""
+    try:
+        last_id = int(request.GET.get('last_id', 0) or 0)
+        minutos = int(request.GET.get('minutos', 30))
+        locations = await arecent_locations(minutos, request.GET.get('mascota_id'), last_id)
+        if last_id > 0:
+            record_delivery((row[CREATED_AT], row[DEVICE_TIME]) for row in locations)
+        return json_response(render_locations(locations))
+    except Exception as e:
+        print(f"Error in latest_locations async: {str(e)}")
+        return json_response({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_POST
+async def location_mobile(request):
+    """LocationMobileView.post en async, con las mismas respuestas"""
+    received_at = timezone.now()
+    try:
+        if request.content_type == 'application/json':
+            payload = orjson.loads(request.body or b'{}')
+        else:
+            payload = request.POST
+        data = mobile_location_data(payload)
+        if not data['mascota']:
+            return json_response({'mensaje': 'Error: ID de mascota no proporcionado'}, status=400)
+
+        serializer = LocationSerializer(data=data)
+        # La validación consulta la mascota (PrimaryKeyRelatedField)
+        if not await sync_to_async(serializer.is_valid)():
+            return json_response(
+                {'mensaje': 'Error al procesar los datos de ubicación', 'errores': serializer.errors},
+                status=400
+            )
+        validated = serializer.validated_data
+        existente = await aexisting_location(validated)
+        if existente:
+            return json_response(
+                {'mensaje': 'Ubicación ya registrada', 'data': LocationSerializer(existente).data}
+            )
+        if not deadband_filter.should_store(
+            validated['mascota'].pk,
+            validated['latitude'],
+            validated['longitude'],
+            validated.get('device_time') or received_at
+        ):
+            return json_response({'mensaje': 'Mascota sin movimiento, ubicación no almacenada', 'almacenada': False})
+
+        location, created, motivo = await sync_to_async(save_location)(serializer, received_at)
+        if motivo:
+            return json_response(
+                {'mensaje': 'Ubicación rechazada por la validación', 'motivo': motivo, 'almacenada': False},
+                status=422
+            )
+        if not created:
+            return json_response(
+                {'mensaje': 'Ubicación ya registrada', 'data': LocationSerializer(location).data}
+            )
+        return json_response(
+            {'mensaje': 'Ubicación recibida y almacenada correctamente', 'data': LocationSerializer(location).data},
+            status=201
+        )
+    except Exception as e:
+        return json_response({'mensaje': 'Error al procesar la solicitud', 'error': str(e)}, status=400)
@@ -0,0 +1,72 @@
+"""
+Filtro de banda muerta para la ingesta: no guarda fixes de una mascota quieta.
+
+Un fix se guarda si la mascota se movió más que el ruido del GPS
+(``LOCATION_DEADBAND_METERS``) desde el último fix guardado, o si pasó el
+intervalo de latido (``LOCATION_HEARTBEAT_SECONDS``) y hay que dejar
+constancia de que sigue ahí. El estado por mascota vive en memoria del proceso.
+"""
+import math
+import threading
+from django.conf import settings
+from django.utils import timezone
+
+RADIO_TIERRA_M = 6_371_000
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distancia en metros entre dos coordenadas"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * RADIO_TIERRA_M * math.asin(math.sqrt(a))
+
+
+class DeadbandFilter:
+    """Decide qué fixes guardar según el movimiento desde el último guardado de cada mascota"""
+
+    def __init__(self, meters=None, heartbeat_seconds=None):
+        self.meters = meters if meters is not None else getattr(settings, 'LOCATION_DEADBAND_METERS', 15)
+        self.heartbeat_seconds = (
+            heartbeat_seconds if heartbeat_seconds is not None
+            else getattr(settings, 'LOCATION_HEARTBEAT_SECONDS', 300)
+        )
+        self.recibidos = 0
+        self.descartados = 0
+        self._lock = threading.Lock()
+        self._ultimo = {}  # mascota_id -> (latitude, longitude, momento)
+
+    def should_store(self, mascota_id, latitude, longitude, at=None):
+        """True si el fix debe guardarse; en ese caso pasa a ser la referencia de la mascota"""
+        at = at or timezone.now()
+        latitude = float(latitude)
+        longitude = float(longitude)
+        mascota_id = int(mascota_id)
+        with self._lock:
+            self.recibidos += 1
+            ultimo = self._ultimo.get(mascota_id)
+            if ultimo is not None and self.meters > 0:
+                lat, lon, momento = ultimo
+                quieta = haversine_m(lat, lon, latitude, longitude) < self.meters
+                # Un fix con hora anterior a la referencia no es un latido vencido
+                latido = (at - momento).total_seconds() >= self.heartbeat_seconds
+                if quieta and not latido:
+                    self.descartados += 1
+                    return False
+            self._ultimo[mascota_id] = (latitude, longitude, at)
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'recibidos': self.recibidos,
+                'descartados': self.descartados,
+                'proporcion_descartada': round(self.descartados / self.recibidos, 4) if self.recibidos else 0.0,
+                'mascotas': len(self._ultimo),
+            }
+
+
+# Instancia compartida por el proceso (bridge o servidor web)
+deadband_filter = DeadbandFilter()
@@ -0,0 +1,129 @@
+"""
+Exportación en streaming del historial de una mascota (GeoJSON, GPX o CSV).
+
+Las filas se leen con un cursor del lado del servidor (``iterator(chunk_size)``)
+y se emiten en bloques, así la memoria no depende del rango exportado.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import timezone as dt_timezone
+from xml.sax.saxutils import escape
+from .models import Location
+
+CHUNK_SIZE = 2000
+
+# Columnas exportadas, en orden de lectura
+EXPORT_FIELDS = ('id', 'latitude', 'longitude', 'created_at', 'device_time')
+
+FORMATOS = {
+    'geojson': ('application/geo+json', 'geojson'),
+    'gpx': ('application/gpx+xml', 'gpx'),
+    'csv': ('text/csv', 'csv'),
+}
+
+
+def export_rows(mascota_id, desde=None, hasta=None):
+    """Historial de la mascota en orden cronológico, leído por bloques"""
+    queryset = Location.objects.filter(mascota_id=mascota_id)
+    if desde:
+        queryset = queryset.filter(created_at__gte=desde)
+    if hasta:
+        queryset = queryset.filter(created_at__lte=hasta)
+    return queryset.order_by('created_at', 'id').values_list(*EXPORT_FIELDS).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _utc(value):
+    if value is None:
+        return None
+    return value.astimezone(dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _batched(rows, render):
+    """Agrupa las filas renderizadas en bloques de CHUNK_SIZE para no emitir cadenas diminutas"""
+    buffer = []
+    for row in rows:
+        buffer.append(render(row))
+        if len(buffer) >= CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def geojson_chunks(rows, mascota_id):
+    yield f'{{"type":"FeatureCollection","properties":{{"mascota":{int(mascota_id)}}},"features":['
+    first = True
+
+    def render(row):
+        nonlocal first
+        id, latitude, longitude, created_at, device_time = row
+        feature = json.dumps({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [longitude, latitude]},
+            'properties': {'id': id, 'time': _utc(created_at), 'device_time': _utc(device_time)},
+        }, separators=(',', ':'))
+        if first:
+            first = False
+            return feature
+        return ',' + feature
+
+    yield from _batched(rows, render)
+    yield ']}'
+
+
+def gpx_chunks(rows, mascota_id):
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<gpx version="1.1" creator="api_Mascotas" xmlns="http://www.topografix.com/GPX/1/1">\n'
+        f'<trk><name>{escape(f"Mascota {mascota_id}")}</name><trkseg>\n'
+    )
+
+    def render(row):
+        id, latitude, longitude, created_at, device_time = row
+        return f'<trkpt lat="{latitude:.7f}" lon="{longitude:.7f}"><time>{_utc(device_time or created_at)}</time></trkpt>\n'
+
+    yield from _batched(rows, render)
+    yield '</trkseg></trk>\n</gpx>\n'
+
+
+def csv_chunks(rows, mascota_id):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def render(row):
+        id, latitude, longitude, created_at, device_time = row
+        writer.writerow([id, mascota_id, latitude, longitude, _utc(created_at), _utc(device_time) or ''])
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writerow(['id', 'mascota', 'latitude', 'longitude', 'created_at', 'device_time'])
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    yield from _batched(rows, render)
+
+
+CHUNK_RENDERERS = {
+    'geojson': geojson_chunks,
+    'gpx': gpx_chunks,
+    'csv': csv_chunks,
+}
+
+
+def export_chunks(formato, mascota_id, desde=None, hasta=None):
+    """Bloques de texto del archivo exportado"""
+    return CHUNK_RENDERERS[formato](export_rows(mascota_id, desde, hasta), mascota_id)
+
+
+def gzip_chunks(chunks):
+    """Comprime al vuelo los bloques (formato gzip)"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
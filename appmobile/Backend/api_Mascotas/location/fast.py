@@ -0,0 +1,61 @@
+"""
+Ruta rápida de lectura para los endpoints de ubicaciones.
+
+Las filas se leen con ``values_list(*FAST_FIELDS)`` y se convierten a dict con
+una función generada una sola vez, evitando instanciar modelos y recorrer los
+campos de ``LocationSerializer``. La salida es idéntica a la del serializer.
+"""
+from django.utils import timezone
+
+# Columnas leídas de la base de datos, en este orden
+FAST_FIELDS = ('id', 'mascota_id', 'latitude', 'longitude', 'created_at', 'device_time', 'received_at')
+
+ID, MASCOTA, LATITUDE, LONGITUDE, CREATED_AT, DEVICE_TIME, RECEIVED_AT = range(len(FAST_FIELDS))
+
+# Campos de salida (mismo orden que LocationSerializer.Meta.fields) y su expresión sobre la fila
+_OUTPUT = (
+    ('id', f'row[{ID}]'),
+    ('mascota', f'row[{MASCOTA}]'),
+    ('latitude', f'_coord(row[{LATITUDE}])'),
+    ('longitude', f'_coord(row[{LONGITUDE}])'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'created_at'),
+    ('is_active', 'True'),
+    ('device_time', f'_datetime(row[{DEVICE_TIME}], tz)'),
+    ('received_at', f'_datetime(row[{RECEIVED_AT}], tz)'),
+)
+
+
+def _coord(value):
+    return f'{value:.10f}'
+
+
+def _datetime(value, tz):
+    """Igual que DateTimeField.to_representation de DRF con ISO-8601 y USE_TZ"""
+    if not value:
+        return None
+    value = value.astimezone(tz).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _compile_row_renderer():
+    body = ', '.join(f'{key!r}: {expression}' for key, expression in _OUTPUT)
+    source = (
+        'def render_row(row, tz):\n'
+        f'    created_at = _datetime(row[{CREATED_AT}], tz)\n'
+        f'    return {{{body}}}\n'
+    )
+    namespace = {'_coord': _coord, '_datetime': _datetime}
+    exec(compile(source, '<location.fast>', 'exec'), namespace)
+    return namespace['render_row']
+
+
+render_row = _compile_row_renderer()
+
+
+def render_locations(rows):
+    """Convierte filas de values_list(*FAST_FIELDS) en la lista que entrega el API"""
+    tz = timezone.get_current_timezone()
+    return [render_row(row, tz) for row in rows]
@@ -0,0 +1,88 @@
+"""
+Grilla de celdas de tamaño fijo en metros para agrupar y buscar posiciones.
+
+La fila sale de la latitud. El ancho en grados de longitud de cada fila se
+calcula con la latitud del centro de la fila, así todas las posiciones de una
+misma fila usan la misma columna sin importar su latitud exacta.
+"""
+import math
+from collections import defaultdict
+import numpy as np
+from .validation import haversine_m
+
+GRADO_M = 111_320  # Metros por grado de latitud
+
+
+def _ancho_fila(fila, tamano):
+    """Ancho en grados de longitud de las celdas de la fila"""
+    centro = (fila + 0.5) * tamano / GRADO_M
+    return tamano / (GRADO_M * max(math.cos(math.radians(centro)), 1e-6))
+
+
+def grid_cells(lat, lon, tamano):
+    """Fila y columna de la celda de ``tamano`` metros de cada punto (arreglos)"""
+    filas = np.floor(np.asarray(lat) * GRADO_M / tamano).astype(np.int64)
+    centro = (filas + 0.5) * tamano / GRADO_M
+    ancho = tamano / (GRADO_M * np.maximum(np.cos(np.radians(centro)), 1e-6))
+    return filas, np.floor(np.asarray(lon) / ancho).astype(np.int64)
+
+
+def grid_cell(lat, lon, tamano):
+    """grid_cells para un solo punto"""
+    fila = math.floor(lat * GRADO_M / tamano)
+    return fila, math.floor(lon / _ancho_fila(fila, tamano))
+
+
+class SpatialGrid:
+    """Índice de puntos por celda: mover un punto y buscar vecinos cuestan O(puntos en las celdas vecinas)"""
+
+    def __init__(self, tamano):
+        self.tamano = tamano
+        self._celdas = defaultdict(set)
+        self._puntos = {}  # clave -> (lat, lon, celda)
+
+    def __len__(self):
+        return len(self._puntos)
+
+    def __contains__(self, clave):
+        return clave in self._puntos
+
+    def get(self, clave):
+        punto = self._puntos.get(clave)
+        return punto and punto[:2]
+
+    def move(self, clave, lat, lon):
+        self.remove(clave)
+        celda = grid_cell(lat, lon, self.tamano)
+        self._celdas[celda].add(clave)
+        self._puntos[clave] = (lat, lon, celda)
+
+    def remove(self, clave):
+        punto = self._puntos.pop(clave, None)
+        if punto is not None:
+            claves = self._celdas[punto[2]]
+            claves.discard(clave)
+            if not claves:
+                del self._celdas[punto[2]]
+
+    def candidates(self, lat, lon, radio):
+        """Claves de las celdas que pueden estar a ``radio`` metros o menos del punto"""
+        anillos = max(1, math.ceil(radio / self.tamano))
+        fila = math.floor(lat * GRADO_M / self.tamano)
+        claves = []
+        for f in range(fila - anillos, fila + anillos + 1):
+            # La columna del punto se calcula con el ancho de cada fila vecina
+            columna = math.floor(lon / _ancho_fila(f, self.tamano))
+            for c in range(columna - anillos, columna + anillos + 1):
+                claves.extend(self._celdas.get((f, c), ()))
+        return claves
+
+    def within(self, lat, lon, radio, excluir=None):
+        """[(clave, distancia)] de los puntos a ``radio`` metros o menos, del más cercano al más lejano"""
+        claves = [clave for clave in self.candidates(lat, lon, radio) if clave != excluir]
+        if not claves:
+            return []
+        puntos = np.array([self._puntos[clave][:2] for clave in claves], dtype=float)
+        distancias = haversine_m(lat, lon, puntos[:, 0], puntos[:, 1])
+        orden = np.argsort(distancias, kind='stable')
+        return [(claves[i], float(distancias[i])) for i in orden.tolist() if distancias[i] <= radio]
@@ -0,0 +1,177 @@
+"""
+Mapa de calor por teselas (z/x/y, Web Mercator) del historial de ubicaciones.
+
+Cada tesela es una grilla de ``LOCATION_HEATMAP_BINS`` x ``LOCATION_HEATMAP_BINS``
+con la cantidad de fixes por celda (``np.histogram2d``), para una mascota, un
+dueño o toda la flota.
+
+Las teselas se guardan en disco (``LOCATION_HEATMAP_CACHE_DIR``) junto con el
+corte hasta el que cuentan fixes. Los conteos son sumables: al pedir la tesela
+otra vez solo se leen los fixes de esa caja creados después del corte. Una
+tesela de un rango ya cerrado no consulta la base.
+
+Un fix tardío (con ``created_at`` retroactivo) cambia la versión del historial
+(``resample.invalidate_tracks``) y las teselas de esa versión se recalculan
+completas.
+"""
+import math
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from .models import Location
+from .resample import FLOTA, track_version
+
+# Un fix se cuenta cuando su transacción ya confirmó (created_at se asigna al insertarlo)
+MARGEN_CONFIRMACION = timedelta(seconds=30)
+
+
+def heatmap_dir():
+    return Path(getattr(settings, 'LOCATION_HEATMAP_CACHE_DIR', settings.BASE_DIR / 'heatmap'))
+
+
+def tile_bounds(z, x, y):
+    """(lat_min, lat_max, lon_min, lon_max) de la tesela"""
+    n = 2 ** z
+
+    def lat(fila):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * fila / n))))
+
+    return lat(y + 1), lat(y), x / n * 360 - 180, (x + 1) / n * 360 - 180
+
+
+def histogram(lat, lon, z, x, y, bins):
+    """Conteos por celda de la tesela (fila 0 arriba, como las teselas del mapa)"""
+    n = 2 ** z
+    px = ((np.asarray(lon) + 180) / 360 * n - x) * bins
+    phi = np.radians(np.asarray(lat))
+    py = ((1 - np.arcsinh(np.tan(phi)) / math.pi) / 2 * n - y) * bins
+    # Los puntos del borde (filtrados en la BD por la caja de la tesela) no se pierden por redondeo
+    px = np.clip(px, 0, np.nextafter(bins, 0))
+    py = np.clip(py, 0, np.nextafter(bins, 0))
+    conteos, _, _ = np.histogram2d(py, px, bins=bins, range=[[0, bins], [0, bins]])
+    return conteos.astype(np.int64)
+
+
+class Scope:
+    """Conjunto de mascotas del mapa de calor: una mascota, las de un dueño o la flota"""
+
+    def __init__(self, mascota_id=None, dueño_id=None):
+        self.mascota_id = mascota_id
+        self.dueño_id = dueño_id
+
+    @property
+    def key(self):
+        if self.mascota_id:
+            return f'mascota-{self.mascota_id}'
+        if self.dueño_id:
+            return f'dueno-{self.dueño_id}'
+        return 'flota'
+
+    def version(self):
+        return track_version(self.mascota_id or FLOTA)
+
+    def locations(self):
+        if self.mascota_id:
+            return Location.objects.filter(mascota_id=self.mascota_id)
+        if self.dueño_id:
+            return Location.objects.filter(mascota__dueño_id=self.dueño_id)
+        return Location.objects.all()
+
+
+EPOCA = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _microsegundos(momento):
+    # El corte se guarda exacto: los fixes posteriores se piden con created_at > corte
+    return (momento - EPOCA) // timedelta(microseconds=1)
+
+
+def _tile_path(scope, z, x, y, desde, hasta):
+    rango = f'{_microsegundos(desde)}-{_microsegundos(hasta)}'
+    return heatmap_dir() / scope.key / rango / str(z) / str(x) / f'{y}.npz'
+
+
+def _load(path):
+    try:
+        with np.load(path) as data:
+            return data['conteos'], int(data['corte']), int(data['version'])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _save(path, conteos, corte, version):
+    """Escritura atómica: un request concurrente ve la tesela anterior o la nueva, nunca una a medias"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as archivo:
+            np.savez_compressed(archivo, conteos=conteos, corte=corte, version=version)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def heatmap_tile(scope, z, x, y, desde, hasta, now=None):
+    """Conteos de la tesela para los fixes del alcance entre ``desde`` y ``hasta``"""
+    bins = getattr(settings, 'LOCATION_HEATMAP_BINS', 64)
+    corte = min(hasta, (now or timezone.now()) - MARGEN_CONFIRMACION)
+    version = scope.version()
+    path = _tile_path(scope, z, x, y, desde, hasta)
+
+    guardada = _load(path)
+    if guardada is not None and guardada[2] == version and guardada[0].shape == (bins, bins):
+        conteos, corte_guardado, _ = guardada
+        # Solo los fixes creados después del último corte
+        inicio = max(desde, EPOCA + timedelta(microseconds=corte_guardado))
+        incluir_inicio = False
+    else:
+        conteos = np.zeros((bins, bins), dtype=np.int64)
+        inicio, incluir_inicio = desde, True
+
+    if corte > inicio:
+        lat_min, lat_max, lon_min, lon_max = tile_bounds(z, x, y)
+        rows = scope.locations().filter(
+            latitude__gte=lat_min, latitude__lt=lat_max,
+            longitude__gte=lon_min, longitude__lt=lon_max,
+            created_at__lte=corte,
+        )
+        rows = rows.filter(created_at__gte=inicio) if incluir_inicio else rows.filter(created_at__gt=inicio)
+        puntos = np.array(list(rows.values_list('latitude', 'longitude')), dtype=float).reshape(-1, 2)
+        if len(puntos):
+            conteos = conteos + histogram(puntos[:, 0], puntos[:, 1], z, x, y, bins)
+        _save(path, conteos, _microsegundos(corte), version)
+    return conteos
+
+
+def render_tile(conteos, z, x, y):
+    """Payload de la tesela: solo las celdas con fixes, como [fila, columna, conteo]"""
+    filas, columnas = np.nonzero(conteos)
+    return {
+        'z': z,
+        'x': x,
+        'y': y,
+        'celdas': conteos.shape[0],
+        'total': int(conteos.sum()),
+        'maximo': int(conteos.max()) if conteos.size else 0,
+        'conteos': np.stack((filas, columnas, conteos[filas, columnas]), axis=1).tolist(),
+    }
+
+
+def clean_heatmap_cache(dias=None):
+    """Borra las teselas sin actualizar en ``dias``; devuelve cuántas borró"""
+    dias = dias or getattr(settings, 'LOCATION_HEATMAP_CACHE_DAYS', 7)
+    limite = timezone.now().timestamp() - dias * 86_400
+    borradas = 0
+    for path in heatmap_dir().rglob('*.npz'):
+        try:
+            if path.stat().st_mtime < limite:
+                path.unlink()
+                borradas += 1
+        except FileNotFoundError:
+            continue
+    return borradas
@@ -0,0 +1,239 @@
+"""
+Guardado ordenado e idempotente de fixes cuando hay varios consumidores MQTT en paralelo.
+
+Con suscripciones compartidas el broker reparte los mensajes entre los
+procesos del bridge, así que dos fixes de la misma mascota pueden llegar a
+workers distintos. Cada guardado toma un advisory lock de Postgres por mascota,
+así los commits de una mascota quedan serializados. Un fix cuyo ``device_time``
+es anterior al último guardado (p. ej. lo traía el spool de otro worker tras una
+caída de la BD, o el historial que el spool guarda después de la última posición
+cuando hay backlog) no se descarta: se guarda como historial con ``created_at`` en
+su ``device_time`` (o su hora de recepción), de modo que la última posición de la mascota nunca retrocede.
+
+Los fixes repetidos (reentregas QoS 1, ráfagas de reconexión del collar) se
+filtran primero en memoria con ``RecentFixes``; si alguno llega a la base, se
+descarta al ver que su (device_id, seq) ya está guardado, y la restricción única
+garantiza que nunca haya dos filas iguales.
+
+Antes del INSERT el lote pasa por ``validation.validate_fixes``: los fixes
+imposibles quedan en ``LocationQuarantine`` y no en la tabla de ubicaciones.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from django.db import connection, transaction
+from django.db.models.functions import Coalesce
+from .models import Location
+from .recent import notify_locations
+from .resample import invalidate_tracks
+from .validation import quarantine, validate_fixes
+
+logger = logging.getLogger(__name__)
+
+# Espacio de nombres de los advisory locks de ingesta (pg_advisory_xact_lock(int4, int4))
+ADVISORY_LOCK_NAMESPACE = 0x4D41
+
+# Campos de un fix que se guardan en Location (hdop y satelites solo sirven para validar)
+LOCATION_FIELDS = ('mascota_id', 'latitude', 'longitude', 'device_time', 'received_at', 'device_id', 'seq')
+
+
+def fix_momento(fix):
+    """Momento de un fix para ordenarlo: la hora del collar o, si no la trae, la de recepción"""
+    return fix['device_time'] or fix['received_at']
+
+
+def fix_key(mascota_id, device_id=None, seq=None, device_time=None):
+    """Identidad de un fix: (device_id, seq) si el collar la envía, si no (mascota, device_time)"""
+    if device_id and seq is not None:
+        return ('seq', str(device_id), int(seq))
+    if device_time is not None:
+        return ('hora', int(mascota_id), device_time)
+    return None
+
+
+class RecentFixes:
+    """Ventana de las últimas identidades de fix vistas por el proceso"""
+
+    def __init__(self, max_size=10_000):
+        self.max_size = max_size
+        self.duplicados = 0
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()
+
+    def seen(self, key):
+        """True (y cuenta el duplicado) si el fix ya está registrado en la ventana"""
+        if key is None:
+            return False
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                self.duplicados += 1
+                return True
+            return False
+
+    def remember(self, key):
+        """Registra el fix; se llama solo cuando ya quedó guardado (spool o BD)"""
+        if key is None:
+            return
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+            if len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+
+
+def lock_mascota(mascota_id):
+    """Serializa, hasta el fin de la transacción, los guardados de una mascota"""
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [ADVISORY_LOCK_NAMESPACE, int(mascota_id)])
+
+
+def lock_mascotas(mascota_ids):
+    """Toma los locks de varias mascotas en orden fijo para no provocar deadlocks entre workers"""
+    for mascota_id in sorted(set(mascota_ids)):
+        lock_mascota(mascota_id)
+
+
+def save_location_in_order(mascota_id, latitude, longitude, device_time=None, received_at=None,
+                           device_id=None, seq=None, hdop=None, satelites=None):
+    """
+    Guarda un fix por el mismo camino que los lotes del bridge.
+
+    Devuelve (location, motivo): la Location guardada o None, y el motivo de
+    cuarentena si la validación lo rechazó (None si no se guardó por repetido).
+    """
+    saved, rechazados = ingest_locations([{
+        'mascota_id': mascota_id,
+        'latitude': latitude,
+        'longitude': longitude,
+        'device_time': device_time,
+        'received_at': received_at,
+        'device_id': device_id,
+        'seq': seq,
+        'hdop': hdop,
+        'satelites': satelites,
+    }])
+    if saved:
+        return saved[0], None
+    return None, (rechazados[0][1] if rechazados else None)
+
+
+def save_locations_in_order(fixes):
+    """Guarda los fixes (dicts) válidos y en orden; devuelve solo las Location insertadas"""
+    return ingest_locations(fixes)[0]
+
+
+def already_stored(fixes):
+    """Los fixes del lote cuyo (device_id, seq) ya está en la base"""
+    claves = {(fix['device_id'], fix['seq']) for fix in fixes if fix.get('device_id') and fix.get('seq') is not None}
+    if not claves:
+        return set()
+    existentes = set(
+        Location.objects
+        .filter(device_id__in={d for d, _ in claves}, seq__in={q for _, q in claves})
+        .values_list('device_id', 'seq')
+    )
+    return claves & existentes
+
+
+def ingest_locations(fixes):
+    """Valida y guarda un lote; devuelve (Location insertadas, [(fix, motivo, detalle)] en cuarentena)"""
+    if not fixes:
+        return [], []
+    with transaction.atomic():
+        mascota_ids = {fix['mascota_id'] for fix in fixes}
+        lock_mascotas(mascota_ids)
+        # Último fix de cada mascota con DISTINCT ON sobre el índice (mascota, -created_at)
+        previos = {}
+        ultimos = {}
+        for mascota_id, latitude, longitude, device_time, received_at, created_at in (
+            Location.objects
+            .filter(mascota_id__in=mascota_ids)
+            .order_by('mascota_id', '-created_at')
+            .distinct('mascota_id')
+            .values_list('mascota_id', 'latitude', 'longitude', 'device_time', 'received_at', 'created_at')
+        ):
+            # Mismo criterio que fix_momento, con created_at para las filas sin ninguna de las dos horas
+            momento = device_time or received_at or created_at
+            ultimos[mascota_id] = momento
+            previos[mascota_id] = (latitude, longitude, momento.timestamp())
+
+        en_orden = []
+        tardios = []
+        horas_vistas = set()
+        for fix in sorted(fixes, key=fix_momento):
+            mascota_id = fix['mascota_id']
+            device_time = fix['device_time']
+            if device_time is not None:
+                # La misma (mascota, device_time) dos veces en el lote es el mismo fix reenviado
+                if (mascota_id, device_time) in horas_vistas:
+                    continue
+                horas_vistas.add((mascota_id, device_time))
+            # Sin hora del collar cuenta la de recepción (p. ej. historial que sale del spool con backlog)
+            momento = fix_momento(fix)
+            ultimo = ultimos.get(mascota_id)
+            if ultimo is not None and momento <= ultimo:
+                tardios.append(fix)
+                continue
+            ultimos[mascota_id] = momento
+            en_orden.append(fix)
+
+        # Los fixes tardíos (otro worker ya guardó uno posterior) entran como historial;
+        # solo se descartan si esa misma hora ya está guardada
+        historial = set()
+        if tardios:
+            con_hora = [fix for fix in tardios if fix['device_time'] is not None]
+            guardadas = set(
+                Location.objects
+                .filter(
+                    mascota_id__in={fix['mascota_id'] for fix in con_hora},
+                    device_time__in={fix['device_time'] for fix in con_hora}
+                )
+                .values_list('mascota_id', 'device_time')
+            ) if con_hora else set()
+            tardios = [fix for fix in tardios if (fix['mascota_id'], fix['device_time']) not in guardadas]
+            historial = {id(fix) for fix in tardios}
+            en_orden = tardios + en_orden
+
+        # Reenvíos de un (device_id, seq) ya guardado o repetido en el lote: no se insertan
+        vistos = already_stored(en_orden)
+        unicos = []
+        for fix in en_orden:
+            clave = (fix.get('device_id'), fix.get('seq'))
+            if clave[0] and clave[1] is not None:
+                if clave in vistos:
+                    continue
+                vistos.add(clave)
+            unicos.append(fix)
+        en_orden = unicos
+
+        aceptados, rechazados = validate_fixes(en_orden, previos)
+        if rechazados:
+            quarantine(rechazados)
+            logger.warning(
+                f"🚫 {len(rechazados)} fixes en cuarentena: "
+                + ', '.join(f"mascota {fix['mascota_id']} ({motivo})" for fix, motivo, _ in rechazados[:5])
+            )
+        locations = [Location(**{campo: fix.get(campo) for campo in LOCATION_FIELDS}) for fix in aceptados]
+        # Sin ignore_conflicts Postgres devuelve los ids (RETURNING): la lista es lo insertado de verdad.
+        # Con el lock de la mascota tomado, un conflicto solo puede venir de un collar reasignado
+        # a otra mascota; el IntegrityError lo resuelve el reintento fila por fila del spool
+        creadas = Location.objects.bulk_create(locations)
+        atrasadas = [location for fix, location in zip(aceptados, creadas) if id(fix) in historial]
+        if atrasadas:
+            # created_at es el orden cronológico de todas las lecturas: el fix tardío se ubica en
+            # su momento y la última posición de la mascota sigue siendo la más reciente
+            Location.objects.filter(pk__in=[location.pk for location in atrasadas]).update(
+                created_at=Coalesce('device_time', 'received_at')
+            )
+            for location in atrasadas:
+                location.created_at = location.device_time or location.received_at
+            logger.info(f"⏪ {len(atrasadas)} fixes tardíos guardados como historial")
+            # Cambian trayectos ya cerrados que pueden estar en caché (location/resample.py)
+            mascotas_atrasadas = {location.mascota_id for location in atrasadas}
+            transaction.on_commit(lambda: invalidate_tracks(mascotas_atrasadas))
+        # Los procesos web agregan las filas nuevas a su buffer de recientes (location/recent.py)
+        notify_locations([location.pk for location in creadas])
+        return creadas, rechazados
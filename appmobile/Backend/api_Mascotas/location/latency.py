@@ -0,0 +1,86 @@
+import threading
+from collections import deque
+from datetime import timezone as dt_timezone
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# Etapas del recorrido de un fix desde el collar hasta el cliente
+ETAPA_DISPOSITIVO_BROKER = 'dispositivo_broker'  # device_time -> received_at
+ETAPA_BROKER_BD = 'broker_bd'                    # received_at -> commit en BD
+ETAPA_BD_ENTREGA = 'bd_entrega'                  # created_at -> entrega al cliente (poll)
+ETAPA_EXTREMO_A_EXTREMO = 'extremo_a_extremo'    # device_time -> entrega al cliente
+
+ETAPAS = (
+    ETAPA_DISPOSITIVO_BROKER,
+    ETAPA_BROKER_BD,
+    ETAPA_BD_ENTREGA,
+    ETAPA_EXTREMO_A_EXTREMO,
+)
+
+PERCENTILES = (50, 90, 99)
+
+
+def parse_device_time(value):
+    """Convierte la marca de tiempo enviada por el dispositivo (ISO-8601, UTC) en datetime aware"""
+    if not value:
+        return None
+    try:
+        device_time = parse_datetime(str(value))
+    except ValueError:
+        return None
+    if device_time is None:
+        return None
+    if timezone.is_naive(device_time):
+        # El GPS reporta la hora en UTC
+        device_time = device_time.replace(tzinfo=dt_timezone.utc)
+    return device_time
+
+
+def percentile(sorted_values, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(values):
+    """Resume una lista de latencias (segundos) en conteo y percentiles"""
+    ordered = sorted(values)
+    resumen = {'muestras': len(ordered)}
+    for p in PERCENTILES:
+        value = percentile(ordered, p)
+        resumen[f'p{p}'] = round(value, 3) if value is not None else None
+    return resumen
+
+
+class LatencyTracker:
+    """Mantiene las últimas muestras de latencia por etapa dentro del proceso"""
+
+    def __init__(self, max_samples=2048):
+        self._lock = threading.Lock()
+        self._samples = {etapa: deque(maxlen=max_samples) for etapa in ETAPAS}
+
+    def record(self, etapa, inicio, fin):
+        """Registra la latencia entre dos marcas de tiempo (se ignoran las incompletas)"""
+        if inicio is None or fin is None:
+            return
+        with self._lock:
+            self._samples[etapa].append((fin - inicio).total_seconds())
+
+    def summary(self):
+        with self._lock:
+            snapshot = {etapa: list(samples) for etapa, samples in self._samples.items()}
+        return {etapa: summarize(values) for etapa, values in snapshot.items()}
+
+
+# Instancia compartida por el proceso (bridge o servidor web)
+latency_tracker = LatencyTracker()
+
+
+def record_delivery(timestamps, delivered_at=None):
+    """Registra la latencia de entrega de ubicaciones servidas a un cliente (pares created_at, device_time)"""
+    delivered_at = delivered_at or timezone.now()
+    for created_at, device_time in timestamps:
+        latency_tracker.record(ETAPA_BD_ENTREGA, created_at, delivered_at)
+        latency_tracker.record(ETAPA_EXTREMO_A_EXTREMO, device_time, delivered_at)
@@ -0,0 +1,53 @@
+import timeit
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from api_Mascotas.renderers import ORJSONRenderer
+from location.fast import FAST_FIELDS, render_locations
+from location.models import Location
+from location.serializer import LocationSerializer
+
+class Command(BaseCommand):
+    help = 'Compara LocationSerializer + JSONRenderer contra la ruta rápida values_list + orjson'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=100, help='Filas por respuesta (como un poll)')
+        parser.add_argument('--repeticiones', type=int, default=200)
+
+    def handle(self, *args, **options):
+        filas = options['filas']
+        repeticiones = options['repeticiones']
+        queryset = Location.objects.order_by('-created_at')[:filas]
+
+        instancias = list(queryset)
+        tuplas = list(queryset.values_list(*FAST_FIELDS))
+        if not instancias:
+            raise CommandError('No hay ubicaciones para medir')
+
+        def serializer_path():
+            return JSONRenderer().render(LocationSerializer(instancias, many=True).data)
+
+        def fast_path():
+            return ORJSONRenderer().render(render_locations(tuplas))
+
+        if serializer_path() != fast_path():
+            raise CommandError('La ruta rápida no produce los mismos bytes que LocationSerializer')
+        self.stdout.write(self.style.SUCCESS(f'Salida idéntica byte a byte ({len(fast_path())} bytes)'))
+
+        # Solo conversión y render; las dos rutas leen las mismas filas
+        tiempo_serializer = timeit.timeit(serializer_path, number=repeticiones) / repeticiones
+        tiempo_rapido = timeit.timeit(fast_path, number=repeticiones) / repeticiones
+        self.stdout.write(f'LocationSerializer + JSONRenderer: {tiempo_serializer * 1000:.3f} ms por respuesta de {len(instancias)} filas')
+        self.stdout.write(f'values_list + orjson:             {tiempo_rapido * 1000:.3f} ms por respuesta de {len(tuplas)} filas')
+        self.stdout.write(self.style.SUCCESS(f'Aceleración: {tiempo_serializer / tiempo_rapido:.1f}x'))
+
+        # Incluyendo la lectura de la base de datos
+        tiempo_serializer_bd = timeit.timeit(
+            lambda: JSONRenderer().render(LocationSerializer(list(queryset.all()), many=True).data),
+            number=repeticiones
+        ) / repeticiones
+        tiempo_rapido_bd = timeit.timeit(
+            lambda: ORJSONRenderer().render(render_locations(queryset.values_list(*FAST_FIELDS))),
+            number=repeticiones
+        ) / repeticiones
+        self.stdout.write(f'Con consulta: {tiempo_serializer_bd * 1000:.3f} ms vs {tiempo_rapido_bd * 1000:.3f} ms '
+                          f'({tiempo_serializer_bd / tiempo_rapido_bd:.1f}x)')
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from location.latency import percentile
+
+# Ruta síncrona (DRF) y su variante async para cada endpoint medible
+RUTAS = {
+    'latest': ('/location/latest', '/location/async/latest'),
+    'location_list': ('/location/location_list', '/location/async/location_list'),
+    # Última posición de una mascota (--mascota): una lectura por índice, mide sobre todo al servidor
+    'ultima': ('/location/location_list?ultima=true', '/location/async/location_list?ultima=true'),
+}
+
+
+async def poll(host, port, path, hasta, latencias, errores):
+    """Un cliente con conexión keep-alive que hace GET seguidos hasta ``hasta``"""
+    reader, writer = await asyncio.open_connection(host, port)
+    request = f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n'.encode()
+    try:
+        while time.perf_counter() < hasta:
+            inicio = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            cabecera = await reader.readuntil(b'\r\n\r\n')
+            lineas = cabecera.decode('latin-1').split('\r\n')
+            largo = 0
+            for linea in lineas[1:]:
+                nombre, _, valor = linea.partition(':')
+                if nombre.lower() == 'content-length':
+                    largo = int(valor)
+            await reader.readexactly(largo)
+            latencias.append(time.perf_counter() - inicio)
+            if not lineas[0].split(' ')[1].startswith('2'):
+                errores.append(lineas[0])
+    except (OSError, asyncio.IncompleteReadError) as e:
+        errores.append(str(e))
+    finally:
+        writer.close()
+
+
+async def load(host, port, path, concurrencia, duracion):
+    latencias, errores = [], []
+    hasta = time.perf_counter() + duracion
+    await asyncio.gather(*(poll(host, port, path, hasta, latencias, errores) for _ in range(concurrencia)))
+    return latencias, errores
+
+
+def wait_for_port(port, timeout=30):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+class Command(BaseCommand):
+    help = 'Compara el throughput de los polls de ubicaciones servidos con WSGI (gthread) y ASGI (uvicorn)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ruta', choices=RUTAS, default='latest')
+        parser.add_argument('--concurrencia', type=int, default=200, help='Clientes haciendo polls a la vez')
+        parser.add_argument('--duracion', type=float, default=10, help='Segundos de carga por servidor')
+        parser.add_argument('--workers', type=int, default=2, help='Workers de gunicorn en cada modo')
+        parser.add_argument('--mascota', type=int, help='Limita los polls a una mascota (mascota_id)')
+        parser.add_argument('--puerto', type=int, default=8150)
+
+    def handle(self, *args, **options):
+        casos = list(zip(('wsgi', 'asgi'), RUTAS[options['ruta']]))
+        if options['mascota']:
+            casos = [
+                (modo, f"{ruta}{'&' if '?' in ruta else '?'}mascota_id={options['mascota']}")
+                for modo, ruta in casos
+            ]
+        self.stdout.write(
+            f"{options['concurrencia']} clientes durante {options['duracion']} s, "
+            f"{options['workers']} workers por servidor"
+        )
+        self.stdout.write('modo'.ljust(6) + 'ruta'.ljust(48) + ''.join(
+            c.rjust(12) for c in ('requests', 'req/s', 'p50 ms', 'p99 ms', 'errores')
+        ))
+        for modo, ruta in casos:
+            latencias, errores = self.run_server(modo, ruta, options)
+            ordenadas = sorted(latencias)
+            resumen = [
+                len(latencias),
+                f"{len(latencias) / options['duracion']:.0f}",
+                f"{(percentile(ordenadas, 50) or 0) * 1000:.1f}",
+                f"{(percentile(ordenadas, 99) or 0) * 1000:.1f}",
+                len(errores),
+            ]
+            self.stdout.write(modo.ljust(6) + ruta.ljust(48) + ''.join(str(v).rjust(12) for v in resumen))
+            if errores:
+                self.stdout.write(self.style.WARNING(f'  Primer error en {modo}: {errores[0]}'))
+
+    def run_server(self, modo, ruta, options):
+        port = options['puerto']
+        env = {
+            **os.environ,
+            'GUNICORN_MODE': modo,
+            'GUNICORN_BIND': f'127.0.0.1:{port}',
+            'GUNICORN_WORKERS': str(options['workers']),
+        }
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env=env,
+        )
+        try:
+            if not wait_for_port(port):
+                raise CommandError(f'gunicorn ({modo}) no abrió el puerto {port}')
+            return asyncio.run(load('127.0.0.1', port, ruta, options['concurrencia'], options['duracion']))
+        finally:
+            server.terminate()
+            server.wait(30)
@@ -0,0 +1,41 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from location.export import FORMATOS, export_chunks, gzip_chunks
+from location.params import parse_time_param
+
+class Command(BaseCommand):
+    help = 'Exporta el historial de ubicaciones de una mascota en GeoJSON, GPX o CSV sin cargarlo en memoria'
+
+    def add_arguments(self, parser):
+        parser.add_argument('mascota_id', type=int)
+        parser.add_argument('--formato', choices=list(FORMATOS), default='geojson')
+        parser.add_argument('--desde', help='Fecha u hora ISO-8601 de inicio')
+        parser.add_argument('--hasta', help='Fecha u hora ISO-8601 de fin')
+        parser.add_argument('--salida', help='Archivo de salida (por defecto la salida estándar)')
+        parser.add_argument('--gzip', action='store_true', help='Comprimir la salida con gzip')
+
+    def handle(self, *args, **options):
+        try:
+            desde = parse_time_param(options['desde'])
+            hasta = parse_time_param(options['hasta'], end_of_day=True)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunks = export_chunks(options['formato'], options['mascota_id'], desde, hasta)
+        if options['gzip']:
+            chunks = gzip_chunks(chunks)
+        else:
+            chunks = (chunk.encode('utf-8') for chunk in chunks)
+
+        output = open(options['salida'], 'wb') if options['salida'] else sys.stdout.buffer
+        total = 0
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                total += len(chunk)
+        finally:
+            if options['salida']:
+                output.close()
+
+        if options['salida']:
+            self.stdout.write(self.style.SUCCESS(f"Exportados {total} bytes a {options['salida']}"))
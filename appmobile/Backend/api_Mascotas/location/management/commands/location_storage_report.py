@@ -0,0 +1,39 @@
+import timeit
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework import serializers
+from location.serializer import CoordinateField
+
+class Command(BaseCommand):
+    help = 'Reporta el tamaño por fila de location_location y compara la serialización de coordenadas Decimal vs float8'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iteraciones', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        # Tamaño real de las filas en Postgres
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*), avg(pg_column_size(l.*)), avg(pg_column_size(l.latitude)), "
+                "pg_total_relation_size('location_location') FROM location_location l"
+            )
+            filas, fila_bytes, coordenada_bytes, total_bytes = cursor.fetchone()
+        self.stdout.write(f'Filas: {filas}')
+        self.stdout.write(f'Bytes promedio por fila: {fila_bytes or 0:.1f}')
+        self.stdout.write(f'Bytes promedio por coordenada: {coordenada_bytes or 0:.1f}')
+        self.stdout.write(f'Tamaño total de la tabla e índices: {total_bytes / 1024:.1f} KiB')
+
+        # Construir y serializar una coordenada como lo hace cada representación
+        n = options['iteraciones']
+        decimal_field = serializers.DecimalField(max_digits=13, decimal_places=10)
+        float_field = CoordinateField()
+        tiempo_decimal = timeit.timeit(
+            lambda: decimal_field.to_representation(Decimal('-12.0463741234')), number=n
+        )
+        tiempo_float = timeit.timeit(
+            lambda: float_field.to_representation(float('-12.0463741234')), number=n
+        )
+        self.stdout.write(f'Decimal(13,10): {tiempo_decimal / n * 1e6:.2f} µs por coordenada')
+        self.stdout.write(f'float8:         {tiempo_float / n * 1e6:.2f} µs por coordenada')
+        self.stdout.write(self.style.SUCCESS(f'Aceleración: {tiempo_decimal / tiempo_float:.1f}x'))
@@ -0,0 +1,72 @@
+import signal
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from location.mqtt_bridge import MQTT_SHARED_GROUP
+
+
+class Command(BaseCommand):
+    help = 'Supervisa N procesos del bridge MQTT que comparten la suscripción de ubicaciones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Número de procesos consumidores')
+        parser.add_argument('--group', default=MQTT_SHARED_GROUP, help='Grupo de suscripción compartida')
+        parser.add_argument('--restart-delay', type=float, default=5, help='Segundos antes de reiniciar un worker caído')
+
+    def spawn(self, worker, group):
+        command = [
+            sys.executable, sys.argv[0], 'start_mqtt_bridge',
+            '--worker', str(worker),
+            '--group', group,
+        ]
+        process = subprocess.Popen(command)
+        self.stdout.write(f'Worker {worker} iniciado (pid {process.pid})')
+        return process
+
+    def handle(self, *args, **options):
+        if not options['group']:
+            self.stderr.write(self.style.ERROR(
+                'Sin grupo de suscripción compartida cada worker recibiría todos los mensajes'
+            ))
+            return
+
+        detener = False
+
+        def on_signal(signum, frame):
+            nonlocal detener
+            detener = True
+
+        signal.signal(signal.SIGTERM, on_signal)
+        signal.signal(signal.SIGINT, on_signal)
+
+        workers = {i: self.spawn(i, options['group']) for i in range(options['workers'])}
+        caidos = {}
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['workers']} workers en el grupo $share/{options['group']}"
+        ))
+
+        while not detener:
+            time.sleep(1)
+            for worker, process in workers.items():
+                if worker in caidos or process.poll() is None:
+                    continue
+                self.stderr.write(f'Worker {worker} terminó con código {process.returncode}')
+                caidos[worker] = time.monotonic() + options['restart_delay']
+            for worker, reinicio in list(caidos.items()):
+                if not detener and time.monotonic() >= reinicio:
+                    workers[worker] = self.spawn(worker, options['group'])
+                    del caidos[worker]
+
+        self.stdout.write('Deteniendo workers...')
+        for process in workers.values():
+            if process.poll() is None:
+                process.terminate()
+        # Cada worker vacía su spool antes de salir (MQTT_DRAIN_TIMEOUT)
+        espera = getattr(settings, 'MQTT_DRAIN_TIMEOUT', 20) + 10
+        for process in workers.values():
+            try:
+                process.wait(timeout=espera)
+            except subprocess.TimeoutExpired:
+                process.kill()
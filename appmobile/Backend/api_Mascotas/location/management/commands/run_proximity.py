@@ -0,0 +1,26 @@
+import signal
+import threading
+from django.core.management.base import BaseCommand
+from location.proximity import EncounterRecorder, ProximityEngine
+from location.recent import RecentTracks, RecentTracksListener
+
+
+class Command(BaseCommand):
+    help = 'Detecta encuentros entre mascotas con los avisos de la ingesta y los guarda (un solo proceso)'
+
+    def handle(self, *args, **options):
+        detener = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: detener.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: detener.set())
+
+        engine = ProximityEngine()
+        # El buffer solo hace falta para el listener: una fila por mascota
+        listener = RecentTracksListener(RecentTracks(size=1), on_rows=EncounterRecorder(engine))
+        listener.start()
+        self.stdout.write(self.style.SUCCESS(
+            f'Detectando encuentros a {engine.entrada} m (terminan a {engine.salida} m)'
+        ))
+        while not detener.wait(60) and listener.is_alive():
+            self.stdout.write(f'Proximidad: {engine.stats()}')
+        listener.stop()
+        listener.join(10)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from location.spool import CONTADORES, LocationSpool, spool_dir
+
+
+class Command(BaseCommand):
+    help = 'Muestra los fixes pendientes y los contadores del spool de cada worker del bridge MQTT'
+
+    def handle(self, *args, **options):
+        paths = sorted(spool_dir().glob('ubicaciones*.sqlite3'))
+        if not paths:
+            self.stdout.write(f'No hay spools en {spool_dir()}')
+            return
+
+        columnas = ('pendientes',) + CONTADORES + ('bytes',)
+        self.stdout.write('spool'.ljust(28) + ''.join(c.rjust(13) for c in columnas))
+        for path in paths:
+            spool = LocationSpool(path)
+            try:
+                stats = spool.stats()
+            finally:
+                spool.close()
+            self.stdout.write(path.name.ljust(28) + ''.join(str(stats[c]).rjust(13) for c in columnas))
@@ -1,10 +1,33 @@
-from django.core.management.base import BaseCommand
-from location.mqtt_bridge import start_mqtt_bridge
+from django.core.management.base import BaseCommand, CommandError
+from location.mqtt_bridge import MQTT_SHARED_GROUP, start_mqtt_bridge
+from location.spool import SpoolLocked
 
 class Command(BaseCommand):
     help = 'Inicia el servicio de puente MQTT-API para recibir ubicaciones GPS'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--worker', type=int, default=None, help='Número de worker (lo asigna run_mqtt_workers)')
+        parser.add_argument(
+            '--group',
+            default=MQTT_SHARED_GROUP,
+            help='Grupo de suscripción compartida; vacío para suscribirse sin $share'
+        )
+        parser.add_argument(
+            '--probe-port',
+            type=int,
+            default=None,
+            help='Puerto de las sondas /healthz y /readyz (por defecto MQTT_PROBE_PORT + worker)'
+        )
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Iniciando servicio de puente MQTT-API...'))
         self.stdout.write('Presiona Ctrl+C para detener el servicio')
-        start_mqtt_bridge() 
\ No newline at end of file
+        try:
+            start_mqtt_bridge(
+                worker=options['worker'],
+                group=options['group'],
+                probe=options['probe_port'],
+                handle_signals=True
+            )
+        except SpoolLocked as e:
+            raise CommandError(str(e))
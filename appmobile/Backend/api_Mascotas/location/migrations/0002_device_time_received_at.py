@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-19 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("location", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="location",
+            name="device_time",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="location",
+            name="received_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
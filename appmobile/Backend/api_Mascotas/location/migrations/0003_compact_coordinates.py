@@ -0,0 +1,31 @@
+# Generated by Django 5.1.3 on 2026-10-19 17:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("location", "0002_device_time_received_at"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="location",
+            name="is_active",
+        ),
+        migrations.RemoveField(
+            model_name="location",
+            name="updated_at",
+        ),
+        migrations.AlterField(
+            model_name="location",
+            name="latitude",
+            field=models.FloatField(),
+        ),
+        migrations.AlterField(
+            model_name="location",
+            name="longitude",
+            field=models.FloatField(),
+        ),
+    ]
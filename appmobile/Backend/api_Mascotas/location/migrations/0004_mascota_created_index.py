@@ -0,0 +1,20 @@
+# Generated by Django 5.1.3 on 2026-10-19 17:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("location", "0003_compact_coordinates"),
+        ("mascotas", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="location",
+            index=models.Index(
+                fields=["mascota", "-created_at"], name="location_mascota_created_idx"
+            ),
+        ),
+    ]
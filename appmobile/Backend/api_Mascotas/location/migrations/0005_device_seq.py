@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-19 17:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("location", "0004_mascota_created_index"),
+        ("mascotas", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="location",
+            name="device_id",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="location",
+            name="seq",
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="location",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(
+                    ("device_id__isnull", False), ("seq__isnull", False)
+                ),
+                fields=("device_id", "seq"),
+                name="location_device_seq_uniq",
+            ),
+        ),
+    ]
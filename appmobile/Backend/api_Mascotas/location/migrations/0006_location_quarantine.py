@@ -0,0 +1,63 @@
+# Generated by Django 5.1.3 on 2026-10-19 17:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("location", "0005_device_seq"),
+        ("mascotas", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LocationQuarantine",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("latitude", models.FloatField()),
+                ("longitude", models.FloatField()),
+                ("device_time", models.DateTimeField(blank=True, null=True)),
+                ("received_at", models.DateTimeField(blank=True, null=True)),
+                ("device_id", models.CharField(blank=True, max_length=64, null=True)),
+                ("seq", models.PositiveBigIntegerField(blank=True, null=True)),
+                ("hdop", models.FloatField(blank=True, null=True)),
+                ("satelites", models.PositiveSmallIntegerField(blank=True, null=True)),
+                (
+                    "motivo",
+                    models.CharField(
+                        choices=[
+                            ("fuera_de_rango", "Coordenadas fuera de rango"),
+                            ("origen", "Coordenadas (0, 0)"),
+                            ("hdop", "HDOP demasiado alto"),
+                            ("satelites", "Pocos satélites"),
+                            ("velocidad", "Velocidad implícita imposible"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("detalle", models.CharField(blank=True, max_length=200)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "mascota",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ubicaciones_rechazadas",
+                        to="mascotas.mascota",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.1.3 on 2026-10-19 17:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("location", "0006_location_quarantine"),
+        ("mascotas", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeviceStatus",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("device_id", models.CharField(max_length=64)),
+                (
+                    "tipo",
+                    models.CharField(
+                        choices=[
+                            ("heartbeat", "Heartbeat periódico"),
+                            ("conexion", "Conexión o reconexión al broker"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("rssi", models.SmallIntegerField(blank=True, null=True)),
+                ("bateria", models.PositiveSmallIntegerField(blank=True, null=True)),
+                ("satelites", models.PositiveSmallIntegerField(blank=True, null=True)),
+                ("version", models.CharField(blank=True, max_length=16)),
+                (
+                    "fallos_publicacion",
+                    models.PositiveIntegerField(blank=True, null=True),
+                ),
+                ("uptime", models.PositiveIntegerField(blank=True, null=True)),
+                ("received_at", models.DateTimeField()),
+                (
+                    "mascota",
+                    models.ForeignKey(
+                        blank=True,
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="estados_collar",
+                        to="mascotas.mascota",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-received_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["device_id", "-received_at"],
+                        name="devicestatus_device_recv_idx",
+                    ),
+                    models.Index(
+                        fields=["received_at"], name="devicestatus_received_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
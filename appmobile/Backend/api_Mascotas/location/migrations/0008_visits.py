@@ -0,0 +1,83 @@
+# Generated by Django 5.1.3 on 2026-10-19 18:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("location", "0007_device_status"),
+        ("mascotas", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Visit",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("latitude", models.FloatField()),
+                ("longitude", models.FloatField()),
+                ("llegada", models.DateTimeField()),
+                ("salida", models.DateTimeField()),
+                ("fixes", models.PositiveIntegerField()),
+                ("abierta", models.BooleanField(default=True)),
+                (
+                    "mascota",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="visitas",
+                        to="mascotas.mascota",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-llegada"],
+            },
+        ),
+        migrations.CreateModel(
+            name="VisitState",
+            fields=[
+                (
+                    "mascota",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="estado_visitas",
+                        serialize=False,
+                        to="mascotas.mascota",
+                    ),
+                ),
+                ("procesado_hasta", models.DateTimeField()),
+                ("latitude", models.FloatField(blank=True, null=True)),
+                ("longitude", models.FloatField(blank=True, null=True)),
+                ("llegada", models.DateTimeField(blank=True, null=True)),
+                ("salida", models.DateTimeField(blank=True, null=True)),
+                ("fixes", models.PositiveIntegerField(default=0)),
+                (
+                    "visita",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="location.visit",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="visit",
+            index=models.Index(
+                fields=["mascota", "-llegada"], name="visit_mascota_llegada_idx"
+            ),
+        ),
+    ]
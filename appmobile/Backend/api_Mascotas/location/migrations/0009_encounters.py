@@ -0,0 +1,66 @@
+# Generated by Django 5.1.3 on 2026-10-19 18:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("location", "0008_visits"),
+        ("mascotas", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Encounter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("inicio", models.DateTimeField()),
+                ("fin", models.DateTimeField(blank=True, null=True)),
+                ("distancia_minima", models.FloatField()),
+                (
+                    "mascota_a",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="encuentros_a",
+                        to="mascotas.mascota",
+                    ),
+                ),
+                (
+                    "mascota_b",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="encuentros_b",
+                        to="mascotas.mascota",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-inicio"],
+                "indexes": [
+                    models.Index(
+                        fields=["mascota_a", "-inicio"], name="encounter_a_inicio_idx"
+                    ),
+                    models.Index(
+                        fields=["mascota_b", "-inicio"], name="encounter_b_inicio_idx"
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("fin__isnull", True)),
+                        fields=("mascota_a", "mascota_b"),
+                        name="encounter_abierto_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
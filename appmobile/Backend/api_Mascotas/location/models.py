@@ -2,14 +2,173 @@ from django.db import models
 
 class Location(models.Model):
     mascota = models.ForeignKey('mascotas.Mascota', related_name='locations', on_delete=models.CASCADE)
-    latitude = models.DecimalField(max_digits=13, decimal_places=10)
-    longitude = models.DecimalField(max_digits=13, decimal_places=10)
+    # float8 de ancho fijo: más compacto que numeric y sin costo de construir Decimal
+    latitude = models.FloatField()
+    longitude = models.FloatField()
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
-    is_active = models.BooleanField(default=True)
+    # Marca de tiempo del fix según el reloj del dispositivo (GPS, UTC)
+    device_time = models.DateTimeField(null=True, blank=True)
+    # Momento en que el bridge o la API recibió el fix
+    received_at = models.DateTimeField(null=True, blank=True)
+    # Identificador del collar y número de secuencia monótono del fix (deduplicación)
+    device_id = models.CharField(max_length=64, null=True, blank=True)
+    seq = models.PositiveBigIntegerField(null=True, blank=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Último fix de una mascota (orden de ingesta, ultima_ubicacion)
+            models.Index(fields=['mascota', '-created_at'], name='location_mascota_created_idx'),
+        ]
+        constraints = [
+            # Un mismo fix reenviado (QoS 1, reconexiones) no genera una segunda fila
+            models.UniqueConstraint(
+                fields=['device_id', 'seq'],
+                condition=models.Q(device_id__isnull=False, seq__isnull=False),
+                name='location_device_seq_uniq',
+            ),
+        ]
 
     def __str__(self):
         return f"Ubicación de {self.mascota.nombre}: ({self.latitude}, {self.longitude})"
+
+
+class LocationQuarantine(models.Model):
+    """Fixes rechazados por la validación de ingesta; no llegan a location_location"""
+    MOTIVO_FUERA_DE_RANGO = 'fuera_de_rango'
+    MOTIVO_ORIGEN = 'origen'
+    MOTIVO_HDOP = 'hdop'
+    MOTIVO_SATELITES = 'satelites'
+    MOTIVO_VELOCIDAD = 'velocidad'
+    MOTIVOS = [
+        (MOTIVO_FUERA_DE_RANGO, 'Coordenadas fuera de rango'),
+        (MOTIVO_ORIGEN, 'Coordenadas (0, 0)'),
+        (MOTIVO_HDOP, 'HDOP demasiado alto'),
+        (MOTIVO_SATELITES, 'Pocos satélites'),
+        (MOTIVO_VELOCIDAD, 'Velocidad implícita imposible'),
+    ]
+
+    mascota = models.ForeignKey('mascotas.Mascota', related_name='ubicaciones_rechazadas', on_delete=models.CASCADE)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    device_time = models.DateTimeField(null=True, blank=True)
+    received_at = models.DateTimeField(null=True, blank=True)
+    device_id = models.CharField(max_length=64, null=True, blank=True)
+    seq = models.PositiveBigIntegerField(null=True, blank=True)
+    hdop = models.FloatField(null=True, blank=True)
+    satelites = models.PositiveSmallIntegerField(null=True, blank=True)
+    motivo = models.CharField(max_length=20, choices=MOTIVOS)
+    detalle = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Fix rechazado de la mascota {self.mascota_id} ({self.motivo}): ({self.latitude}, {self.longitude})"
+
+
+class DeviceStatus(models.Model):
+    """Estado del enlace de un collar según sus mensajes en el topic ``sistema`` (serie temporal)"""
+    TIPO_HEARTBEAT = 'heartbeat'
+    TIPO_CONEXION = 'conexion'
+    TIPOS = [
+        (TIPO_HEARTBEAT, 'Heartbeat periódico'),
+        (TIPO_CONEXION, 'Conexión o reconexión al broker'),
+    ]
+
+    device_id = models.CharField(max_length=64)
+    # Sin restricción de clave foránea: un collar mal configurado no debe hacer fallar el lote
+    mascota = models.ForeignKey(
+        'mascotas.Mascota', related_name='estados_collar', null=True, blank=True,
+        on_delete=models.SET_NULL, db_constraint=False,
+    )
+    tipo = models.CharField(max_length=10, choices=TIPOS)
+    rssi = models.SmallIntegerField(null=True, blank=True)  # dBm
+    bateria = models.PositiveSmallIntegerField(null=True, blank=True)  # Porcentaje
+    satelites = models.PositiveSmallIntegerField(null=True, blank=True)
+    version = models.CharField(max_length=16, blank=True)
+    # Contador acumulado desde el arranque del collar
+    fallos_publicacion = models.PositiveIntegerField(null=True, blank=True)
+    uptime = models.PositiveIntegerField(null=True, blank=True)  # Segundos desde el arranque
+    received_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['device_id', '-received_at'], name='devicestatus_device_recv_idx'),
+            models.Index(fields=['received_at'], name='devicestatus_received_idx'),
+        ]
+
+    def __str__(self):
+        return f"Estado de {self.device_id} ({self.tipo}) a las {self.received_at}"
+
+
+class Visit(models.Model):
+    """Estancia de una mascota en un lugar (stay point), detectada por location/visits.py"""
+    mascota = models.ForeignKey('mascotas.Mascota', related_name='visitas', on_delete=models.CASCADE)
+    # Centroide de los fixes de la estancia
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    llegada = models.DateTimeField()
+    salida = models.DateTimeField()
+    fixes = models.PositiveIntegerField()
+    # La mascota sigue en el lugar: salida es su último fix hasta ahora
+    abierta = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['-llegada']
+        indexes = [
+            models.Index(fields=['mascota', '-llegada'], name='visit_mascota_llegada_idx'),
+        ]
+
+    def __str__(self):
+        return f"Visita de {self.mascota_id} en ({self.latitude:.5f}, {self.longitude:.5f}) desde {self.llegada}"
+
+
+class VisitState(models.Model):
+    """Estado del detector de estancias de una mascota: hasta dónde procesó y el grupo de fixes en curso"""
+    mascota = models.OneToOneField(
+        'mascotas.Mascota', primary_key=True, related_name='estado_visitas', on_delete=models.CASCADE
+    )
+    # Los fixes con created_at hasta aquí ya fueron procesados
+    procesado_hasta = models.DateTimeField()
+    # Grupo en curso (null si todavía no hay fixes)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    llegada = models.DateTimeField(null=True, blank=True)
+    salida = models.DateTimeField(null=True, blank=True)
+    fixes = models.PositiveIntegerField(default=0)
+    # La Visit abierta cuando el grupo ya duró lo suficiente para ser una estancia
+    visita = models.ForeignKey(Visit, null=True, blank=True, related_name='+', on_delete=models.SET_NULL)
+
+    def __str__(self):
+        return f"Detector de visitas de {self.mascota_id} hasta {self.procesado_hasta}"
+
+
+class Encounter(models.Model):
+    """Dos mascotas a menos de LOCATION_PROXIMITY_METERS, detectado por location/proximity.py"""
+    # Siempre mascota_a_id < mascota_b_id
+    mascota_a = models.ForeignKey('mascotas.Mascota', related_name='encuentros_a', on_delete=models.CASCADE)
+    mascota_b = models.ForeignKey('mascotas.Mascota', related_name='encuentros_b', on_delete=models.CASCADE)
+    inicio = models.DateTimeField()
+    # Null mientras siguen cerca
+    fin = models.DateTimeField(null=True, blank=True)
+    distancia_minima = models.FloatField()  # Metros
+
+    class Meta:
+        ordering = ['-inicio']
+        indexes = [
+            models.Index(fields=['mascota_a', '-inicio'], name='encounter_a_inicio_idx'),
+            models.Index(fields=['mascota_b', '-inicio'], name='encounter_b_inicio_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['mascota_a', 'mascota_b'],
+                condition=models.Q(fin__isnull=True),
+                name='encounter_abierto_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Encuentro de {self.mascota_a_id} y {self.mascota_b_id} desde {self.inicio}"
@@ -1,12 +1,20 @@
 import paho.mqtt.client as mqtt
 import ssl
-import time
 import json
-import sys
-import requests
+import os
+import signal
+import socket
+import threading
 import logging
 from django.conf import settings
-from .models import Location
+from django.utils import timezone
+from .deadband import deadband_filter
+from .ingest import RecentFixes, fix_key
+from .latency import latency_tracker, parse_device_time
+from .reporting import downlink_topic, reporting_controller
+from .spool import LocationSpool, SpoolWriter, parse_seq, spool_path
+from .supervisor import Backoff, BridgeHealth, ProbeServer
+from .telemetry import DeviceStatusWriter, parse_status
 
 # Configurar logger
 logging.basicConfig(
@@ -19,92 +27,172 @@ logger = logging.getLogger(__name__)
 MQTT_BROKER = "z22e8be0.ala.us-east-1.emqxsl.com"
 MQTT_PORT = 8883
 MQTT_TOPIC = "ubicacion"
+MQTT_SYSTEM_TOPIC = "sistema"  # Heartbeats y conexiones de los collares (ver location/telemetry.py)
 MQTT_CLIENT_ID = "django-backend-mqtt-bridge"
+# Grupo de suscripción compartida (MQTT v5): el broker reparte los mensajes entre
+# los procesos del grupo en lugar de entregarlos a todos. Vacío = suscripción normal.
+MQTT_SHARED_GROUP = getattr(settings, 'MQTT_SHARED_GROUP', 'mascotas-bridge')
 MQTT_USERNAME = "julian"
 MQTT_PASSWORD = "1234"
 
-# URL de la API para enviar datos de ubicación
-LOCATION_API_URL = "http://127.0.0.1:8000/location/location_list"
+# Cada cuántos mensajes se registra el resumen de latencias y del spool
+LATENCY_LOG_EVERY = 100
 
-def send_to_api(data):
-    """Envía los datos de ubicación a la API mediante HTTP POST"""
-    try:
-        # Verificar que los datos contienen los campos necesarios
-        if all(k in data for k in ['mascota', 'latitude', 'longitude']):
-            # Extraer solo los campos necesarios para evitar enviar datos extras
-            location_data = {
-                'mascota': data['mascota'],
-                'latitude': data['latitude'],
-                'longitude': data['longitude']
-            }
-            
-            # Realizar la petición POST a la API
-            logger.info(f"Enviando datos a {LOCATION_API_URL}: {json.dumps(location_data)}")
-            response = requests.post(
-                LOCATION_API_URL,
-                json=location_data,
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            # Verificar respuesta
-            if response.status_code in (200, 201):
-                logger.info(f"✅ Datos enviados correctamente a la API. Status: {response.status_code}")
-                return True
-            else:
-                logger.error(f"❌ Error al enviar datos a la API. Status: {response.status_code}, Respuesta: {response.text}")
-                return False
-        else:
-            logger.warning("❌ Datos incompletos para enviar a la API")
-            return False
-    except Exception as e:
-        logger.error(f"❌ Error al enviar datos a la API: {str(e)}")
+# Spool local de escritura anticipada (ver location/spool.py)
+_spool = None
+_spool_writer = None
+_status_writer = None
+
+# Identidades de los últimos fixes vistos: los reenvíos se descartan antes del spool
+recent_fixes = RecentFixes(getattr(settings, 'MQTT_DEDUP_WINDOW', 10_000))
+
+def unique_client_id(base, worker=None):
+    """Client id único por host, proceso y worker: dos instancias con el mismo id se expulsan del broker"""
+    client_id = f"{base}-{socket.gethostname()}-{os.getpid()}"
+    if worker is not None:
+        client_id += f"-w{worker}"
+    # El límite garantizado por MQTT es 23 caracteres, pero EMQX acepta ids largos
+    return client_id[:128]
+
+def subscription_topic(topic=MQTT_TOPIC, group=MQTT_SHARED_GROUP):
+    """Topic de suscripción, compartido entre los workers del grupo si hay grupo"""
+    if group:
+        return f"$share/{group}/{topic}"
+    return topic
+
+def get_spool_writer(worker=None):
+    """Spool del proceso y su hilo escritor, creados una sola vez aunque el bridge se reinicie"""
+    global _spool, _spool_writer
+    if _spool is None:
+        _spool = LocationSpool(spool_path(worker), exclusive=True)
+        _spool_writer = SpoolWriter(_spool)
+        _spool_writer.start()
+        if _spool.pending:
+            logger.info(f"♻️ {_spool.pending} fixes pendientes en el spool se reenviarán a la BD")
+    return _spool, _spool_writer
+
+def get_status_writer():
+    """Hilo que guarda la telemetría de los collares, creado una sola vez por proceso"""
+    global _status_writer
+    # Tras un stop() el hilo terminó: un nuevo arranque del bridge crea otro
+    if _status_writer is None or not _status_writer.is_alive():
+        _status_writer = DeviceStatusWriter()
+        _status_writer.start()
+    return _status_writer
+
+def save_device_status(data, received_at):
+    """Encola el estado de un collar publicado en el topic sistema; los comandos se ignoran"""
+    status = parse_status(data, received_at)
+    if status is None:
         return False
+    get_status_writer().add(status)
+    return True
 
-def save_to_database(data):
-    """Guarda los datos de ubicación directamente en la base de datos"""
+def save_to_database(data, received_at=None, worker=None):
+    """Guarda el fix en el spool local; el hilo escritor lo lleva a la base de datos por lotes"""
     try:
         mascota_id = data.get("mascota", None)
         latitude = data.get("latitude", None)
         longitude = data.get("longitude", None)
         
-        if all([mascota_id, latitude, longitude]):
-            location = Location(
-                mascota_id=mascota_id,
-                latitude=latitude,
-                longitude=longitude
-            )
-            location.save()
-            logger.info(f"✅ Ubicación guardada en BD local - Mascota ID: {mascota_id}, Coords: {latitude},{longitude}")
+        # (0, 0) también pasa: la validación del lote lo deja en cuarentena
+        if mascota_id and latitude is not None and longitude is not None:
+            received_at = received_at or timezone.now()
+            device_time = parse_device_time(data.get("device_time"))
+            key = fix_key(mascota_id, data.get("device_id"), parse_seq(data.get("seq")), device_time)
+            if recent_fixes.seen(key):
+                logger.info(f"🔁 Fix repetido descartado - Mascota ID: {mascota_id}, clave: {key}")
+                return True
+            if not deadband_filter.should_store(mascota_id, latitude, longitude, device_time or received_at):
+                logger.info(f"💤 Mascota sin movimiento, fix no almacenado - Mascota ID: {mascota_id}")
+                return True
+            # Primero al disco: si Postgres no responde el fix espera en el spool
+            spool, writer = get_spool_writer(worker)
+            spool.append(data, received_at)
+            # Recién con el fix en disco cuenta como visto: si append falla, la reentrega se acepta
+            recent_fixes.remember(key)
+            writer.notify()
             return True
         else:
             logger.warning(f"❌ Datos incompletos para guardar en BD: {data}")
             return False
     except Exception as e:
-        logger.error(f"❌ Error al guardar en base de datos: {str(e)}")
+        logger.error(f"❌ Error al guardar en el spool: {str(e)}")
         return False
 
-def start_mqtt_bridge():
-    """Inicia el puente MQTT-API que escucha mensajes y los envía directamente a la API"""
+def adjust_report_interval(client, data, received_at):
+    """Recalcula el intervalo de reporte del collar y se lo envía si cambió"""
+    device_id = data.get("device_id")
+    latitude = data.get("latitude")
+    longitude = data.get("longitude")
+    if not device_id or latitude is None or longitude is None:
+        return None
+    # El collar informa en milisegundos el intervalo que está usando
+    reportado = parse_seq(data.get("intervalo"))
+    reportado = reportado // 1000 if reportado else None
+    at = parse_device_time(data.get("device_time")) or received_at
+    intervalo = reporting_controller.observe(device_id, latitude, longitude, at, reportado)
+    if intervalo is not None:
+        # Retenido: si el collar está desconectado lo recibe al volver a suscribirse
+        comando = json.dumps({"comando": "intervalo", "intervalo_ms": intervalo * 1000})
+        client.publish(downlink_topic(device_id), comando, qos=1, retain=True)
+        logger.info(f"⏱️ Intervalo de reporte de {device_id} -> {intervalo} s")
+    return intervalo
+
+def probe_port(worker=None):
+    """Puerto de las sondas HTTP del proceso: MQTT_PROBE_PORT + número de worker (None = sin sondas)"""
+    base = getattr(settings, 'MQTT_PROBE_PORT', None)
+    if not base:
+        return None
+    return base + (worker or 0)
+
+def start_mqtt_bridge(worker=None, group=MQTT_SHARED_GROUP, probe=None, handle_signals=False):
+    """
+    Inicia el puente MQTT que escucha mensajes y los guarda en la base de datos.
+
+    Con ``handle_signals`` (solo el comando start_mqtt_bridge, dueño del proceso)
+    SIGTERM/SIGINT detienen el bridge vaciando antes el spool.
+    """
+    mensajes_procesados = 0
+    client_id = unique_client_id(MQTT_CLIENT_ID, worker)
+    topic = subscription_topic(MQTT_TOPIC, group)
+    system_topic = subscription_topic(MQTT_SYSTEM_TOPIC, group)
+    backoff = Backoff()
+    health = BridgeHealth(reporting_controller)
+    max_delay = getattr(settings, 'MQTT_RECONNECT_MAX_DELAY', 120)
+
+    def schedule_reconnect(client, motivo):
+        # paho reintenta solo dentro de loop_forever; aquí se fija el próximo retraso con jitter
+        delay = backoff.next()
+        client.reconnect_delay_set(min_delay=delay, max_delay=max(delay, max_delay))
+        logger.warning(f"🔌 {motivo}. Reintento {backoff.attempt} en {delay:.1f} s")
     
-    def on_connect(client, userdata, flags, rc):
+    def on_connect(client, userdata, flags, rc, properties=None):
         if rc == 0:
-            logger.info("✅ Conectado exitosamente al broker MQTT")
-            # Suscribirse al topic
-            client.subscribe(MQTT_TOPIC)
-            logger.info(f"✅ Suscrito al topic: {MQTT_TOPIC}")
+            logger.info(f"✅ Conectado exitosamente al broker MQTT como {client_id}")
+            backoff.reset()
+            health.set_connected(True)
+            # Suscribirse al topic (también tras cada reconexión)
+            client.subscribe([(topic, 1), (system_topic, 0)])
+            logger.info(f"✅ Suscrito a los topics: {topic}, {system_topic}")
         else:
+            # En MQTT v5 rc es un ReasonCodes con nombre legible
             logger.error(f"❌ Error al conectar, código: {rc}")
-            rc_codes = {
-                0: "Conexión exitosa",
-                1: "Versión de protocolo incorrecta",
-                2: "Identificador de cliente rechazado",
-                3: "Servidor no disponible",
-                4: "Credenciales incorrectas",
-                5: "No autorizado"
-            }
-            logger.error(f"Razón: {rc_codes.get(rc, 'Desconocido')}")
+
+    def on_disconnect(client, userdata, rc, properties=None):
+        health.set_connected(False)
+        if not health.stopping:
+            schedule_reconnect(client, f"Desconectado del broker (código {rc})")
+
+    def on_connect_fail(client, userdata):
+        health.set_connected(False)
+        schedule_reconnect(client, f"No se pudo conectar a {MQTT_BROKER}:{MQTT_PORT}")
 
     def on_message(client, userdata, msg):
+        nonlocal mensajes_procesados
+        # Marca de recepción desde el broker (inicio de la etapa de ingesta)
+        received_at = timezone.now()
+        health.message_received()
         try:
             # Decodificar el mensaje JSON
             payload = msg.payload.decode('utf-8')
@@ -113,76 +201,94 @@ def start_mqtt_bridge():
             # Parsear el JSON
             data = json.loads(payload)
             
-            # 1. Guardar en la base de datos local
-            db_saved = save_to_database(data)
+            if msg.topic == MQTT_SYSTEM_TOPIC:
+                save_device_status(data, received_at)
+                return
             
-            # 2. Enviar a la API por HTTP
-            api_sent = send_to_api(data)
+            # Guardar en la base de datos local (a través del spool). Ya no se reenvía por HTTP
+            # a la API: escribía el mismo fix una segunda vez en la misma base
+            if save_to_database(data, received_at, worker):
+                logger.info(f"✅ Datos procesados - Mascota ID: {data.get('mascota')}")
+            # Con todos los fixes, también los que el filtro de movimiento no guarda
+            adjust_report_interval(client, data, received_at)
             
-            if db_saved and api_sent:
-                logger.info(f"✅ Datos procesados completamente - Mascota ID: {data.get('mascota')}")
-            else:
-                logger.warning(f"⚠️ Datos procesados parcialmente - DB: {db_saved}, API: {api_sent}")
+            mensajes_procesados += 1
+            if mensajes_procesados % LATENCY_LOG_EVERY == 0:
+                logger.info(f"📊 Latencias por etapa (s): {json.dumps(latency_tracker.summary())}")
+                if _spool is not None:
+                    logger.info(f"📦 Spool: {json.dumps(_spool.stats())}, duplicados: {recent_fixes.duplicados}")
+                logger.info(f"💤 Filtro de movimiento: {json.dumps(deadband_filter.stats())}")
+                logger.info(f"⏱️ Intervalos de reporte: {json.dumps(reporting_controller.stats())}")
             
         except json.JSONDecodeError:
             logger.error(f"❌ Error al decodificar JSON: {payload}")
         except Exception as e:
             logger.error(f"❌ Error procesando mensaje: {str(e)}")
 
+    logger.info("=== INICIANDO BRIDGE MQTT-API ===")
+    logger.info(f"Broker: {MQTT_BROKER}:{MQTT_PORT}")
+    logger.info(f"Topic: {topic} (client id {client_id})")
+    
+    # Crear cliente MQTT v5 (necesario para $share) con ID único por proceso
+    client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv5)
+    
+    # Configurar SSL/TLS
+    context = ssl.create_default_context()
+    context.check_hostname = False  # Desactivar verificación de hostname
+    context.verify_mode = ssl.CERT_NONE  # Desactivar verificación de certificado
+    client.tls_set_context(context)
+    
+    # Asignar callbacks
+    client.on_connect = on_connect
+    client.on_disconnect = on_disconnect
+    client.on_connect_fail = on_connect_fail
+    client.on_message = on_message
+    
+    # Configurar credenciales
+    client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+
+    # El spool arranca antes de conectar: reenvía lo pendiente aunque el broker no responda
+    spool, writer = get_spool_writer(worker)
+    status_writer = get_status_writer()
+    port = probe if probe is not None else probe_port(worker)
+    probe_server = None
+    if port:
+        probe_server = ProbeServer(port, health, lambda: (_spool, _spool_writer))
+        probe_server.start()
+
+    def stop(signum=None, frame=None):
+        if health.stopping:
+            return
+        health.stopping = True
+        logger.info("🛑 Deteniendo bridge MQTT: se dejan de recibir mensajes y se vacía el spool")
+        # disconnect() desde otro hilo: el handler de la señal corre dentro del loop de paho
+        threading.Thread(target=client.disconnect, daemon=True).start()
+
+    if handle_signals:
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+    # Conexión asíncrona: los fallos (también el primero) los reintenta loop_forever
+    logger.info(f"Intentando conectar a {MQTT_BROKER}:{MQTT_PORT}...")
+    client.connect_async(MQTT_BROKER, MQTT_PORT, 60)
+    logger.info("🔄 Iniciando loop MQTT...")
     try:
-        logger.info("=== INICIANDO BRIDGE MQTT-API ===")
-        logger.info(f"Broker: {MQTT_BROKER}:{MQTT_PORT}")
-        logger.info(f"Topic: {MQTT_TOPIC}")
-        logger.info(f"API URL: {LOCATION_API_URL}")
-        
-        # Crear cliente MQTT con ID único
-        client = mqtt.Client(client_id=MQTT_CLIENT_ID)
-        
-        # Configurar SSL/TLS
-        context = ssl.create_default_context()
-        context.check_hostname = False  # Desactivar verificación de hostname
-        context.verify_mode = ssl.CERT_NONE  # Desactivar verificación de certificado
-        client.tls_set_context(context)
-        
-        # Asignar callbacks
-        client.on_connect = on_connect
-        client.on_message = on_message
-        
-        # Configurar credenciales
-        client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
-        
-        # Conectar al broker
-        logger.info(f"Intentando conectar a {MQTT_BROKER}:{MQTT_PORT}...")
-        try:
-            client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        except Exception as e:
-            logger.error(f"❌ Error detallado de conexión MQTT: {type(e).__name__}: {str(e)}")
-            logger.error("Verificando conectividad...")
-            import socket
-            try:
-                socket_info = socket.getaddrinfo(MQTT_BROKER, MQTT_PORT)
-                logger.info(f"Info de resolución DNS: {socket_info}")
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.settimeout(10)
-                s.connect((MQTT_BROKER, MQTT_PORT))
-                s.close()
-                logger.info(f"✅ Conexión socket exitosa a {MQTT_BROKER}:{MQTT_PORT}")
-            except Exception as socket_error:
-                logger.error(f"❌ Error de socket: {type(socket_error).__name__}: {str(socket_error)}")
-            raise
-        
-        # Iniciar el loop en primer plano (blocking)
-        logger.info("🔄 Iniciando loop MQTT...")
-        client.loop_forever()
-        
+        client.loop_forever(retry_first_connection=True)
     except KeyboardInterrupt:
-        logger.info("\nServicio detenido por el usuario.")
-        client.disconnect()
-    except Exception as e:
-        logger.error(f"❌ Error crítico en bridge MQTT: {str(e)}")
-        # Esperar antes de reintentar
-        time.sleep(10)
-        return start_mqtt_bridge()
+        stop()
+    finally:
+        health.stopping = True
+        drain_timeout = getattr(settings, 'MQTT_DRAIN_TIMEOUT', 20)
+        if writer.drain(drain_timeout):
+            logger.info("✅ Spool vacío, todos los fixes recibidos están en la BD")
+        else:
+            # Lo pendiente queda en disco y se reenvía en el próximo arranque
+            logger.warning(f"⚠️ {spool.pending} fixes siguen en el spool tras {drain_timeout} s de espera")
+        writer.stop()
+        status_writer.stop()
+        if probe_server is not None:
+            probe_server.stop()
+        logger.info("Servicio detenido.")
 
 # Para ejecutar directamente: python manage.py shell -c "from location.mqtt_bridge import start_mqtt_bridge; start_mqtt_bridge()"
 if __name__ == "__main__":
@@ -0,0 +1,22 @@
+from datetime import datetime, time
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+def parse_time_param(value, end_of_day=False):
+    """Convierte un parámetro de fecha (ISO-8601 con o sin hora) en datetime aware
+
+    Con solo fecha se toma el inicio del día, o el final si ``end_of_day`` es True.
+    Lanza ValueError si el valor no es una fecha válida.
+    """
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Fecha inválida: {value}')
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
@@ -0,0 +1,227 @@
+"""
+Detección de mascotas cercanas entre sí (p. ej. dos perros en el mismo parque).
+
+``ProximityEngine`` guarda la última posición de cada mascota en una
+``SpatialGrid`` con celdas de ``LOCATION_PROXIMITY_EXIT_METERS``. En cada tick
+de ingesta solo se evalúan las mascotas que se movieron, contra las de sus
+celdas vecinas: el costo depende de la densidad local y no del cuadrado de la
+flota.
+
+Los encuentros tienen histéresis: empiezan a ``LOCATION_PROXIMITY_METERS`` o
+menos y terminan recién pasando ``LOCATION_PROXIMITY_EXIT_METERS``, o cuando
+una de las dos deja de reportar por más de ``LOCATION_PROXIMITY_MAX_AGE_SECONDS``.
+Así el ruido del GPS alrededor del umbral no genera ráfagas de eventos.
+
+Los procesos web alimentan su motor con los mismos avisos del buffer de
+recientes (location/recent.py) y responden "mascotas cerca de P" desde la
+memoria. ``manage.py run_proximity`` corre un único motor que guarda los
+encuentros en ``Encounter``.
+"""
+import logging
+import threading
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .fast import CREATED_AT, ID, LATITUDE, LONGITUDE, MASCOTA
+from .grid import SpatialGrid
+from .models import Encounter
+from .validation import haversine_m
+
+logger = logging.getLogger(__name__)
+
+ENCUENTRO = 'encuentro'
+SEPARACION = 'separacion'
+
+# ``distancia``: la actual en un encuentro, la mínima alcanzada en una separación
+ProximityEvent = namedtuple('ProximityEvent', 'tipo mascota_a mascota_b momento distancia')
+
+# Las mascotas sin reportar se retiran de la grilla como mucho cada tanto (tiempo de los fixes)
+INTERVALO_BARRIDO = timedelta(seconds=10)
+
+
+def _pareja(a, b):
+    return (a, b) if a < b else (b, a)
+
+
+class ProximityEngine:
+    """Últimas posiciones de la flota en una grilla, con los encuentros abiertos entre mascotas"""
+
+    def __init__(self, entrada=None, salida=None, max_edad=None):
+        self.entrada = entrada or getattr(settings, 'LOCATION_PROXIMITY_METERS', 25)
+        self.salida = max(salida or getattr(settings, 'LOCATION_PROXIMITY_EXIT_METERS', 50), self.entrada)
+        self.max_edad = timedelta(seconds=max_edad or getattr(settings, 'LOCATION_PROXIMITY_MAX_AGE_SECONDS', 600))
+        self.grid = SpatialGrid(self.salida)
+        self._lock = threading.Lock()
+        self._momentos = {}  # mascota_id -> created_at de su última posición
+        self._cerca = {}  # (a, b) -> [inicio, distancia mínima]
+        self._parejas = defaultdict(set)  # mascota_id -> mascotas con un encuentro abierto
+        self._barrido = None
+
+    def feed(self, rows, precarga=False):
+        """Procesa un tick de ingesta (filas de FAST_FIELDS); devuelve los ProximityEvent que produjo"""
+        ultimas = {}
+        for row in rows:
+            actual = ultimas.get(row[MASCOTA])
+            if actual is None or (row[CREATED_AT], row[ID]) > (actual[CREATED_AT], actual[ID]):
+                ultimas[row[MASCOTA]] = row
+        eventos = []
+        with self._lock:
+            movidas = []
+            for mascota, row in ultimas.items():
+                previo = self._momentos.get(mascota)
+                # Un fix tardío no mueve a la mascota hacia atrás
+                if previo is not None and row[CREATED_AT] <= previo:
+                    continue
+                self._momentos[mascota] = row[CREATED_AT]
+                self.grid.move(mascota, row[LATITUDE], row[LONGITUDE])
+                movidas.append(mascota)
+            for mascota in movidas:
+                self._evaluar(mascota, eventos)
+            if movidas:
+                self._expirar(max(self._momentos[mascota] for mascota in movidas), eventos)
+        return eventos
+
+    def _evaluar(self, mascota, eventos):
+        lat, lon = self.grid.get(mascota)
+        momento = self._momentos[mascota]
+        limite = momento - self.max_edad
+        cercanas = {
+            otra: distancia
+            for otra, distancia in self.grid.within(lat, lon, self.salida, excluir=mascota)
+            if self._momentos[otra] >= limite
+        }
+        for otra in list(self._parejas.get(mascota, ())):
+            if otra not in cercanas:
+                self._separar(_pareja(mascota, otra), momento, eventos)
+        for otra, distancia in cercanas.items():
+            pareja = _pareja(mascota, otra)
+            abierto = self._cerca.get(pareja)
+            if abierto is not None:
+                abierto[1] = min(abierto[1], distancia)
+            elif distancia <= self.entrada:
+                self._cerca[pareja] = [momento, distancia]
+                self._parejas[pareja[0]].add(pareja[1])
+                self._parejas[pareja[1]].add(pareja[0])
+                eventos.append(ProximityEvent(ENCUENTRO, *pareja, momento, distancia))
+
+    def _separar(self, pareja, momento, eventos):
+        _, distancia = self._cerca.pop(pareja)
+        for a, b in (pareja, pareja[::-1]):
+            self._parejas[a].discard(b)
+            if not self._parejas[a]:
+                del self._parejas[a]
+        eventos.append(ProximityEvent(SEPARACION, *pareja, momento, distancia))
+
+    def _expirar(self, ahora, eventos):
+        if self._barrido is not None and ahora - self._barrido < INTERVALO_BARRIDO:
+            return
+        self._barrido = ahora
+        limite = ahora - self.max_edad
+        for mascota, momento in list(self._momentos.items()):
+            if momento >= limite:
+                continue
+            # El encuentro terminó con el último fix de la mascota que dejó de reportar
+            for otra in list(self._parejas.get(mascota, ())):
+                self._separar(_pareja(mascota, otra), momento, eventos)
+            del self._momentos[mascota]
+            self.grid.remove(mascota)
+
+    def near(self, mascota_id, radio, now=None):
+        """[(mascota, distancia, lat, lon, momento)] a ``radio`` metros o menos de la mascota, o None si no está"""
+        limite = (now or timezone.now()) - self.max_edad
+        with self._lock:
+            posicion = self.grid.get(mascota_id)
+            if posicion is None or self._momentos[mascota_id] < limite:
+                return None
+            return [
+                (otra, distancia, *self.grid.get(otra), self._momentos[otra])
+                for otra, distancia in self.grid.within(*posicion, radio, excluir=mascota_id)
+                if self._momentos[otra] >= limite
+            ]
+
+    def open_pairs(self):
+        """{(a, b): (inicio, distancia mínima)} de los encuentros abiertos"""
+        with self._lock:
+            return {pareja: tuple(abierto) for pareja, abierto in self._cerca.items()}
+
+    def stats(self):
+        with self._lock:
+            return {'mascotas': len(self._momentos), 'encuentros_abiertos': len(self._cerca)}
+
+
+def near_from_rows(rows, mascota_id, radio):
+    """Como ProximityEngine.near pero sobre una foto de la flota (fleet_snapshot), sin grilla"""
+    rows = list(rows)
+    propia = next((row for row in rows if row[MASCOTA] == int(mascota_id)), None)
+    otras = [row for row in rows if row[MASCOTA] != int(mascota_id)]
+    if propia is None:
+        return None
+    if not otras:
+        return []
+    distancias = haversine_m(
+        propia[LATITUDE], propia[LONGITUDE],
+        np.array([row[LATITUDE] for row in otras]), np.array([row[LONGITUDE] for row in otras])
+    )
+    return [
+        (otras[i][MASCOTA], float(distancias[i]), otras[i][LATITUDE], otras[i][LONGITUDE], otras[i][CREATED_AT])
+        for i in np.argsort(distancias, kind='stable').tolist() if distancias[i] <= radio
+    ]
+
+
+class EncounterRecorder:
+    """Alimenta un motor con los ticks de ingesta y guarda sus eventos en Encounter"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._conciliado = False
+
+    def __call__(self, rows, precarga=False):
+        # Los eventos de la precarga ya se guardaron antes de (re)conectar: se concilia al terminar
+        if precarga:
+            self.engine.feed(rows)
+            self._conciliado = False
+            return
+        if not self._conciliado:
+            self.reconcile()
+            self._conciliado = True
+        self.save(self.engine.feed(rows))
+
+    def save(self, eventos):
+        if not eventos:
+            return
+        with transaction.atomic():
+            for evento in eventos:
+                if evento.tipo == ENCUENTRO:
+                    Encounter.objects.create(
+                        mascota_a_id=evento.mascota_a, mascota_b_id=evento.mascota_b,
+                        inicio=evento.momento, distancia_minima=evento.distancia,
+                    )
+                else:
+                    Encounter.objects.filter(
+                        mascota_a_id=evento.mascota_a, mascota_b_id=evento.mascota_b, fin__isnull=True
+                    ).update(fin=evento.momento, distancia_minima=evento.distancia)
+        logger.info(f"🐾 {len(eventos)} eventos de proximidad: " + ', '.join(
+            f"{evento.tipo} {evento.mascota_a}-{evento.mascota_b}" for evento in eventos[:5]
+        ))
+
+    def reconcile(self):
+        """Deja en la base los mismos encuentros abiertos que el motor recién precargado"""
+        abiertos = self.engine.open_pairs()
+        ahora = timezone.now()
+        with transaction.atomic():
+            guardados = set(
+                Encounter.objects.filter(fin__isnull=True).values_list('mascota_a_id', 'mascota_b_id')
+            )
+            for a, b in guardados - set(abiertos):
+                Encounter.objects.filter(mascota_a_id=a, mascota_b_id=b, fin__isnull=True).update(fin=ahora)
+            Encounter.objects.bulk_create([
+                Encounter(mascota_a_id=a, mascota_b_id=b, inicio=abiertos[(a, b)][0], distancia_minima=abiertos[(a, b)][1])
+                for a, b in set(abiertos) - guardados
+            ])
+
+
+# Instancia de los procesos web, alimentada por el listener de location/recent.py
+proximity_engine = ProximityEngine()
@@ -0,0 +1,223 @@
+"""
+Buffer en memoria con los últimos fixes de cada mascota para los polls del mapa.
+
+``/location/latest`` y ``LocationView`` piden casi siempre la ventana de los
+últimos minutos. Cada proceso web mantiene un ring buffer por mascota con sus
+últimos ``LOCATION_RECENT_BUFFER_SIZE`` fixes (las mismas tuplas de
+``FAST_FIELDS``) y responde esas consultas sin ir a Postgres.
+
+La ingesta (bridge o REST, siempre ``ingest_locations``) publica los ids
+insertados con ``pg_notify`` dentro de su transacción; el hilo
+``RecentTracksListener`` de cada proceso web escucha el canal, lee esas filas
+(una consulta por lote de ingesta, no por poll) y las agrega al buffer. Al
+arrancar se precarga desde la BD la ventana de ``LOCATION_RECENT_WARM_MINUTES``.
+
+Si el buffer no alcanza a cubrir la consulta (sin sincronizar, ventana más
+larga que la precarga, mascota con el buffer desbordado) devuelve None y la
+vista lee de la BD como siempre.
+"""
+import bisect
+import heapq
+import logging
+import threading
+from datetime import timedelta
+import psycopg
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, connections
+from django.utils import timezone
+from .fast import CREATED_AT, FAST_FIELDS, ID, MASCOTA
+from .models import Location
+from .proximity import proximity_engine
+
+logger = logging.getLogger(__name__)
+
+CANAL = 'ubicaciones_nuevas'
+# pg_notify admite hasta 8000 bytes por mensaje
+IDS_POR_AVISO = 800
+
+
+def notify_locations(ids):
+    """Avisa a los procesos web de las ubicaciones insertadas (se entrega al confirmar la transacción)"""
+    if not ids or connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(ids), IDS_POR_AVISO):
+            cursor.execute('SELECT pg_notify(%s, %s)', [CANAL, ','.join(map(str, ids[inicio:inicio + IDS_POR_AVISO]))])
+
+
+def _orden(row):
+    return (row[CREATED_AT], row[ID])
+
+
+class RecentTracks:
+    """Ring buffer por mascota de sus últimos fixes, ordenados por created_at"""
+
+    def __init__(self, size=None):
+        self.size = size or getattr(settings, 'LOCATION_RECENT_BUFFER_SIZE', 200)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._tracks = {}  # mascota_id -> lista de filas en orden ascendente
+        self._desborde = {}  # mascota_id -> created_at del último fix expulsado del buffer
+        self._ids = set()
+        # Desde cuándo el buffer tiene todos los fixes; None = sin sincronizar
+        self.synced_since = None
+
+    def reset(self, synced_since=None):
+        with self._lock:
+            self._tracks.clear()
+            self._desborde.clear()
+            self._ids.clear()
+            self.synced_since = synced_since
+
+    def add(self, rows):
+        with self._lock:
+            for row in rows:
+                if row[ID] in self._ids:
+                    continue
+                track = self._tracks.setdefault(row[MASCOTA], [])
+                # Casi siempre al final; los fixes tardíos entran en su lugar
+                bisect.insort(track, row, key=_orden)
+                self._ids.add(row[ID])
+                if len(track) > self.size:
+                    expulsado = track.pop(0)
+                    self._ids.discard(expulsado[ID])
+                    self._desborde[row[MASCOTA]] = expulsado[CREATED_AT]
+
+    def _cubre(self, mascota_id, desde):
+        desborde = self._desborde.get(mascota_id)
+        return desborde is None or desborde < desde
+
+    def recent(self, minutos, mascota_id=None, last_id=0, limit=100):
+        """Filas de los últimos ``minutos`` como la consulta de la vista, o None si el buffer no las cubre"""
+        desde = timezone.now() - timedelta(minutes=minutos)
+        with self._lock:
+            if self.synced_since is None or desde < self.synced_since:
+                self.misses += 1
+                return None
+            if mascota_id:
+                try:
+                    mascota_id = int(mascota_id)
+                except (TypeError, ValueError):
+                    self.misses += 1
+                    return None
+                tracks = [mascota_id] if mascota_id in self._tracks else []
+            else:
+                tracks = list(self._tracks)
+            if not all(self._cubre(mascota, desde) for mascota in tracks):
+                self.misses += 1
+                return None
+            # Mezcla de los tracks de más nuevo a más viejo hasta completar el límite
+            filas = heapq.merge(*(reversed(self._tracks[mascota]) for mascota in tracks), key=_orden, reverse=True)
+            rows = []
+            for row in filas:
+                if row[CREATED_AT] < desde or len(rows) >= limit:
+                    break
+                if row[ID] > last_id:
+                    rows.append(row)
+            self.hits += 1
+            return rows
+
+    def last(self, mascota_id):
+        """(encontrada, fila): la última ubicación de la mascota si el buffer la tiene"""
+        with self._lock:
+            track = self._tracks.get(int(mascota_id)) if str(mascota_id).isdigit() else None
+            # Durante la precarga un track puede no tener todavía su último fix
+            if track and self.synced_since is not None:
+                self.hits += 1
+                return True, track[-1]
+            self.misses += 1
+            return False, None
+
+    def stats(self):
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                'sincronizado': self.synced_since is not None,
+                'mascotas': len(self._tracks),
+                'fixes': len(self._ids),
+                'aciertos': self.hits,
+                'fallos': self.misses,
+                'proporcion_aciertos': round(self.hits / consultas, 3) if consultas else None,
+            }
+
+
+class RecentTracksListener(threading.Thread):
+    """Hilo que precarga el buffer y lo mantiene al día con los avisos de la ingesta"""
+
+    def __init__(self, tracks, on_rows=None):
+        super().__init__(name='recent-tracks', daemon=True)
+        self.tracks = tracks
+        # Recibe cada tanda de filas (on_rows(rows, precarga)), p. ej. el motor de proximidad
+        self.on_rows = on_rows
+        self._stopping = threading.Event()
+
+    def conninfo(self):
+        db = connections['default'].settings_dict
+        return psycopg.conninfo.make_conninfo(
+            dbname=db['NAME'], user=db['USER'], password=db['PASSWORD'], host=db['HOST'], port=db['PORT']
+        )
+
+    def warm(self):
+        minutos = getattr(settings, 'LOCATION_RECENT_WARM_MINUTES', 60)
+        desde = timezone.now() - timedelta(minutes=minutos)
+        self.tracks.reset()
+        rows = Location.objects.filter(created_at__gte=desde).order_by('created_at').values_list(*FAST_FIELDS)
+        # Por lotes: el lock del buffer no se retiene durante toda la precarga
+        lote = []
+        for row in rows.iterator(chunk_size=2000):
+            lote.append(row)
+            if len(lote) >= 2000:
+                self.add(lote, precarga=True)
+                lote = []
+        self.add(lote, precarga=True)
+        self.tracks.synced_since = desde
+        logger.info(f"🧠 Buffer de ubicaciones recientes precargado: {self.tracks.stats()['fixes']} fixes")
+
+    def add(self, rows, precarga=False):
+        self.tracks.add(rows)
+        if self.on_rows is not None:
+            self.on_rows(rows, precarga)
+
+    def load(self, ids):
+        self.add(list(Location.objects.filter(id__in=ids).values_list(*FAST_FIELDS)))
+
+    def run(self):
+        backoff = 1
+        while not self._stopping.is_set():
+            try:
+                with psycopg.connect(self.conninfo(), autocommit=True) as conn:
+                    # Primero LISTEN: lo que se inserte durante la precarga llega después como aviso
+                    conn.execute(f'LISTEN {CANAL}')
+                    close_old_connections()
+                    self.warm()
+                    backoff = 1
+                    while not self._stopping.is_set():
+                        for aviso in conn.notifies(timeout=5):
+                            self.load([int(pk) for pk in aviso.payload.split(',') if pk])
+            except (psycopg.Error, DatabaseError) as e:
+                # Sin avisos el buffer quedaría desactualizado: las vistas vuelven a la BD
+                self.tracks.reset()
+                logger.error(f"❌ Buffer de ubicaciones recientes sin sincronizar, reintento en {backoff} s: {str(e)}")
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, 60)
+        # La conexión de Django de este hilo (precarga y lecturas) no se cierra sola
+        connection.close()
+
+    def stop(self):
+        self._stopping.set()
+
+
+# Instancia compartida por las vistas del proceso
+recent_tracks = RecentTracks()
+_listener = None
+
+
+def start_recent_tracks():
+    """Arranca la precarga y el hilo de avisos (wsgi.py / asgi.py); con tamaño 0 el buffer queda apagado"""
+    global _listener
+    if _listener is None and getattr(settings, 'LOCATION_RECENT_BUFFER_SIZE', 200) > 0:
+        # El motor de proximidad del proceso se alimenta con los mismos avisos
+        _listener = RecentTracksListener(recent_tracks, on_rows=proximity_engine.feed)
+        _listener.start()
+    return _listener
@@ -0,0 +1,129 @@
+"""
+Intervalo de reporte adaptativo de cada collar.
+
+El bridge estima la velocidad de cada dispositivo con sus fixes recientes y le
+recomienda cada cuánto publicar: lento con la mascota quieta, rápido cuando
+corre. Si la recomendación cambia, publica el nuevo intervalo en el topic de
+bajada del collar (``<MQTT_DOWNLINK_PREFIX>/<device_id>/config``, retenido para
+que lo reciba también al reconectarse). Menos fixes de una mascota quieta son
+menos mensajes, spool e INSERTs, sin perder detalle cuando se mueve.
+
+Con varios workers cada uno ve solo su parte de los fixes de un collar; con la
+estrategia ``hash_clientid`` del broker cada collar queda en un solo worker.
+"""
+import threading
+from django.conf import settings
+from .deadband import haversine_m
+
+# Peso del último tramo en la velocidad suavizada
+EWMA_ALPHA = 0.5
+
+
+def downlink_topic(device_id):
+    prefix = getattr(settings, 'MQTT_DOWNLINK_PREFIX', 'dispositivos')
+    return f'{prefix}/{device_id}/config'
+
+
+def recommended_interval(speed_mps, alerta=False):
+    """Intervalo de reporte (s) para una velocidad; con alerta siempre el más rápido"""
+    rapido = getattr(settings, 'LOCATION_INTERVAL_RUNNING', 5)
+    if alerta:
+        return getattr(settings, 'LOCATION_INTERVAL_ALERT', rapido)
+    if speed_mps < getattr(settings, 'LOCATION_STATIONARY_SPEED_MPS', 0.3):
+        return getattr(settings, 'LOCATION_INTERVAL_STATIONARY', 60)
+    if speed_mps < getattr(settings, 'LOCATION_RUNNING_SPEED_MPS', 2.5):
+        return getattr(settings, 'LOCATION_INTERVAL_WALKING', 15)
+    return rapido
+
+
+class ReportingController:
+    """Velocidad estimada, intervalo actual y alertas de cada collar visto por el proceso"""
+
+    def __init__(self, min_change_seconds=None):
+        self.min_change_seconds = (
+            min_change_seconds if min_change_seconds is not None
+            else getattr(settings, 'LOCATION_INTERVAL_MIN_CHANGE_SECONDS', 30)
+        )
+        self.comandos = 0
+        self._lock = threading.Lock()
+        self._dispositivos = {}  # device_id -> estado
+
+    def set_alert(self, device_id, until):
+        """Fuerza el intervalo más rápido hasta ``until`` (p. ej. mascota fuera de su zona)"""
+        with self._lock:
+            self._estado(device_id)['alerta_hasta'] = until
+
+    def _estado(self, device_id):
+        return self._dispositivos.setdefault(device_id, {
+            'ultimo': None,
+            'velocidad': 0.0,
+            'intervalo': None,
+            'recomendado': None,
+            'cambiado': None,
+            'alerta_hasta': None,
+        })
+
+    def observe(self, device_id, latitude, longitude, at, intervalo_reportado=None):
+        """
+        Registra un fix del collar; devuelve el intervalo (s) a enviarle si hay que cambiarlo.
+
+        ``intervalo_reportado`` es el que el collar dice estar usando (en segundos).
+        """
+        if not device_id:
+            return None
+        latitude = float(latitude)
+        longitude = float(longitude)
+        with self._lock:
+            estado = self._estado(device_id)
+            if intervalo_reportado:
+                estado['intervalo'] = intervalo_reportado
+            ultimo = estado['ultimo']
+            if ultimo is not None:
+                dt = (at - ultimo[2]).total_seconds()
+                if dt <= 0:
+                    # Fix repetido o fuera de orden: no informa velocidad
+                    return None
+                tramo = haversine_m(ultimo[0], ultimo[1], latitude, longitude) / dt
+                estado['velocidad'] = EWMA_ALPHA * tramo + (1 - EWMA_ALPHA) * estado['velocidad']
+            estado['ultimo'] = (latitude, longitude, at)
+            if ultimo is None:
+                return None
+
+            alerta = estado['alerta_hasta'] is not None and at < estado['alerta_hasta']
+            recomendado = recommended_interval(estado['velocidad'], alerta)
+            estado['recomendado'] = recomendado
+            actual = estado['intervalo']
+            if recomendado == actual:
+                return None
+            # Acelerar es inmediato; para espaciar se espera a que el cambio anterior se asiente
+            if actual is not None and recomendado > actual and estado['cambiado'] is not None:
+                if (at - estado['cambiado']).total_seconds() < self.min_change_seconds:
+                    return None
+            estado['intervalo'] = recomendado
+            estado['cambiado'] = at
+            self.comandos += 1
+            return recomendado
+
+    def stats(self):
+        with self._lock:
+            por_intervalo = {}
+            for estado in self._dispositivos.values():
+                clave = str(estado['intervalo']) if estado['intervalo'] else 'desconocido'
+                por_intervalo[clave] = por_intervalo.get(clave, 0) + 1
+            return {
+                'dispositivos': len(self._dispositivos),
+                'comandos_enviados': self.comandos,
+                'por_intervalo': por_intervalo,
+            }
+
+    def current_intervals(self):
+        """{device_id: (intervalo actual, velocidad suavizada)}"""
+        with self._lock:
+            return {
+                device_id: (estado['intervalo'], round(estado['velocidad'], 2))
+                for device_id, estado in self._dispositivos.items()
+            }
+
+
+# Instancia compartida por el proceso del bridge
+reporting_controller = ReportingController()
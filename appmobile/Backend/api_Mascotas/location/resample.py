@@ -0,0 +1,183 @@
+"""
+Trayecto de una mascota remuestreado a un paso fijo para animarlo en el mapa.
+
+Los fixes crudos llegan a intervalos irregulares (intervalo adaptativo, filtro
+de movimiento, reintentos). ``resample_track`` interpola posiciones cada
+``paso`` segundos, lineal o por círculo máximo, todo vectorizado en NumPy sobre
+el historial leído en una sola consulta.
+
+Entre dos fixes separados más de ``max_hueco`` no se inventa el recorrido: esas
+muestras quedan en null y se informan como huecos. La excepción es la mascota
+quieta, cuyos fixes intermedios descartó el filtro de movimiento.
+
+Los trayectos de rangos ya cerrados se guardan en la caché de Django por
+(mascota, rango, paso, método). Un fix tardío guardado como historial cambia la
+versión del trayecto de su mascota (``invalidate_tracks``) y las entradas
+anteriores dejan de usarse.
+"""
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from api_Mascotas.renderers import ORJSONRenderer
+from .models import Location
+from .validation import haversine_m
+
+METODOS = ('lineal', 'geodesico')
+
+# Un rango se considera cerrado (cacheable) cuando termina antes de este margen:
+# las filas nuevas toman created_at al insertarse
+MARGEN_CIERRE = timedelta(minutes=1)
+
+
+def _version_key(mascota_id):
+    return f'trayecto_version:{mascota_id}'
+
+
+# Versión de todo el historial de la flota
+FLOTA = '*'
+
+
+def track_version(mascota_id=FLOTA):
+    """Versión del historial ya cerrado de la mascota (o de la flota): cambia con cada fix tardío"""
+    return cache.get(_version_key(mascota_id), 0)
+
+
+def invalidate_tracks(mascota_ids):
+    """Descarta los trayectos y mapas de calor cacheados de las mascotas (p. ej. al guardar fixes tardíos)"""
+    for mascota_id in [*mascota_ids, FLOTA]:
+        try:
+            cache.incr(_version_key(mascota_id))
+        except ValueError:
+            cache.set(_version_key(mascota_id), 1, None)
+
+
+def load_track(mascota_id, desde, hasta):
+    """Tiempos (epoch), latitudes y longitudes del historial en orden cronológico"""
+    rows = list(
+        Location.objects.filter(mascota_id=mascota_id, created_at__gte=desde, created_at__lte=hasta)
+        .order_by('created_at', 'id').values_list('created_at', 'latitude', 'longitude')
+    )
+    t = np.array([row[0].timestamp() for row in rows], dtype=float)
+    lat = np.array([row[1] for row in rows], dtype=float)
+    lon = np.array([row[2] for row in rows], dtype=float)
+    return t, lat, lon
+
+
+def _lineal(lat0, lon0, lat1, lon1, f):
+    # La longitud avanza por el lado corto del antimeridiano
+    dlon = (lon1 - lon0 + 180) % 360 - 180
+    lon = lon0 + f * dlon
+    return lat0 + f * (lat1 - lat0), (lon + 180) % 360 - 180
+
+
+def _vector(lat, lon):
+    phi, lam = np.radians(lat), np.radians(lon)
+    return np.stack((np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)))
+
+
+def _geodesico(lat0, lon0, lat1, lon1, f):
+    """Interpolación esférica (slerp) entre los vectores unitarios de los dos fixes"""
+    p0, p1 = _vector(lat0, lon0), _vector(lat1, lon1)
+    omega = np.arccos(np.clip(np.sum(p0 * p1, axis=0), -1, 1))
+    seno = np.sin(omega)
+    # Puntos (casi) iguales: el slerp degenera en la interpolación lineal
+    cerca = seno < 1e-12
+    seno = np.where(cerca, 1, seno)
+    a = np.where(cerca, 1 - f, np.sin((1 - f) * omega) / seno)
+    b = np.where(cerca, f, np.sin(f * omega) / seno)
+    p = a * p0 + b * p1
+    return np.degrees(np.arctan2(p[2], np.hypot(p[0], p[1]))), np.degrees(np.arctan2(p[1], p[0]))
+
+
+def resample(t, lat, lon, muestras, max_hueco, metodo='lineal'):
+    """Latitudes y longitudes en los instantes ``muestras`` (NaN dentro de un hueco o fuera del historial)"""
+    salida_lat = np.full(len(muestras), np.nan)
+    salida_lon = np.full(len(muestras), np.nan)
+    if len(t) == 0:
+        return salida_lat, salida_lon
+    if len(t) == 1:
+        exacta = muestras == t[0]
+        salida_lat[exacta], salida_lon[exacta] = lat[0], lon[0]
+        return salida_lat, salida_lon
+
+    # Segmento [i, i + 1] que contiene cada muestra; la última muestra exacta usa el último segmento
+    i = np.clip(np.searchsorted(t, muestras, side='right') - 1, 0, len(t) - 2)
+    dentro = (muestras >= t[0]) & (muestras <= t[-1])
+
+    dt = np.diff(t)
+    # Un hueco largo solo se interpola si la mascota no se movió: el filtro de movimiento
+    # guarda un fix por latido y descarta los demás
+    quieta = (
+        (haversine_m(lat[:-1], lon[:-1], lat[1:], lon[1:]) <= getattr(settings, 'LOCATION_DEADBAND_METERS', 15))
+        & (dt <= 2 * getattr(settings, 'LOCATION_HEARTBEAT_SECONDS', 300))
+    )
+    hueco = (dt > max_hueco) & ~quieta
+    # En el borde de un hueco la muestra que cae justo sobre un fix conserva su posición
+    validas = dentro & (~hueco[i] | (muestras == t[i]) | (muestras == t[i + 1]))
+
+    i = i[validas]
+    f = (muestras[validas] - t[i]) / np.where(dt[i] > 0, dt[i], 1)
+    interpolar = _geodesico if metodo == 'geodesico' else _lineal
+    salida_lat[validas], salida_lon[validas] = interpolar(lat[i], lon[i], lat[i + 1], lon[i + 1], f)
+    return salida_lat, salida_lon
+
+
+def _huecos(faltantes, inicio, paso):
+    """Tramos [desde, hasta] de muestras seguidas sin posición"""
+    bordes = np.diff(np.concatenate(([0], faltantes.astype(np.int8), [0])))
+    return [
+        [inicio + paso * int(a), inicio + paso * int(b - 1)]
+        for a, b in zip(np.flatnonzero(bordes == 1).tolist(), np.flatnonzero(bordes == -1).tolist())
+    ]
+
+
+def _nulos(valores, faltantes):
+    valores = np.round(valores, 7).astype(object)
+    valores[faltantes] = None
+    return valores.tolist()
+
+
+def resample_track(mascota_id, desde, hasta, paso, metodo='lineal', max_hueco=None):
+    """Payload del trayecto remuestreado: posiciones cada ``paso`` y los huecos detectados"""
+    if max_hueco is None:
+        max_hueco = timedelta(seconds=getattr(settings, 'LOCATION_RESAMPLE_MAX_GAP_SECONDS', 120))
+    # Fixes vecinos al rango para interpolar también las primeras y últimas muestras
+    t, lat, lon = load_track(mascota_id, desde - max_hueco, hasta + max_hueco)
+    inicio = desde.timestamp()
+    muestras = inicio + paso.total_seconds() * np.arange(int((hasta - desde) / paso) + 1)
+    latitudes, longitudes = resample(t, lat, lon, muestras, max_hueco.total_seconds(), metodo)
+    faltantes = np.isnan(latitudes)
+    return {
+        'mascota': int(mascota_id),
+        'desde': desde,
+        'hasta': hasta,
+        'paso': paso.total_seconds(),
+        'metodo': metodo,
+        'muestras': len(muestras),
+        'fixes': len(t),
+        'latitudes': _nulos(latitudes, faltantes),
+        'longitudes': _nulos(longitudes, faltantes),
+        'huecos': _huecos(faltantes, desde, paso),
+    }
+
+
+def cached_track(mascota_id, desde, hasta, paso, metodo='lineal', max_hueco=None):
+    """JSON (bytes) del trayecto, desde la caché si el rango ya está cerrado"""
+    cerrado = hasta < timezone.now() - MARGEN_CIERRE
+    key = None
+    if cerrado:
+        version = track_version(mascota_id)
+        hueco = max_hueco.total_seconds() if max_hueco is not None else ''
+        key = (
+            f'trayecto:{mascota_id}:{version}:{desde.timestamp()}:{hasta.timestamp()}:'
+            f'{paso.total_seconds()}:{metodo}:{hueco}'
+        )
+        contenido = cache.get(key)
+        if contenido is not None:
+            return contenido
+    contenido = ORJSONRenderer().render(resample_track(mascota_id, desde, hasta, paso, metodo, max_hueco))
+    if key:
+        cache.set(key, contenido, getattr(settings, 'LOCATION_RESAMPLE_CACHE_SECONDS', 86_400))
+    return contenido
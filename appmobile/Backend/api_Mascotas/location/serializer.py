@@ -1,8 +1,49 @@
 from rest_framework import serializers
-from .models import Location
+from .models import Encounter, Location, Visit
+
+class CoordinateField(serializers.FloatField):
+    """Coordenada en float8 que se sigue entregando como el decimal de 10 cifras de antes"""
+    def to_representation(self, value):
+        return f'{value:.10f}'
+
 
 class LocationSerializer(serializers.ModelSerializer):
+    latitude = CoordinateField()
+    longitude = CoordinateField()
+    # Columnas eliminadas de la tabla; se conservan en la respuesta por compatibilidad
+    updated_at = serializers.DateTimeField(source='created_at', read_only=True)
+    is_active = serializers.SerializerMethodField()
+
     class Meta:
         model = Location
-        fields = ['id', 'mascota', 'latitude', 'longitude', 'created_at', 'updated_at', 'is_active']
-        read_only_fields = ['created_at', 'updated_at']
+        fields = ['id', 'mascota', 'latitude', 'longitude', 'created_at', 'updated_at', 'is_active',
+                  'device_time', 'received_at', 'device_id', 'seq']
+        read_only_fields = ['created_at', 'received_at']
+        # Solo para deduplicar la ingesta; la respuesta no cambia
+        extra_kwargs = {
+            'device_id': {'write_only': True, 'required': False},
+            'seq': {'write_only': True, 'required': False},
+        }
+        # Sin UniqueTogetherValidator: volvería obligatorios device_id y seq. Los reenvíos
+        # se resuelven en la vista devolviendo la ubicación ya guardada
+        validators = []
+
+    def get_is_active(self, obj):
+        return True
+
+
+class VisitSerializer(serializers.ModelSerializer):
+    duracion_minutos = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Visit
+        fields = ['id', 'mascota', 'latitude', 'longitude', 'llegada', 'salida', 'duracion_minutos', 'fixes', 'abierta']
+
+    def get_duracion_minutos(self, obj):
+        return round((obj.salida - obj.llegada).total_seconds() / 60, 1)
+
+
+class EncounterSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Encounter
+        fields = ['id', 'mascota_a', 'mascota_b', 'inicio', 'fin', 'distancia_minima']
@@ -0,0 +1,103 @@
+"""
+Posición de toda la flota en un instante y reproducción paso a paso.
+
+``fleet_snapshot`` devuelve el último fix de cada mascota en o antes de T con
+un LATERAL JOIN: por cada mascota una sola lectura del índice
+``location_mascota_created_idx`` (LIMIT 1 en orden descendente). Un
+``DISTINCT ON (mascota_id)`` recorrería en cambio todo el historial anterior a T.
+
+``playback_chunks`` arma las fotos de un rango sin repetir la consulta: parte
+de la foto en ``desde`` y avanza con un solo cursor cronológico sobre los fixes
+del rango, emitiendo una línea NDJSON cada ``paso``.
+"""
+from datetime import timedelta
+import orjson
+from django.db import connections, router
+from django.utils import timezone
+from mascotas.models import Mascota
+from .export import CHUNK_SIZE
+from .fast import CREATED_AT, FAST_FIELDS, ID, MASCOTA, _datetime, render_row
+from .models import Location
+
+
+def _snapshot_sql(connection, con_max_edad):
+    quote = connection.ops.quote_name
+    columnas = ', '.join(quote(Location._meta.get_field(field).column) for field in FAST_FIELDS)
+    return (
+        f'SELECT l.* FROM {quote(Mascota._meta.db_table)} m '
+        f'CROSS JOIN LATERAL ('
+        f'SELECT {columnas} FROM {quote(Location._meta.db_table)} '
+        f'WHERE mascota_id = m.id AND created_at <= %s'
+        f"{' AND created_at > %s' if con_max_edad else ''} "
+        f'ORDER BY created_at DESC LIMIT 1'
+        f') l ORDER BY l.mascota_id'
+    )
+
+
+def fleet_snapshot(momento, max_edad=None):
+    """Filas (FAST_FIELDS) con la última ubicación de cada mascota en o antes de ``momento``
+
+    Con ``max_edad`` (timedelta) se omiten las mascotas cuyo último fix es más viejo.
+    """
+    connection = connections[router.db_for_read(Location)]
+    params = [momento]
+    if max_edad is not None:
+        params.append(momento - max_edad)
+    with connection.cursor() as cursor:
+        cursor.execute(_snapshot_sql(connection, max_edad is not None), params)
+        return cursor.fetchall()
+
+
+def playback_frames(desde, hasta, paso, max_edad=None):
+    """Genera (instante, filas) cada ``paso`` entre ``desde`` y ``hasta``: dos consultas en total"""
+    actuales = {row[MASCOTA]: row for row in fleet_snapshot(desde, max_edad)}
+    rows = Location.objects.filter(
+        created_at__gt=desde, created_at__lte=hasta
+    ).order_by('created_at', 'id').values_list(*FAST_FIELDS).iterator(chunk_size=CHUNK_SIZE)
+    siguiente = next(rows, None)
+    momento = desde
+    while momento <= hasta:
+        while siguiente is not None and siguiente[CREATED_AT] <= momento:
+            actuales[siguiente[MASCOTA]] = siguiente
+            siguiente = next(rows, None)
+        limite = momento - max_edad if max_edad is not None else None
+        yield momento, [
+            row for _, row in sorted(actuales.items())
+            if limite is None or row[CREATED_AT] > limite
+        ]
+        momento += paso
+
+
+def frame_count(desde, hasta, paso):
+    return int((hasta - desde) / paso) + 1
+
+
+def playback_chunks(desde, hasta, paso, max_edad=None):
+    """Líneas NDJSON ``{"momento": ..., "ubicaciones": [...]}``, agrupadas en bloques"""
+    tz = timezone.get_current_timezone()
+    # Cada fix se renderiza una vez aunque aparezca en muchas fotos
+    renderizadas = {}
+    buffer = []
+    for momento, rows in playback_frames(desde, hasta, paso, max_edad):
+        ubicaciones = []
+        for row in rows:
+            cached = renderizadas.get(row[MASCOTA])
+            if cached is None or cached[0] != row[ID]:
+                cached = renderizadas[row[MASCOTA]] = (row[ID], render_row(row, tz))
+            ubicaciones.append(cached[1])
+        buffer.append(orjson.dumps({'momento': _datetime(momento, tz), 'ubicaciones': ubicaciones}))
+        if len(buffer) >= 100:
+            yield b'\n'.join(buffer) + b'\n'
+            buffer = []
+    if buffer:
+        yield b'\n'.join(buffer) + b'\n'
+
+
+def parse_max_edad(value):
+    """Minutos de antigüedad máxima de un fix para contar en la foto (None = sin límite)"""
+    if value in (None, ''):
+        return None
+    minutos = int(value)
+    if minutos <= 0:
+        raise ValueError('max_edad debe ser mayor que 0')
+    return timedelta(minutes=minutos)
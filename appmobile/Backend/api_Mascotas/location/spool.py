@@ -0,0 +1,367 @@
+"""
+Spool local de escritura anticipada para la ingesta MQTT.
+
+Cada fix se guarda primero en una cola SQLite en disco (modo WAL) y un hilo
+escritor la vacía hacia Postgres por lotes. Si la base de datos no responde,
+los fixes se acumulan en el spool y se reenvían a velocidad de lote cuando
+vuelve. El spool tiene un tope de filas: al llenarse se descartan los fixes
+más antiguos y se cuentan en ``descartados``.
+
+Con backlog (más de ``LOCATION_BACKLOG_THRESHOLD`` fixes pendientes) el
+escritor pasa a "el último gana": en cada vuelta guarda primero el fix más
+nuevo de cada mascota, así el mapa muestra la posición actual enseguida, y
+después vacía el resto en lotes grandes que entran a la base como historial.
+
+Cada archivo de spool tiene un solo dueño: el bridge lo abre con un lock
+exclusivo, así dos procesos no vacían (y duplican) las mismas filas.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from django.conf import settings
+from django.db import DatabaseError, DataError, IntegrityError, close_old_connections
+from django.utils import timezone
+from .ingest import save_locations_in_order
+from .latency import (
+    ETAPA_BROKER_BD,
+    ETAPA_DISPOSITIVO_BROKER,
+    latency_tracker,
+    parse_device_time,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock de archivo, un bridge por spool queda a cargo del operador
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Contadores persistidos en el propio spool
+ENCOLADOS = 'encolados'
+PROCESADOS = 'procesados'  # Salidos de la cola hacia la BD (guardados o filtrados)
+REENVIADOS = 'reenviados'  # Guardados después de al menos un intento fallido
+DESCARTADOS = 'descartados'  # Eliminados por el tope de tamaño
+RECHAZADOS = 'rechazados'  # Rechazados por la BD (p. ej. mascota inexistente)
+CONTADORES = (ENCOLADOS, PROCESADOS, REENVIADOS, DESCARTADOS, RECHAZADOS)
+
+
+def spool_dir():
+    return getattr(settings, 'LOCATION_SPOOL_DIR', settings.BASE_DIR / 'spool')
+
+
+def spool_path(worker=None):
+    """Un archivo por proceso del bridge: SQLite admite un solo escritor a la vez"""
+    nombre = 'ubicaciones.sqlite3' if worker is None else f'ubicaciones-w{worker}.sqlite3'
+    return spool_dir() / nombre
+
+
+class SpoolLocked(RuntimeError):
+    """Otro proceso ya es dueño del archivo de spool"""
+
+
+class LocationSpool:
+    """Cola FIFO durable de fixes pendientes de guardar en la base de datos"""
+
+    def __init__(self, path, max_fixes=None, exclusive=False):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_fixes = max_fixes or getattr(settings, 'LOCATION_SPOOL_MAX_FIXES', 200_000)
+        self._lock = threading.Lock()
+        self._lock_fd = None
+        if exclusive:
+            self._acquire_owner_lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        # FULL: un fix confirmado por el spool sobrevive también a un corte de energía
+        self._db.execute('PRAGMA synchronous=FULL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS fixes ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, '
+            'received_at TEXT NOT NULL, intentos INTEGER NOT NULL DEFAULT 0)'
+        )
+        self._db.execute('CREATE TABLE IF NOT EXISTS contadores (nombre TEXT PRIMARY KEY, valor INTEGER NOT NULL)')
+        self._db.executemany(
+            'INSERT OR IGNORE INTO contadores (nombre, valor) VALUES (?, 0)',
+            [(nombre,) for nombre in CONTADORES]
+        )
+        self.pending = self._db.execute('SELECT COUNT(*) FROM fixes').fetchone()[0]
+
+    def _acquire_owner_lock(self):
+        if fcntl is None:
+            return
+        self._lock_fd = os.open(f'{self.path}.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+            raise SpoolLocked(
+                f'El spool {self.path.name} ya está en uso por otro bridge; '
+                f'usar --worker con un número distinto para cada proceso'
+            )
+
+    def _count(self, nombre, n):
+        self._db.execute('UPDATE contadores SET valor = valor + ? WHERE nombre = ?', (n, nombre))
+
+    def append(self, data, received_at):
+        """Agrega un fix al final de la cola; vuelve cuando ya está en disco"""
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                if self.pending >= self.max_fixes:
+                    sobrantes = self.pending - self.max_fixes + 1
+                    self._db.execute(
+                        'DELETE FROM fixes WHERE id IN (SELECT id FROM fixes ORDER BY id LIMIT ?)',
+                        (sobrantes,)
+                    )
+                    self._count(DESCARTADOS, sobrantes)
+                    self.pending -= sobrantes
+                    logger.warning(f"⚠️ Spool lleno ({self.max_fixes} fixes): se descartaron {sobrantes} fixes antiguos")
+                self._db.execute(
+                    'INSERT INTO fixes (payload, received_at) VALUES (?, ?)',
+                    (json.dumps(data), received_at.isoformat())
+                )
+                self._count(ENCOLADOS, 1)
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+            self.pending += 1
+
+    def peek(self, limit):
+        """Los ``limit`` fixes más antiguos: (id, payload, received_at, intentos)"""
+        with self._lock:
+            return self._db.execute(
+                'SELECT id, payload, received_at, intentos FROM fixes ORDER BY id LIMIT ?', (limit,)
+            ).fetchall()
+
+    def ack(self, ids, reenviados=0, contador=PROCESADOS):
+        """Elimina de la cola los fixes ya guardados (o rechazados)"""
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            borrados = self._db.executemany('DELETE FROM fixes WHERE id = ?', [(i,) for i in ids]).rowcount
+            self._count(contador, borrados)
+            self._count(REENVIADOS, reenviados)
+            self._db.execute('COMMIT')
+            self.pending = max(self.pending - borrados, 0)
+
+    def peek_latest(self, after_id=0, limit=None):
+        """El fix pendiente más nuevo de cada mascota, entre los de id mayor a ``after_id``"""
+        with self._lock:
+            return self._db.execute(
+                'SELECT id, payload, received_at, intentos FROM fixes WHERE id IN ('
+                "SELECT MAX(id) FROM fixes WHERE id > ? GROUP BY CAST(json_extract(payload, '$.mascota') AS INTEGER)"
+                ') ORDER BY id LIMIT ?',
+                (after_id, limit or -1)
+            ).fetchall()
+
+    def mark_failed(self, ids):
+        with self._lock:
+            self._db.executemany('UPDATE fixes SET intentos = intentos + 1 WHERE id = ?', [(i,) for i in ids])
+
+    def lag(self):
+        """Segundos desde que llegó el fix pendiente más antiguo (0 si la cola está vacía)"""
+        with self._lock:
+            row = self._db.execute('SELECT received_at FROM fixes ORDER BY id LIMIT 1').fetchone()
+        if row is None:
+            return 0.0
+        return round((timezone.now() - datetime.fromisoformat(row[0])).total_seconds(), 1)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._db.execute('SELECT nombre, valor FROM contadores').fetchall())
+        stats['pendientes'] = self.pending
+        stats['bytes'] = sum(p.stat().st_size for p in self.path.parent.glob(f'{self.path.name}*'))
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+
+def parse_seq(value):
+    """Número de secuencia del collar (entero no negativo) o None"""
+    try:
+        seq = int(value)
+    except (TypeError, ValueError):
+        return None
+    return seq if seq >= 0 else None
+
+
+def parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_fix(payload, received_at):
+    """Convierte una fila del spool en los campos del fix; None si está incompleta o es inválida"""
+    try:
+        data = json.loads(payload)
+        received_at = datetime.fromisoformat(received_at)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    # Algunos collares mandan el id como texto: "5" y 5 son la misma mascota
+    mascota_id = parse_seq(data.get('mascota'))
+    latitude = parse_float(data.get('latitude'))
+    longitude = parse_float(data.get('longitude'))
+    if not mascota_id or latitude is None or longitude is None:
+        return None
+    return {
+        'mascota_id': mascota_id,
+        'latitude': latitude,
+        'longitude': longitude,
+        'device_time': parse_device_time(data.get('device_time')),
+        'received_at': received_at,
+        'device_id': data.get('device_id') or None,
+        'seq': parse_seq(data.get('seq')),
+        # Calidad del fix según el GPS, si el collar la envía
+        'hdop': parse_float(data.get('hdop')),
+        'satelites': parse_seq(data.get('satelites')),
+    }
+
+
+class SpoolWriter(threading.Thread):
+    """Hilo que vacía el spool hacia Postgres por lotes, con reintentos si la BD no responde"""
+
+    def __init__(self, spool, batch_size=None):
+        super().__init__(name='location-spool-writer', daemon=True)
+        self.spool = spool
+        self.batch_size = batch_size or getattr(settings, 'LOCATION_SPOOL_BATCH_SIZE', 500)
+        self.max_backoff = getattr(settings, 'LOCATION_SPOOL_MAX_BACKOFF', 30)
+        self.backlog_threshold = getattr(settings, 'LOCATION_BACKLOG_THRESHOLD', 2_000)
+        self.history_batch_size = getattr(settings, 'LOCATION_SPOOL_HISTORY_BATCH_SIZE', 2_000)
+        self.backlog_mode = False
+        self.live_updates = 0
+        # Id del último fix guardado por la pasada "el último gana"
+        self._live_watermark = 0
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self.last_error = None
+
+    def notify(self):
+        self._wakeup.set()
+
+    def stop(self, timeout=10):
+        self._stopping.set()
+        self._wakeup.set()
+        self.join(timeout)
+
+    def drain(self, timeout):
+        """Espera hasta ``timeout`` segundos a que el spool se vacíe; True si quedó vacío"""
+        deadline = time.monotonic() + timeout
+        while self.spool.pending and self.is_alive() and time.monotonic() < deadline:
+            self._wakeup.set()
+            time.sleep(0.1)
+        return not self.spool.pending
+
+    def next_batch(self):
+        """Próximo lote y si es la pasada en vivo (el fix más nuevo de cada mascota)"""
+        backlog = self.spool.pending > self.backlog_threshold
+        if backlog != self.backlog_mode:
+            self.backlog_mode = backlog
+            if backlog:
+                logger.warning(
+                    f"🐢 Backlog de {self.spool.pending} fixes: se guarda primero la última posición "
+                    f"de cada mascota y el resto como historial"
+                )
+            else:
+                logger.info("✅ Backlog vaciado, el spool vuelve a orden de llegada")
+        if not backlog:
+            return self.spool.peek(self.batch_size), False
+        rows = self.spool.peek_latest(self._live_watermark, self.history_batch_size)
+        if rows:
+            return rows, True
+        return self.spool.peek(self.history_batch_size), False
+
+    def run(self):
+        backoff = 1
+        while not self._stopping.is_set():
+            rows, en_vivo = self.next_batch()
+            if not rows:
+                self._wakeup.wait(1)
+                self._wakeup.clear()
+                continue
+            try:
+                try:
+                    self.flush(rows)
+                except (IntegrityError, DataError):
+                    # Un fix inválido (p. ej. mascota inexistente) no debe bloquear la cola
+                    self.flush_one_by_one(rows)
+                except DatabaseError:
+                    raise
+                except Exception:
+                    logger.exception("❌ Error inesperado al guardar un lote del spool, se reintenta fila por fila")
+                    self.flush_one_by_one(rows)
+                if en_vivo:
+                    self._live_watermark = rows[-1][0]
+                    self.live_updates += len(rows)
+                backoff = 1
+                self.last_error = None
+            except Exception as e:
+                # BD caída (también a mitad del reintento fila por fila) o error imprevisto:
+                # el hilo sigue vivo y el lote se reintenta con backoff
+                self.last_error = str(e)
+                if not isinstance(e, DatabaseError):
+                    logger.exception("❌ Error inesperado en el escritor del spool")
+                try:
+                    self.spool.mark_failed([row[0] for row in rows])
+                except sqlite3.Error:
+                    logger.exception("❌ No se pudo marcar el lote como fallido en el spool")
+                logger.error(
+                    f"❌ No se pudo vaciar el spool, {self.spool.pending} fixes esperan. "
+                    f"Reintento en {backoff} s: {str(e)}"
+                )
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def parse_rows(self, rows):
+        fixes = []
+        for _, payload, received_at, _ in rows:
+            fix = parse_fix(payload, received_at)
+            if fix is None:
+                logger.warning(f"❌ Datos incompletos para guardar en BD: {payload}")
+            else:
+                fixes.append(fix)
+        return fixes
+
+    def flush(self, rows):
+        """Guarda un lote en la base de datos y lo confirma en el spool"""
+        close_old_connections()
+        saved = save_locations_in_order(self.parse_rows(rows))
+        committed_at = timezone.now()
+        for location in saved:
+            latency_tracker.record(ETAPA_DISPOSITIVO_BROKER, location.device_time, location.received_at)
+            latency_tracker.record(ETAPA_BROKER_BD, location.received_at, committed_at)
+
+        reenviados = sum(1 for row in rows if row[3] > 0)
+        self.spool.ack([row[0] for row in rows], reenviados)
+        if reenviados:
+            logger.info(f"♻️ {reenviados} fixes del spool reenviados a la BD ({self.spool.pending} pendientes)")
+        else:
+            logger.info(f"✅ {len(saved)} ubicaciones guardadas en BD local")
+
+    def flush_one_by_one(self, rows):
+        """Guarda el lote fila por fila y saca del spool las que la BD rechaza"""
+        for row in rows:
+            try:
+                self.flush([row])
+            except (IntegrityError, DataError) as e:
+                logger.error(f"❌ Fix rechazado por la BD, se descarta del spool: {row[1]} ({str(e)})")
+                self.spool.ack([row[0]], contador=RECHAZADOS)
+            except DatabaseError:
+                # BD caída: el resto del lote vuelve al camino de reintentos de run()
+                raise
+            except Exception as e:
+                logger.exception(f"❌ Fix imposible de guardar, se descarta del spool: {row[1]}")
+                self.spool.ack([row[0]], contador=RECHAZADOS)
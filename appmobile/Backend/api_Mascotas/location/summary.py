@@ -0,0 +1,54 @@
+"""
+Resumen del día de varias mascotas en una sola consulta.
+
+Fixes, primer y último fix y distancia recorrida (suma de los tramos entre
+fixes consecutivos, con LAG) se agregan en la base: no se traen los miles de
+fixes del día de cada mascota para recorrerlos en Python.
+"""
+from datetime import timedelta
+from django.db import connections, router
+from django.utils import timezone
+from .models import Location
+from .validation import RADIO_TIERRA_M
+
+
+def _summary_sql(connection):
+    quote = connection.ops.quote_name
+    return (
+        f'WITH tramos AS ('
+        f'SELECT mascota_id, created_at, latitude, longitude, '
+        f'LAG(latitude) OVER w AS lat_previa, LAG(longitude) OVER w AS lon_previa '
+        f'FROM {quote(Location._meta.db_table)} '
+        f'WHERE mascota_id = ANY(%s) AND created_at >= %s AND created_at < %s '
+        f'WINDOW w AS (PARTITION BY mascota_id ORDER BY created_at, id)'
+        f') SELECT mascota_id, COUNT(*), MIN(created_at), MAX(created_at), '
+        f'COALESCE(SUM(2 * %s * ASIN(SQRT(LEAST(1, '
+        f'POWER(SIN(RADIANS(latitude - lat_previa) / 2), 2) + '
+        f'COS(RADIANS(lat_previa)) * COS(RADIANS(latitude)) * POWER(SIN(RADIANS(longitude - lon_previa) / 2), 2)'
+        f')))) FILTER (WHERE lat_previa IS NOT NULL), 0) '
+        f'FROM tramos GROUP BY mascota_id'
+    )
+
+
+def start_of_day(now=None):
+    return timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def day_summary(mascota_ids, desde=None):
+    """{mascota_id: {fixes, primer_fix, ultimo_fix, distancia_m}} del día que empieza en ``desde`` (hoy)"""
+    desde = desde or start_of_day()
+    mascota_ids = list(mascota_ids)
+    if not mascota_ids:
+        return {}
+    connection = connections[router.db_for_read(Location)]
+    with connection.cursor() as cursor:
+        cursor.execute(_summary_sql(connection), [mascota_ids, desde, desde + timedelta(days=1), RADIO_TIERRA_M])
+        return {
+            mascota_id: {
+                'fixes': fixes,
+                'primer_fix': primero,
+                'ultimo_fix': ultimo,
+                'distancia_m': round(float(distancia), 1),
+            }
+            for mascota_id, fixes, primero, ultimo, distancia in cursor.fetchall()
+        }
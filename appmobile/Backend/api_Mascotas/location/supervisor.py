@@ -0,0 +1,137 @@
+"""
+Supervisión del bridge MQTT: backoff con jitter, estado de salud y sondas HTTP.
+
+Las reconexiones las hace el propio loop de paho; antes de cada reintento el
+bridge fija el siguiente retraso con ``Backoff`` (exponencial con jitter
+completo), así muchos workers no golpean al broker todos a la vez.
+
+``ProbeServer`` expone ``/healthz`` (el proceso y el hilo escritor siguen
+vivos) y ``/readyz`` (conectado al broker y con el retraso de ingesta bajo
+``MQTT_READY_MAX_LAG``) para el orquestador.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Backoff:
+    """Retraso exponencial con jitter completo: uniforme entre 0 y min(tope, base * 2^intento)"""
+
+    def __init__(self, base=None, cap=None):
+        self.base = base or getattr(settings, 'MQTT_RECONNECT_BASE_DELAY', 1)
+        self.cap = cap or getattr(settings, 'MQTT_RECONNECT_MAX_DELAY', 120)
+        self.attempt = 0
+
+    def next(self):
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** self.attempt))
+        self.attempt += 1
+        # Nunca cero: paho interpreta el retraso como mínimo entre intentos
+        return max(delay, self.base / 10)
+
+    def reset(self):
+        self.attempt = 0
+
+
+class BridgeHealth:
+    """Estado del bridge compartido entre el loop MQTT, el hilo escritor y las sondas"""
+
+    def __init__(self, reporting=None):
+        self._lock = threading.Lock()
+        self.reporting = reporting
+        self.connected = False
+        self.ever_connected = False
+        self.changed_at = time.time()
+        self.reconnects = 0
+        self.last_message_at = None
+        self.stopping = False
+
+    def set_connected(self, connected):
+        with self._lock:
+            if connected and not self.connected:
+                # La primera conexión no es una reconexión
+                if self.ever_connected:
+                    self.reconnects += 1
+                self.ever_connected = True
+            if connected != self.connected:
+                self.changed_at = time.time()
+            self.connected = connected
+
+    def message_received(self):
+        self.last_message_at = time.time()
+
+    def snapshot(self, spool=None, writer=None):
+        now = time.time()
+        with self._lock:
+            estado = {
+                'conectado': self.connected,
+                'segundos_en_estado': round(now - self.changed_at, 1),
+                'reconexiones': self.reconnects,
+                'deteniendo': self.stopping,
+                'segundos_desde_ultimo_mensaje': (
+                    round(now - self.last_message_at, 1) if self.last_message_at else None
+                ),
+            }
+        if spool is not None:
+            estado['spool_pendientes'] = spool.pending
+            estado['retraso_ingesta'] = spool.lag()
+        if writer is not None:
+            estado['escritor_vivo'] = writer.is_alive()
+            estado['escritor_error'] = writer.last_error
+            estado['modo_backlog'] = writer.backlog_mode
+            estado['actualizaciones_en_vivo'] = writer.live_updates
+        if self.reporting is not None:
+            estado['intervalos_reporte'] = self.reporting.stats()
+        return estado
+
+
+class ProbeServer:
+    """Servidor HTTP mínimo con las sondas de vida y disponibilidad del bridge"""
+
+    def __init__(self, port, health, spool_writer):
+        self.health = health
+        self.spool_writer = spool_writer
+        probe = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body = probe.check(self.path)
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                # Las sondas llegan cada pocos segundos; no ensuciar el log del bridge
+                pass
+
+        self.server = ThreadingHTTPServer(('0.0.0.0', port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name='mqtt-probe', daemon=True)
+
+    def check(self, path):
+        spool, writer = self.spool_writer()
+        estado = self.health.snapshot(spool, writer)
+        if path.startswith('/healthz'):
+            vivo = writer is None or writer.is_alive()
+            return (200 if vivo else 503), estado
+        if path.startswith('/readyz'):
+            max_lag = getattr(settings, 'MQTT_READY_MAX_LAG', 60)
+            lag = estado.get('retraso_ingesta') or 0
+            listo = estado['conectado'] and not estado['deteniendo'] and lag <= max_lag
+            return (200 if listo else 503), estado
+        return 404, {'error': 'Usar /healthz o /readyz'}
+
+    def start(self):
+        self.thread.start()
+        logger.info(f"🩺 Sondas de salud en http://0.0.0.0:{self.server.server_port}/healthz y /readyz")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,177 @@
+"""
+Telemetría de los collares publicada en el topic ``sistema``.
+
+Los heartbeats (cada minuto) y los mensajes de conexión traen RSSI, batería,
+satélites, versión del firmware y publicaciones fallidas. El bridge los pasa a
+``DeviceStatusWriter``, que los guarda por lotes en ``DeviceStatus`` desde su
+propio hilo: una BD lenta no frena el loop MQTT. Es información de diagnóstico:
+si la BD no responde se conservan los últimos ``DEVICE_STATUS_BUFFER_SIZE``
+estados y el resto se descarta.
+
+``device_aggregates`` resume la ventana reciente de cada collar en una consulta;
+``degraded_devices`` marca los que tienen mal enlace (señal baja, reconexiones,
+fallos al publicar), que son los que generan reintentos y ráfagas de ingesta.
+"""
+import logging
+import threading
+from collections import deque
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Avg, Count, Max, Min, OuterRef, Q, Subquery
+from .latency import parse_device_time
+from .models import DeviceStatus
+from .spool import parse_seq
+
+logger = logging.getLogger(__name__)
+
+TIPOS = {tipo for tipo, _ in DeviceStatus.TIPOS}
+
+
+def parse_int(value, minimo=None, maximo=None):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    if (minimo is not None and value < minimo) or (maximo is not None and value > maximo):
+        return None
+    return value
+
+
+def parse_status(data, received_at):
+    """DeviceStatus (sin guardar) a partir de un mensaje del topic sistema, o None si no es de estado"""
+    if not isinstance(data, dict) or data.get('tipo') not in TIPOS:
+        # Comandos (ping/pong) y mensajes desconocidos no son telemetría
+        return None
+    # Firmware anterior a device_id: se usa el client id MQTT
+    device_id = str(data.get('device_id') or data.get('cliente_id') or '')[:64]
+    if not device_id:
+        return None
+    return DeviceStatus(
+        device_id=device_id,
+        mascota_id=parse_seq(data.get('mascota')),
+        tipo=data['tipo'],
+        rssi=parse_int(data.get('rssi'), -150, 0),
+        bateria=parse_int(data.get('bateria'), 0, 100),
+        satelites=parse_int(data.get('satelites'), 0, 255),
+        version=str(data.get('version') or '')[:16],
+        fallos_publicacion=parse_int(data.get('fallos_publicacion'), 0, 2 ** 31 - 1),
+        uptime=parse_int(data.get('uptime'), 0, 2 ** 31 - 1),
+        received_at=parse_device_time(data.get('device_time')) or received_at,
+    )
+
+
+class DeviceStatusWriter(threading.Thread):
+    """Hilo que guarda por lotes los estados de los collares"""
+
+    def __init__(self, flush_seconds=None, buffer_size=None):
+        super().__init__(name='device-status-writer', daemon=True)
+        self.flush_seconds = flush_seconds or getattr(settings, 'DEVICE_STATUS_FLUSH_SECONDS', 10)
+        self.buffer = deque(maxlen=buffer_size or getattr(settings, 'DEVICE_STATUS_BUFFER_SIZE', 10_000))
+        self.guardados = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def add(self, status):
+        with self._lock:
+            # Con el buffer lleno se pierde el estado más antiguo
+            self.buffer.append(status)
+
+    def flush(self):
+        with self._lock:
+            lote = list(self.buffer)
+            self.buffer.clear()
+        if not lote:
+            return 0
+        try:
+            close_old_connections()
+            DeviceStatus.objects.bulk_create(lote)
+        except DatabaseError as e:
+            self.last_error = str(e)
+            with self._lock:
+                # El lote vuelve delante de lo recibido mientras tanto; si no cabe, se pierde lo más antiguo
+                self.buffer = deque(lote + list(self.buffer), maxlen=self.buffer.maxlen)
+            logger.error(f"❌ No se pudo guardar la telemetría de los collares ({len(lote)} estados): {str(e)}")
+            return 0
+        self.last_error = None
+        self.guardados += len(lote)
+        return len(lote)
+
+    def run(self):
+        while not self._stopping.wait(self.flush_seconds):
+            self.flush()
+
+    def stop(self):
+        self._stopping.set()
+        if self.is_alive():
+            self.join(self.flush_seconds + 5)
+        self.flush()
+
+
+def device_aggregates(desde):
+    """Resumen por collar de los estados recibidos desde ``desde`` (una sola consulta)"""
+    ultima_version = (
+        DeviceStatus.objects
+        .filter(device_id=OuterRef('device_id'))
+        .exclude(version='')
+        .order_by('-received_at')
+        .values('version')[:1]
+    )
+    rows = (
+        DeviceStatus.objects
+        .filter(received_at__gte=desde)
+        .values('device_id')
+        .annotate(
+            mascota=Max('mascota_id'),
+            mensajes=Count('id'),
+            reconexiones=Count('id', filter=Q(tipo=DeviceStatus.TIPO_CONEXION)),
+            rssi_promedio=Avg('rssi'),
+            rssi_minimo=Min('rssi'),
+            satelites_promedio=Avg('satelites'),
+            bateria_minima=Min('bateria'),
+            fallos_max=Max('fallos_publicacion'),
+            fallos_min=Min('fallos_publicacion'),
+            ultimo_mensaje=Max('received_at'),
+            version=Subquery(ultima_version),
+        )
+        .order_by('device_id')
+    )
+    resumen = []
+    for row in rows:
+        fallos_max = row.pop('fallos_max')
+        fallos_min = row.pop('fallos_min')
+        # El contador es acumulado: en la ventana cuenta la diferencia (se reinicia con el collar)
+        row['fallos_publicacion'] = max(fallos_max - fallos_min, 0) if fallos_max is not None else None
+        for campo in ('rssi_promedio', 'satelites_promedio'):
+            if row[campo] is not None:
+                row[campo] = round(row[campo], 1)
+        resumen.append(row)
+    return resumen
+
+
+def degradation_reasons(device, now):
+    """Motivos por los que el enlace de un collar se considera degradado"""
+    motivos = []
+    if device['rssi_promedio'] is not None and device['rssi_promedio'] < getattr(settings, 'DEVICE_RSSI_DEGRADED', -80):
+        motivos.append('senal_baja')
+    if device['reconexiones'] >= getattr(settings, 'DEVICE_MAX_RECONNECTS', 3):
+        motivos.append('reconexiones')
+    if (device['fallos_publicacion'] or 0) >= getattr(settings, 'DEVICE_MAX_PUBLISH_FAILURES', 5):
+        motivos.append('fallos_publicacion')
+    if device['bateria_minima'] is not None and device['bateria_minima'] < getattr(settings, 'DEVICE_LOW_BATTERY', 15):
+        motivos.append('bateria_baja')
+    silencio = getattr(settings, 'DEVICE_SILENT_SECONDS', 300)
+    if (now - device['ultimo_mensaje']).total_seconds() > silencio:
+        motivos.append('sin_mensajes')
+    return motivos
+
+
+def degraded_devices(desde, now):
+    """Collares con el enlace degradado en la ventana, los de más motivos primero"""
+    degradados = []
+    for device in device_aggregates(desde):
+        motivos = degradation_reasons(device, now)
+        if motivos:
+            degradados.append({**device, 'motivos': motivos})
+    degradados.sort(key=lambda device: (-len(device['motivos']), device['rssi_promedio'] or 0))
+    return degradados
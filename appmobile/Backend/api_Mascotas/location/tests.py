@@ -1,3 +1,1319 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+import numpy as np
+from pathlib import Path
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, OperationalError
+from rest_framework.renderers import JSONRenderer
+from api_Mascotas.renderers import ORJSONRenderer
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from api_Mascotas.query_budget import QueryBudgetTestMixin
+from django.utils import timezone
+from dueño.models import Dueño
+from mascotas.models import Mascota
+from .deadband import DeadbandFilter
+from .fast import FAST_FIELDS, render_locations
+from .ingest import RecentFixes, fix_key, save_locations_in_order
+from .grid import SpatialGrid
+from .heatmap import Scope, clean_heatmap_cache, heatmap_tile, histogram, tile_bounds
+from .latency import latency_tracker
+from .models import DeviceStatus, Encounter, Location, LocationQuarantine, Visit, VisitState
+from .proximity import ENCUENTRO, SEPARACION, EncounterRecorder, ProximityEngine, proximity_engine
+from .recent import RecentTracks, RecentTracksListener, recent_tracks
+from .resample import resample
+from .reporting import ReportingController, recommended_interval
+from .serializer import LocationSerializer
+from .validation import haversine_m, validate_fixes
+from .spool import RECHAZADOS, LocationSpool, SpoolLocked, SpoolWriter, parse_fix
+from .supervisor import Backoff, BridgeHealth, ProbeServer
+from .telemetry import DeviceStatusWriter, parse_status
+from .visits import StayPointDetector, detect_visits
 
 # Create your tests here.
+
+class SpoolTestMixin:
+    """Spool SQLite en un directorio temporal por test"""
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.spool = LocationSpool(Path(self.tmp.name) / 'spool.sqlite3')
+
+    def tearDown(self):
+        self.spool.close()
+        self.tmp.cleanup()
+        super().tearDown()
+
+    def encolar(self, n, mascota=1):
+        for i in range(n):
+            self.spool.append({'mascota': mascota, 'latitude': 4.6 + i / 1000, 'longitude': -74.08}, timezone.now())
+
+
+class AckWriter(SpoolWriter):
+    """Escritor que confirma los lotes sin tocar la base de datos"""
+
+    def flush(self, rows):
+        self.spool.ack([row[0] for row in rows])
+
+
+class BackoffTests(SimpleTestCase):
+    def test_retraso_acotado_por_exponencial_y_tope(self):
+        backoff = Backoff(base=1, cap=30)
+        for intento in range(10):
+            delay = backoff.next()
+            self.assertGreater(delay, 0)
+            self.assertLessEqual(delay, min(30, 2 ** intento))
+
+    def test_reset_vuelve_al_primer_intento(self):
+        backoff = Backoff(base=1, cap=30)
+        for _ in range(5):
+            backoff.next()
+        backoff.reset()
+        self.assertEqual(backoff.attempt, 0)
+        self.assertLessEqual(backoff.next(), 1)
+
+
+class BridgeHealthTests(SimpleTestCase):
+    def test_primera_conexion_no_cuenta_como_reconexion(self):
+        health = BridgeHealth()
+        health.set_connected(True)
+        self.assertEqual(health.reconnects, 0)
+        health.set_connected(False)
+        health.set_connected(True)
+        self.assertEqual(health.reconnects, 1)
+
+    def test_snapshot_sin_spool(self):
+        estado = BridgeHealth().snapshot()
+        self.assertFalse(estado['conectado'])
+        self.assertIsNone(estado['segundos_desde_ultimo_mensaje'])
+        self.assertNotIn('spool_pendientes', estado)
+
+
+class ProbeServerTests(SpoolTestMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.health = BridgeHealth()
+        self.writer = AckWriter(self.spool)
+        self.probe = ProbeServer(0, self.health, lambda: (self.spool, self.writer))
+
+    def tearDown(self):
+        self.probe.server.server_close()
+        super().tearDown()
+
+    def test_healthz_depende_del_escritor(self):
+        self.assertEqual(self.probe.check('/healthz')[0], 503)
+        self.writer.start()
+        self.assertEqual(self.probe.check('/healthz')[0], 200)
+        self.writer.stop()
+
+    def test_readyz_requiere_conexion(self):
+        self.assertEqual(self.probe.check('/readyz')[0], 503)
+        self.health.set_connected(True)
+        status, estado = self.probe.check('/readyz')
+        self.assertEqual(status, 200)
+        self.assertEqual(estado['spool_pendientes'], 0)
+
+    @override_settings(MQTT_READY_MAX_LAG=-1)
+    def test_readyz_con_spool_atrasado(self):
+        self.health.set_connected(True)
+        self.encolar(1)
+        self.assertEqual(self.probe.check('/readyz')[0], 503)
+
+    def test_readyz_deteniendo(self):
+        self.health.set_connected(True)
+        self.health.stopping = True
+        self.assertEqual(self.probe.check('/readyz')[0], 503)
+
+    def test_ruta_desconocida(self):
+        self.assertEqual(self.probe.check('/')[0], 404)
+
+
+class SpoolWriterDrainTests(SpoolTestMixin, SimpleTestCase):
+    def test_drain_vacia_el_spool(self):
+        self.encolar(5)
+        writer = AckWriter(self.spool)
+        writer.start()
+        self.assertTrue(writer.drain(5))
+        writer.stop()
+        self.assertEqual(self.spool.pending, 0)
+
+    def test_drain_sin_escritor_vivo(self):
+        self.encolar(2)
+        self.assertFalse(AckWriter(self.spool).drain(1))
+        self.assertEqual(self.spool.pending, 2)
+
+
+class ScriptedWriter(SpoolWriter):
+    """Escritor cuyo flush lanza, en orden, las excepciones del guion y luego confirma"""
+
+    def __init__(self, spool, errores):
+        super().__init__(spool)
+        self.max_backoff = 0.05
+        self.errores = list(errores)
+
+    def flush(self, rows):
+        if self.errores:
+            raise self.errores.pop(0)
+        self.spool.ack([row[0] for row in rows])
+
+
+class SpoolWriterRobustnessTests(SpoolTestMixin, SimpleTestCase):
+    def esperar_vacio(self, writer, timeout=5):
+        deadline = time.monotonic() + timeout
+        while self.spool.pending and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+    def test_bd_caida_durante_reintento_fila_por_fila(self):
+        self.encolar(3)
+        writer = ScriptedWriter(self.spool, [IntegrityError('dup'), OperationalError('bd caída')])
+        with self.assertLogs('location.spool', 'ERROR'):
+            writer.start()
+            self.esperar_vacio(writer)
+        self.assertTrue(writer.is_alive())
+        self.assertEqual(self.spool.pending, 0)
+        self.assertEqual(self.spool.stats()[RECHAZADOS], 0)
+        writer.stop()
+
+    def test_error_inesperado_no_mata_el_hilo(self):
+        self.encolar(2)
+        writer = ScriptedWriter(self.spool, [TypeError('bug'), TypeError('bug')])
+        with self.assertLogs('location.spool', 'ERROR'):
+            writer.start()
+            self.esperar_vacio(writer)
+        self.assertTrue(writer.is_alive())
+        # El lote se reintenta fila por fila: la fila que sigue fallando se descarta
+        self.assertEqual(self.spool.stats()[RECHAZADOS], 1)
+        writer.stop()
+
+    def test_spool_exclusivo(self):
+        path = Path(self.tmp.name) / 'propio.sqlite3'
+        dueño = LocationSpool(path, exclusive=True)
+        with self.assertRaises(SpoolLocked):
+            LocationSpool(path, exclusive=True)
+        dueño.close()
+        LocationSpool(path, exclusive=True).close()
+
+
+class ParseFixTests(SimpleTestCase):
+    def parse(self, data, received_at='2026-01-01T00:00:00+00:00'):
+        return parse_fix(json.dumps(data), received_at)
+
+    def test_mascota_como_texto(self):
+        fix = self.parse({'mascota': '5', 'latitude': '4.6', 'longitude': -74.08})
+        self.assertEqual(fix['mascota_id'], 5)
+        self.assertEqual(fix['latitude'], 4.6)
+
+    def test_valores_invalidos(self):
+        self.assertIsNone(self.parse({'mascota': 'cinco', 'latitude': 4.6, 'longitude': -74.08}))
+        self.assertIsNone(self.parse({'mascota': 5, 'latitude': None, 'longitude': -74.08}))
+        self.assertIsNone(self.parse([1, 2, 3]))
+        self.assertIsNone(self.parse({'mascota': 5, 'latitude': 4.6, 'longitude': -74.08}, 'ayer'))
+        self.assertIsNone(parse_fix('{no es json', '2026-01-01T00:00:00+00:00'))
+
+
+def crear_mascota(nombre='Firulais'):
+    dueño = Dueño.objects.create(
+        nombre='Ana', apellido='Gómez', email=f'{nombre.lower()}@example.com',
+        telefono='3000000000', direccion='Calle 1', ciudad='Bogotá'
+    )
+    return Mascota.objects.create(
+        nombre=nombre, peso=10, edad=3, especie='Perro', raza='Criollo', dueño=dueño
+    )
+
+
+class RecentFixesTests(SimpleTestCase):
+    def test_clave_por_secuencia_o_por_hora(self):
+        momento = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        self.assertEqual(fix_key(3, 'AABB', '7', momento), ('seq', 'AABB', 7))
+        self.assertEqual(fix_key('3', None, None, momento), ('hora', 3, momento))
+        self.assertEqual(fix_key(3, 'AABB', None, momento), ('hora', 3, momento))
+        self.assertIsNone(fix_key(3))
+
+    def test_solo_cuenta_lo_registrado(self):
+        ventana = RecentFixes(max_size=10)
+        clave = ('seq', 'AABB', 1)
+        self.assertFalse(ventana.seen(clave))
+        # Sin remember (p. ej. falló el spool) la reentrega no se descarta
+        self.assertFalse(ventana.seen(clave))
+        ventana.remember(clave)
+        self.assertTrue(ventana.seen(clave))
+        self.assertEqual(ventana.duplicados, 1)
+        self.assertFalse(ventana.seen(None))
+
+    def test_ventana_acotada(self):
+        ventana = RecentFixes(max_size=2)
+        for seq in range(3):
+            ventana.remember(('seq', 'AABB', seq))
+        self.assertFalse(ventana.seen(('seq', 'AABB', 0)))
+        self.assertTrue(ventana.seen(('seq', 'AABB', 2)))
+
+
+class IdempotentIngestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mascota = crear_mascota()
+
+    def fix(self, seq, minutos=0, **extra):
+        fix = {
+            'mascota_id': self.mascota.id,
+            'latitude': 4.6,
+            'longitude': -74.08,
+            'device_time': timezone.now() - timedelta(minutes=10 - minutos),
+            'received_at': timezone.now(),
+            'device_id': 'AABBCCDDEEFF',
+            'seq': seq,
+        }
+        fix.update(extra)
+        return fix
+
+    def test_reenvio_de_lote_no_duplica(self):
+        lote = [self.fix(1), self.fix(2, minutos=1, latitude=4.6001), self.fix(2, minutos=1, latitude=4.6001)]
+        guardadas = save_locations_in_order(lote)
+        self.assertEqual(len(guardadas), 2)
+        self.assertTrue(all(location.pk for location in guardadas))
+        # Mismo (device_id, seq) con otra hora: lo resuelve el ON CONFLICT
+        self.assertEqual(save_locations_in_order([self.fix(2, minutos=5, latitude=4.6002)]), [])
+        self.assertEqual(Location.objects.filter(mascota=self.mascota).count(), 2)
+
+    def test_post_repetido_responde_ya_registrada(self):
+        data = {
+            'mascota': self.mascota.id, 'latitude': 4.6, 'longitude': -74.08,
+            'device_id': 'AABBCCDDEEFF', 'seq': 42,
+        }
+        primero = self.client.post('/location/location_list', data, content_type='application/json')
+        self.assertEqual(primero.status_code, 201)
+        segundo = self.client.post('/location/location_list', data, content_type='application/json')
+        self.assertEqual(segundo.status_code, 200)
+        self.assertEqual(segundo.data['mensaje'], 'Ubicación ya registrada')
+        self.assertEqual(segundo.data['data']['id'], primero.data['data']['id'])
+        self.assertEqual(Location.objects.filter(mascota=self.mascota).count(), 1)
+
+
+class DeadbandFilterTests(SimpleTestCase):
+    def setUp(self):
+        self.filtro = DeadbandFilter(meters=15, heartbeat_seconds=300)
+        self.t0 = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+    def test_umbral_de_distancia(self):
+        self.assertTrue(self.filtro.should_store(1, 4.6, -74.08, self.t0))
+        # ~11 m: ruido del GPS
+        self.assertFalse(self.filtro.should_store(1, 4.6001, -74.08, self.t0 + timedelta(seconds=10)))
+        # ~22 m: movimiento real
+        self.assertTrue(self.filtro.should_store(1, 4.6002, -74.08, self.t0 + timedelta(seconds=20)))
+        # Cada mascota tiene su propia referencia
+        self.assertTrue(self.filtro.should_store(2, 4.6, -74.08, self.t0))
+
+    def test_latido(self):
+        self.filtro.should_store(1, 4.6, -74.08, self.t0)
+        self.assertFalse(self.filtro.should_store(1, 4.6, -74.08, self.t0 + timedelta(seconds=299)))
+        self.assertTrue(self.filtro.should_store(1, 4.6, -74.08, self.t0 + timedelta(seconds=300)))
+
+    def test_hora_anterior_no_es_latido(self):
+        self.filtro.should_store(1, 4.6, -74.08, self.t0)
+        self.assertFalse(self.filtro.should_store(1, 4.6, -74.08, self.t0 - timedelta(hours=1)))
+
+    def test_proporcion_descartada(self):
+        for i in range(4):
+            self.filtro.should_store(1, 4.6, -74.08, self.t0 + timedelta(seconds=i))
+        stats = self.filtro.stats()
+        self.assertEqual((stats['recibidos'], stats['descartados']), (4, 3))
+        self.assertEqual(stats['proporcion_descartada'], 0.75)
+        self.assertEqual(stats['mascotas'], 1)
+
+    def test_cero_metros_desactiva(self):
+        filtro = DeadbandFilter(meters=0, heartbeat_seconds=300)
+        self.assertTrue(filtro.should_store(1, 4.6, -74.08, self.t0))
+        self.assertTrue(filtro.should_store(1, 4.6, -74.08, self.t0))
+
+
+class MobileReplayTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mascota = crear_mascota('Luna')
+
+    def test_reenvio_movil_es_ya_registrada_y_no_sin_movimiento(self):
+        data = {
+            'mascota': self.mascota.id, 'latitud': 4.61, 'longitud': -74.07,
+            'device_id': 'MOVIL-1', 'seq': 9,
+        }
+        primero = self.client.post('/location/mobile/', data, content_type='application/json')
+        self.assertEqual(primero.status_code, 201)
+        segundo = self.client.post('/location/mobile/', data, content_type='application/json')
+        self.assertEqual(segundo.status_code, 200)
+        self.assertEqual(segundo.data['mensaje'], 'Ubicación ya registrada')
+        # Un fix nuevo en el mismo lugar sí lo filtra la banda muerta
+        data['seq'] = 10
+        tercero = self.client.post('/location/mobile/', data, content_type='application/json')
+        self.assertFalse(tercero.data['almacenada'])
+
+
+T0 = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def fix_en(segundos, latitude, longitude=-74.08, mascota_id=1, **extra):
+    fix = {
+        'mascota_id': mascota_id,
+        'latitude': latitude,
+        'longitude': longitude,
+        'device_time': T0 + timedelta(seconds=segundos),
+        'received_at': T0 + timedelta(seconds=segundos + 1),
+    }
+    fix.update(extra)
+    return fix
+
+
+def motivos(rechazados):
+    return [(fix['latitude'], motivo) for fix, motivo, _ in rechazados]
+
+
+@override_settings(LOCATION_MAX_SPEED_MPS=40, LOCATION_MAX_HDOP=5, LOCATION_MIN_SATELLITES=4)
+class ValidateFixesTests(SimpleTestCase):
+    def test_chequeos_estaticos(self):
+        lote = [
+            fix_en(0, 91.0),
+            fix_en(10, 0.0, 0.0),
+            fix_en(20, 4.6, hdop=9.9),
+            fix_en(30, 4.6001, satelites=3),
+            fix_en(40, 4.6002, hdop=1.2, satelites=8),
+        ]
+        aceptados, rechazados = validate_fixes(lote, {})
+        self.assertEqual([f['latitude'] for f in aceptados], [4.6002])
+        self.assertEqual(motivos(rechazados), [
+            (91.0, LocationQuarantine.MOTIVO_FUERA_DE_RANGO),
+            (0.0, LocationQuarantine.MOTIVO_ORIGEN),
+            (4.6, LocationQuarantine.MOTIVO_HDOP),
+            (4.6001, LocationQuarantine.MOTIVO_SATELITES),
+        ])
+
+    def test_pico_aislado(self):
+        lote = [fix_en(0, 4.6), fix_en(10, 4.7), fix_en(20, 4.6001)]
+        aceptados, rechazados = validate_fixes(lote, {})
+        self.assertEqual([f['latitude'] for f in aceptados], [4.6, 4.6001])
+        self.assertEqual(motivos(rechazados), [(4.7, LocationQuarantine.MOTIVO_VELOCIDAD)])
+
+    def test_rafaga_de_fixes_malos(self):
+        lote = [fix_en(0, 4.6), fix_en(10, 4.7), fix_en(20, 4.7001), fix_en(30, 4.6002)]
+        aceptados, rechazados = validate_fixes(lote, {})
+        self.assertEqual([f['latitude'] for f in aceptados], [4.6, 4.6002])
+        self.assertEqual([lat for lat, _ in motivos(rechazados)], [4.7, 4.7001])
+
+    def test_ultimo_fix_contra_el_guardado(self):
+        previos = {1: (4.6, -74.08, T0.timestamp())}
+        aceptados, rechazados = validate_fixes([fix_en(10, 4.7)], previos)
+        self.assertEqual(aceptados, [])
+        self.assertEqual(motivos(rechazados), [(4.7, LocationQuarantine.MOTIVO_VELOCIDAD)])
+
+    def test_independiente_del_tamano_del_lote(self):
+        lote = [fix_en(0, 4.6), fix_en(10, 4.7), fix_en(20, 4.7001), fix_en(30, 4.6002), fix_en(40, 4.6003)]
+        _, rechazados_juntos = validate_fixes(lote, {})
+        rechazados_separados = []
+        previos = {}
+        for fix in lote:
+            aceptados, rechazados = validate_fixes([fix], previos)
+            rechazados_separados += rechazados
+            for ok in aceptados:
+                previos[1] = (ok['latitude'], ok['longitude'], ok['device_time'].timestamp())
+        self.assertEqual(motivos(rechazados_juntos), motivos(rechazados_separados))
+
+    def test_mascotas_independientes(self):
+        lote = [
+            fix_en(0, 4.6, mascota_id=1),
+            fix_en(0, 6.2, mascota_id=2),
+            fix_en(10, 4.6001, mascota_id=1),
+            fix_en(10, 6.3, mascota_id=2),
+        ]
+        aceptados, rechazados = validate_fixes(lote, {})
+        self.assertEqual(len(aceptados), 3)
+        self.assertEqual([(f['mascota_id'], f['latitude']) for f, _, _ in rechazados], [(2, 6.3)])
+
+    def test_movimiento_real_se_acepta(self):
+        # 30 m cada 10 s: 3 m/s, un perro corriendo
+        lote = [fix_en(10 * i, 4.6 + i * 0.00027) for i in range(20)]
+        aceptados, rechazados = validate_fixes(lote, {})
+        self.assertEqual(len(aceptados), 20)
+        self.assertEqual(rechazados, [])
+
+
+class RestValidationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mascota = crear_mascota('Toby')
+
+    def test_rest_rechaza_origen_y_lo_pone_en_cuarentena(self):
+        data = {'mascota': self.mascota.id, 'latitud': 0, 'longitud': 0}
+        response = self.client.post('/location/mobile/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.data['motivo'], LocationQuarantine.MOTIVO_ORIGEN)
+        self.assertFalse(Location.objects.filter(mascota=self.mascota).exists())
+        self.assertEqual(LocationQuarantine.objects.filter(mascota=self.mascota).count(), 1)
+
+
+class LateFixTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mascota = crear_mascota('Kira')
+
+    def setUp(self):
+        self.inicio = timezone.now() - timedelta(hours=1)
+
+    def fix(self, minutos, latitude):
+        return {
+            'mascota_id': self.mascota.id,
+            'latitude': latitude,
+            'longitude': -74.08,
+            'device_time': self.inicio + timedelta(minutes=minutos),
+            'received_at': timezone.now(),
+            'device_id': None,
+            'seq': None,
+        }
+
+    def test_fixes_tardios_entran_como_historial(self):
+        # Un worker guarda primero el fix más reciente; otro vacía después su spool con fixes anteriores
+        save_locations_in_order([self.fix(30, 4.6003)])
+        tardios = [self.fix(10, 4.6001), self.fix(20, 4.6002), self.fix(40, 4.6004)]
+        self.assertEqual(len(save_locations_in_order(tardios)), 3)
+        # La misma hora otra vez es un reenvío
+        self.assertEqual(save_locations_in_order([self.fix(10, 4.6001)]), [])
+
+        historial = list(
+            Location.objects.filter(mascota=self.mascota).order_by('-created_at').values_list('latitude', flat=True)
+        )
+        self.assertEqual(historial, [4.6004, 4.6003, 4.6002, 4.6001])
+
+
+class FastPathTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mascota = crear_mascota('Rocky')
+        Location.objects.create(mascota=cls.mascota, latitude=4.6097102, longitude=-74.0817500)
+        Location.objects.create(
+            mascota=cls.mascota, latitude=-33.4489, longitude=-70.6693,
+            device_time=timezone.now() - timedelta(seconds=3), received_at=timezone.now()
+        )
+
+    def test_salida_identica_al_serializer(self):
+        queryset = Location.objects.filter(mascota=self.mascota).order_by('-created_at')
+        rapida = ORJSONRenderer().render(render_locations(queryset.values_list(*FAST_FIELDS)))
+        serializer = JSONRenderer().render(LocationSerializer(queryset, many=True).data)
+        self.assertEqual(rapida, serializer)
+        # Incluye una fila con device_time nulo
+        self.assertIn(b'"device_time":null', rapida)
+
+
+class LocationQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(3):
+            mascota = crear_mascota(f'Presupuesto{i}')
+            for j in range(4):
+                Location.objects.create(
+                    mascota=mascota, latitude=4.6 + j / 1000, longitude=-74.08,
+                    device_time=timezone.now() - timedelta(seconds=5), received_at=timezone.now()
+                )
+        cls.mascota = mascota
+
+    def test_lista_reciente(self):
+        response = self.assertWithinQueryBudget('/location/location_list')
+        self.assertEqual(len(response.data), 12)
+
+    def test_historial_de_una_mascota(self):
+        response = self.assertWithinQueryBudget('/location/location_list', data={'mascota_id': self.mascota.id})
+        self.assertEqual(len(response.data), 4)
+
+    def test_ultima_ubicacion(self):
+        response = self.assertWithinQueryBudget(
+            '/location/location_list', data={'mascota_id': self.mascota.id, 'ultima': 'true'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['mascota'], self.mascota.id)
+
+    def test_latest(self):
+        primera = Location.objects.order_by('id').values_list('id', flat=True).first()
+        response = self.assertWithinQueryBudget('/location/latest', data={'last_id': primera})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 11)
+
+    def test_reporte_de_latencia(self):
+        response = self.assertWithinQueryBudget('/location/latencia')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['etapas']), len(latency_tracker.summary()))
+
+
+class LatestWinsTests(SpoolTestMixin, SimpleTestCase):
+    @override_settings(LOCATION_BACKLOG_THRESHOLD=5, LOCATION_SPOOL_HISTORY_BATCH_SIZE=100)
+    def test_con_backlog_primero_la_ultima_de_cada_mascota(self):
+        for i in range(4):
+            self.encolar(1, mascota=1)
+            self.encolar(1, mascota='2')
+        writer = SpoolWriter(self.spool)
+        rows, en_vivo = writer.next_batch()
+        self.assertTrue(en_vivo)
+        self.assertTrue(writer.backlog_mode)
+        self.assertEqual([row[0] for row in rows], [7, 8])
+
+        # Tras guardar la pasada en vivo, el resto sale en orden de llegada como historial
+        writer._live_watermark = rows[-1][0]
+        rows, en_vivo = writer.next_batch()
+        self.assertFalse(en_vivo)
+        self.assertEqual(len(rows), 8)
+
+        # Un fix nuevo vuelve a tener prioridad
+        self.encolar(1, mascota=1)
+        rows, en_vivo = writer.next_batch()
+        self.assertTrue(en_vivo)
+        self.assertEqual([row[0] for row in rows], [9])
+
+    @override_settings(LOCATION_BACKLOG_THRESHOLD=5)
+    def test_sin_backlog_orden_de_llegada(self):
+        self.encolar(3)
+        rows, en_vivo = SpoolWriter(self.spool).next_batch()
+        self.assertFalse(en_vivo)
+        self.assertEqual([row[0] for row in rows], [1, 2, 3])
+
+
+class HistoryPathTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mascota = crear_mascota('Max')
+
+    def test_historial_sin_hora_del_collar_no_pisa_la_ultima_posicion(self):
+        ahora = timezone.now()
+
+        def fix(segundos_atras, latitude):
+            return {
+                'mascota_id': self.mascota.id, 'latitude': latitude, 'longitude': -74.08,
+                'device_time': None, 'received_at': ahora - timedelta(seconds=segundos_atras),
+                'device_id': None, 'seq': None,
+            }
+
+        # Pasada en vivo: el fix más nuevo; después el historial atrasado
+        save_locations_in_order([fix(0, 4.6003)])
+        save_locations_in_order([fix(30, 4.6001), fix(20, 4.6002)])
+        ultima = Location.objects.filter(mascota=self.mascota).order_by('-created_at').first()
+        self.assertEqual(ultima.latitude, 4.6003)
+        self.assertEqual(Location.objects.filter(mascota=self.mascota).count(), 3)
+
+
+@override_settings(
+    LOCATION_STATIONARY_SPEED_MPS=0.3, LOCATION_RUNNING_SPEED_MPS=2.5,
+    LOCATION_INTERVAL_STATIONARY=60, LOCATION_INTERVAL_WALKING=15,
+    LOCATION_INTERVAL_RUNNING=5, LOCATION_INTERVAL_ALERT=5,
+)
+class ReportingControllerTests(SimpleTestCase):
+    def setUp(self):
+        self.control = ReportingController(min_change_seconds=30)
+        self.t0 = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+    def recorrer(self, metros_por_fix, segundos, n, device='AA'):
+        """n fixes separados ``segundos`` avanzando ``metros_por_fix`` hacia el norte"""
+        comandos = []
+        for i in range(n):
+            latitude = 4.6 + i * metros_por_fix / 111_195
+            comando = self.control.observe(device, latitude, -74.08, self.t0 + timedelta(seconds=i * segundos))
+            if comando is not None:
+                comandos.append(comando)
+        return comandos
+
+    def test_niveles_por_velocidad(self):
+        self.assertEqual(recommended_interval(0.0), 60)
+        self.assertEqual(recommended_interval(1.2), 15)
+        self.assertEqual(recommended_interval(6.0), 5)
+        self.assertEqual(recommended_interval(0.0, alerta=True), 5)
+
+    def test_quieta_espacia_y_corriendo_acelera(self):
+        self.assertEqual(self.recorrer(0, 10, 5), [60])
+        self.control.observe('AA', 4.6, -74.08, self.t0 + timedelta(seconds=60))
+        # Corriendo ~8 m/s: el cambio a más rápido no espera
+        comando = self.control.observe('AA', 4.6 + 80 / 111_195, -74.08, self.t0 + timedelta(seconds=70))
+        self.assertEqual(comando, 5)
+
+    def test_no_reenvia_el_intervalo_que_el_collar_ya_usa(self):
+        self.control.observe('AA', 4.6, -74.08, self.t0, intervalo_reportado=60)
+        self.assertIsNone(self.control.observe('AA', 4.6, -74.08, self.t0 + timedelta(seconds=60), 60))
+        self.assertEqual(self.control.comandos, 0)
+
+    def test_espera_antes_de_espaciar(self):
+        self.control.observe('AA', 4.6, -74.08, self.t0, intervalo_reportado=60)
+        self.assertEqual(self.control.observe('AA', 4.6 + 80 / 111_195, -74.08, self.t0 + timedelta(seconds=10)), 5)
+        # Se detiene enseguida: la velocidad suavizada baja, pero sin pasar min_change_seconds no se espacia
+        t = self.t0 + timedelta(seconds=10)
+        for segundos in (5, 10, 15):
+            self.assertIsNone(self.control.observe('AA', 4.6 + 80 / 111_195, -74.08, t + timedelta(seconds=segundos)))
+        comandos = [
+            self.control.observe('AA', 4.6 + 80 / 111_195, -74.08, t + timedelta(seconds=segundos))
+            for segundos in (60, 120, 180, 240)
+        ]
+        self.assertEqual([c for c in comandos if c is not None][-1], 60)
+
+    def test_alerta_fuerza_el_intervalo_rapido(self):
+        self.control.observe('AA', 4.6, -74.08, self.t0, intervalo_reportado=60)
+        self.control.set_alert('AA', self.t0 + timedelta(minutes=5))
+        self.assertEqual(self.control.observe('AA', 4.6, -74.08, self.t0 + timedelta(seconds=60)), 5)
+
+    def test_fix_fuera_de_orden_no_cambia_nada(self):
+        self.recorrer(0, 10, 3)
+        self.assertIsNone(self.control.observe('AA', 5.0, -74.08, self.t0))
+        self.assertEqual(self.control.current_intervals()['AA'], (60, 0.0))
+
+
+class DeviceStatusTests(QueryBudgetTestMixin, TestCase):
+    def estado(self, device_id, segundos_atras, **campos):
+        data = {'tipo': 'heartbeat', 'device_id': device_id, 'mascota': 3, 'version': '1.2.0', **campos}
+        return parse_status(data, timezone.now() - timedelta(seconds=segundos_atras))
+
+    def test_solo_heartbeats_y_conexiones(self):
+        self.assertIsNone(parse_status({'comando': 'pong', 'cliente_id': 'ESP32_Mascota_3'}, timezone.now()))
+        self.assertIsNone(parse_status({'tipo': 'heartbeat'}, timezone.now()))
+        # Firmware sin device_id: se identifica por el client id; valores absurdos quedan vacíos
+        estado = parse_status({'tipo': 'conexion', 'cliente_id': 'ESP32_Mascota_3', 'rssi': 20}, timezone.now())
+        self.assertEqual((estado.device_id, estado.rssi), ('ESP32_Mascota_3', None))
+
+    def test_degradados(self):
+        estados = [
+            # Buena señal y sin fallos
+            self.estado('BUENO', 30, rssi=-55, fallos_publicacion=2),
+            self.estado('BUENO', 90, rssi=-58, fallos_publicacion=2),
+            # Señal baja, se reconecta y acumula fallos al publicar
+            self.estado('MALO', 30, rssi=-88, fallos_publicacion=9),
+            self.estado('MALO', 90, rssi=-85, fallos_publicacion=1),
+        ] + [self.estado('MALO', 60 + i, tipo='conexion', rssi=-90) for i in range(3)]
+        DeviceStatus.objects.bulk_create(estados)
+
+        response = self.assertWithinQueryBudget('/location/dispositivos/degradados', data={'minutos': 10})
+        self.assertEqual(response.data['total'], 1)
+        malo = response.data['dispositivos'][0]
+        self.assertEqual(malo['device_id'], 'MALO')
+        self.assertEqual(malo['motivos'], ['senal_baja', 'reconexiones', 'fallos_publicacion'])
+        self.assertEqual((malo['fallos_publicacion'], malo['version']), (8, '1.2.0'))
+
+        response = self.assertWithinQueryBudget('/location/dispositivos', data={'minutos': 10})
+        self.assertEqual([d['device_id'] for d in response.data['dispositivos']], ['BUENO', 'MALO'])
+
+
+class DeviceStatusWriterTests(TransactionTestCase):
+    # El escritor renueva la conexión (close_old_connections), imposible dentro del atomic de TestCase
+    def test_guarda_por_lotes_y_reintenta(self):
+        writer = DeviceStatusWriter(flush_seconds=60)
+        for i in range(3):
+            writer.add(parse_status({'tipo': 'heartbeat', 'device_id': 'AA', 'rssi': -60}, timezone.now()))
+        self.assertEqual(writer.flush(), 3)
+        self.assertEqual(DeviceStatus.objects.count(), 3)
+        self.assertEqual(writer.flush(), 0)
+
+    def test_bd_caida_conserva_los_estados(self):
+        writer = DeviceStatusWriter(flush_seconds=60, buffer_size=2)
+        for rssi in (-60, -61):
+            writer.add(parse_status({'tipo': 'heartbeat', 'device_id': 'AA', 'rssi': rssi}, timezone.now()))
+        with mock.patch.object(DeviceStatus.objects, 'bulk_create', side_effect=OperationalError('caída')):
+            with self.assertLogs('location.telemetry', 'ERROR'):
+                self.assertEqual(writer.flush(), 0)
+        writer.add(parse_status({'tipo': 'heartbeat', 'device_id': 'AA', 'rssi': -62}, timezone.now()))
+        # Buffer lleno: se pierde el más antiguo
+        self.assertEqual([estado.rssi for estado in writer.buffer], [-61, -62])
+
+
+class AsyncViewsTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mascota = crear_mascota('Async')
+        for j in range(3):
+            Location.objects.create(
+                mascota=cls.mascota, latitude=4.6 + j / 1000, longitude=-74.08,
+                device_time=timezone.now() - timedelta(seconds=5), received_at=timezone.now()
+            )
+
+    def test_misma_salida_que_las_vistas_sync(self):
+        primera = Location.objects.order_by('id').values_list('id', flat=True).first()
+        casos = [
+            ('/location/location_list', {}),
+            ('/location/location_list', {'mascota_id': self.mascota.id, 'ultima': 'true'}),
+            ('/location/latest', {'last_id': primera}),
+        ]
+        for path, data in casos:
+            with self.subTest(path=path, data=data):
+                sync = self.client.get(path, data)
+                asincrona = self.assertWithinQueryBudget(path.replace('/location/', '/location/async/'), data=data)
+                self.assertEqual(asincrona.status_code, 200)
+                self.assertEqual(json.loads(asincrona.content), json.loads(sync.content))
+        detalle = self.client.get(f'/location/async/{self.mascota.id}/', {'ultima': 'true'})
+        self.assertEqual(json.loads(detalle.content)['mascota'], self.mascota.id)
+
+    async def test_mobile_async(self):
+        data = {'mascota': self.mascota.id, 'latitud': 4.6025, 'longitud': -74.08, 'device_id': 'ASYNC-1', 'seq': 1}
+        primero = await self.async_client.post('/location/async/mobile/', data, content_type='application/json')
+        self.assertEqual(primero.status_code, 201)
+        segundo = await self.async_client.post('/location/async/mobile/', data, content_type='application/json')
+        self.assertEqual(json.loads(segundo.content)['mensaje'], 'Ubicación ya registrada')
+        origen = {'mascota': self.mascota.id, 'latitud': 0, 'longitud': 0}
+        rechazado = await self.async_client.post('/location/async/mobile/', origen, content_type='application/json')
+        self.assertEqual(rechazado.status_code, 422)
+        self.assertEqual(await Location.objects.filter(device_id='ASYNC-1').acount(), 1)
+
+
+def fila(pk, mascota_id, segundos_atras, latitude=4.6):
+    """Tupla de FAST_FIELDS como las que guarda el buffer"""
+    momento = timezone.now() - timedelta(seconds=segundos_atras)
+    return (pk, mascota_id, latitude, -74.08, momento, None, momento)
+
+
+class RecentTracksTests(SimpleTestCase):
+    def setUp(self):
+        self.tracks = RecentTracks(size=3)
+
+    def test_sin_sincronizar_no_responde(self):
+        self.tracks.add([fila(1, 1, 10)])
+        self.assertIsNone(self.tracks.recent(30))
+        self.assertEqual(self.tracks.last(1), (False, None))
+
+    def test_ventana_last_id_y_limite(self):
+        self.tracks.reset(synced_since=timezone.now() - timedelta(minutes=60))
+        self.tracks.add([fila(1, 1, 50), fila(2, 2, 40), fila(3, 1, 30), fila(4, 2, 20), fila(5, 1, 5000)])
+        self.assertEqual([row[0] for row in self.tracks.recent(30)], [4, 3, 2, 1])
+        self.assertEqual([row[0] for row in self.tracks.recent(30, last_id=2)], [4, 3])
+        self.assertEqual([row[0] for row in self.tracks.recent(30, limit=2)], [4, 3])
+        self.assertEqual([row[0] for row in self.tracks.recent(30, mascota_id='2')], [4, 2])
+        # Mascota sin fixes recientes: ventana vacía, sin ir a la BD
+        self.assertEqual(self.tracks.recent(30, mascota_id=9), [])
+        # Más allá de la precarga no hay garantía
+        self.assertIsNone(self.tracks.recent(120))
+
+    def test_desborde_obliga_a_ir_a_la_bd(self):
+        self.tracks.reset(synced_since=timezone.now() - timedelta(minutes=60))
+        self.tracks.add([fila(i, 1, segundos) for i, segundos in enumerate((200, 150, 50, 40, 30))])
+        # Se expulsaron los fixes de hace 200 y 150 s: la ventana de 1 minuto sigue cubierta, la de 3 no
+        self.assertEqual([row[0] for row in self.tracks.recent(1)], [4, 3, 2])
+        self.assertIsNone(self.tracks.recent(3))
+
+    def test_fix_tardio_y_ultima(self):
+        self.tracks.reset(synced_since=timezone.now() - timedelta(minutes=60))
+        self.tracks.add([fila(1, 1, 10), fila(2, 1, 60)])
+        self.assertEqual(self.tracks.last(1)[1][0], 1)
+        self.assertEqual([row[0] for row in self.tracks.recent(30)], [1, 2])
+        self.tracks.add([fila(1, 1, 10)])
+        self.assertEqual(self.tracks.stats()['fixes'], 2)
+
+
+class RecentTracksViewTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mascota = crear_mascota('Buffer')
+        for j in range(3):
+            Location.objects.create(
+                mascota=cls.mascota, latitude=4.6 + j / 1000, longitude=-74.08, received_at=timezone.now()
+            )
+
+    def tearDown(self):
+        recent_tracks.reset()
+        super().tearDown()
+
+    def test_polls_sin_consultas_con_el_buffer_precargado(self):
+        primera = Location.objects.order_by('id').values_list('id', flat=True).first()
+        casos = [
+            ('/location/latest', {'last_id': primera}),
+            ('/location/location_list', {'mascota_id': self.mascota.id}),
+            ('/location/location_list', {'mascota_id': self.mascota.id, 'ultima': 'true'}),
+            ('/location/async/latest', {'last_id': primera}),
+        ]
+        desde_bd = [self.client.get(path, data).content for path, data in casos]
+        RecentTracksListener(recent_tracks).warm()
+        for (path, data), esperado in zip(casos, desde_bd):
+            with self.subTest(path=path, data=data), self.assertNumQueries(0):
+                self.assertEqual(self.client.get(path, data).content, esperado)
+
+
+class RecentTracksListenerTests(TransactionTestCase):
+    def test_la_ingesta_alimenta_el_buffer_de_otro_hilo(self):
+        mascota = crear_mascota('Aviso')
+        tracks = RecentTracks(size=10)
+        listener = RecentTracksListener(tracks)
+        listener.start()
+        try:
+            limite = time.time() + 10
+            while tracks.synced_since is None and time.time() < limite:
+                time.sleep(0.05)
+            self.assertIsNotNone(tracks.synced_since)
+            creada = save_locations_in_order([{
+                'mascota_id': mascota.id, 'latitude': 4.6, 'longitude': -74.08,
+                'device_time': None, 'received_at': timezone.now(), 'device_id': None, 'seq': None,
+            }])[0]
+            while not tracks.last(mascota.id)[0] and time.time() < limite:
+                time.sleep(0.05)
+            self.assertEqual(tracks.last(mascota.id)[1][0], creada.pk)
+        finally:
+            listener.stop()
+            listener.join(10)
+
+
+class FleetSnapshotTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.t0 = timezone.now().replace(microsecond=0) - timedelta(hours=2)
+        cls.mascotas = [crear_mascota(f'Flota{i}') for i in range(3)]
+        # Cada mascota reporta cada 10 minutos desde t0, empezando desfasada i minutos
+        for i, mascota in enumerate(cls.mascotas):
+            for j in range(6):
+                location = Location.objects.create(mascota=mascota, latitude=4.6 + j / 1000, longitude=-74.08 - i / 1000)
+                Location.objects.filter(pk=location.pk).update(created_at=cls.t0 + timedelta(minutes=10 * j + i))
+
+    def test_ultima_posicion_de_cada_mascota_en_el_momento(self):
+        momento = self.t0 + timedelta(minutes=21)
+        response = self.assertWithinQueryBudget('/location/snapshot', data={'momento': momento.isoformat()})
+        self.assertEqual(response.data['total'], 3)
+        for ubicacion in response.data['ubicaciones']:
+            esperada = Location.objects.filter(
+                mascota_id=ubicacion['mascota'], created_at__lte=momento
+            ).order_by('-created_at').first()
+            self.assertEqual(ubicacion['id'], esperada.id)
+        # La tercera mascota aún no reportaba en t0
+        response = self.client.get('/location/snapshot', {'momento': self.t0.isoformat()})
+        self.assertEqual([u['mascota'] for u in response.data['ubicaciones']], [self.mascotas[0].id])
+        # Con max_edad quedan fuera los fixes viejos
+        response = self.client.get('/location/snapshot', {'momento': (self.t0 + timedelta(minutes=58)).isoformat(), 'max_edad': 8})
+        self.assertEqual([u['mascota'] for u in response.data['ubicaciones']], [m.id for m in self.mascotas[1:]])
+
+    def test_reproduccion_en_ndjson(self):
+        desde, hasta = self.t0 + timedelta(minutes=5), self.t0 + timedelta(minutes=35)
+        with self.assertNumQueries(2):
+            response = self.client.get('/location/playback', {
+                'desde': desde.isoformat(), 'hasta': hasta.isoformat(), 'paso': 300
+            })
+            fotos = [json.loads(linea) for linea in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(len(fotos), 7)
+        for foto, k in zip(fotos, range(7)):
+            momento = desde + timedelta(minutes=5 * k)
+            esperadas = render_locations(
+                Location.objects.filter(created_at__lte=momento).order_by('mascota_id', '-created_at')
+                .distinct('mascota_id').values_list(*FAST_FIELDS)
+            )
+            self.assertEqual(foto['ubicaciones'], esperadas)
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get('/location/playback', {'desde': '2024-01-01'}).status_code, 400)
+        self.assertEqual(self.client.get('/location/snapshot', {'momento': 'ayer'}).status_code, 400)
+        response = self.client.get('/location/playback', {'desde': '2024-01-01', 'hasta': '2024-01-31', 'paso': 1})
+        self.assertEqual(response.status_code, 400)
+
+
+class ResampleTests(SimpleTestCase):
+    def test_lineal_con_huecos(self):
+        t = np.array([0, 10, 20, 500, 510], dtype=float)
+        lat = np.array([4.600, 4.601, 4.602, 4.700, 4.701])
+        lon = np.full(5, -74.08)
+        muestras = np.arange(-5, 516, 5, dtype=float)
+        latitudes, _ = resample(t, lat, lon, muestras, max_hueco=120)
+        por_t = dict(zip(muestras.tolist(), latitudes.tolist()))
+        self.assertAlmostEqual(por_t[5.0], 4.6005)
+        self.assertAlmostEqual(por_t[20.0], 4.602)
+        self.assertAlmostEqual(por_t[510.0], 4.701)
+        # Antes del primer fix, en el hueco con movimiento y después del último: sin posición
+        for instante in (-5.0, 25.0, 495.0, 515.0):
+            self.assertTrue(np.isnan(por_t[instante]), instante)
+
+    def test_mascota_quieta_no_es_hueco(self):
+        # Dos latidos del filtro de movimiento, 5 m de distancia
+        t = np.array([0, 300], dtype=float)
+        latitudes, _ = resample(t, np.array([4.6, 4.600045]), np.array([-74.08, -74.08]), np.array([150.0]), 120)
+        self.assertFalse(np.isnan(latitudes[0]))
+
+    def test_geodesico(self):
+        t = np.array([0, 10], dtype=float)
+        mitad = np.array([5.0])
+        # En un tramo corto coincide con la interpolación lineal
+        corto = [resample(t, np.array([4.6, 4.61]), np.array([-74.08, -74.07]), mitad, 120, metodo)
+                 for metodo in ('lineal', 'geodesico')]
+        self.assertAlmostEqual(corto[0][0][0], corto[1][0][0], places=6)
+        self.assertAlmostEqual(corto[0][1][0], corto[1][1][0], places=6)
+        # El círculo máximo entre dos puntos del paralelo 45 pasa más al norte
+        lat, lon = resample(t, np.array([45.0, 45.0]), np.array([0.0, 90.0]), mitad, 120, 'geodesico')
+        self.assertAlmostEqual(lat[0], 54.7356, places=3)
+        self.assertAlmostEqual(lon[0], 45.0)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ResampledTrackViewTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mascota = crear_mascota('Trayecto')
+        cls.t0 = timezone.now().replace(microsecond=0) - timedelta(hours=3)
+        for segundos, latitude in ((0, 4.600), (20, 4.602), (40, 4.604)):
+            location = Location.objects.create(mascota=cls.mascota, latitude=latitude, longitude=-74.08)
+            Location.objects.filter(pk=location.pk).update(created_at=cls.t0 + timedelta(seconds=segundos))
+
+    def setUp(self):
+        cache.clear()
+
+    def pedir(self):
+        return self.client.get(f'/location/{self.mascota.id}/trayecto', {
+            'desde': self.t0.isoformat(), 'hasta': (self.t0 + timedelta(seconds=60)).isoformat(), 'paso': 10,
+        })
+
+    def test_trayecto_remuestreado_y_cacheado(self):
+        with self.assertNumQueries(1):
+            datos = json.loads(self.pedir().content)
+        self.assertEqual(datos['muestras'], 7)
+        self.assertEqual(datos['latitudes'], [4.6, 4.601, 4.602, 4.603, 4.604, None, None])
+        self.assertEqual(len(datos['huecos']), 1)
+        # La segunda reproducción sale de la caché
+        with self.assertNumQueries(0):
+            self.assertEqual(json.loads(self.pedir().content), datos)
+
+    def test_fix_tardio_invalida_la_cache(self):
+        self.pedir()
+        with self.captureOnCommitCallbacks(execute=True):
+            save_locations_in_order([{
+                'mascota_id': self.mascota.id, 'latitude': 4.6045, 'longitude': -74.08,
+                'device_time': self.t0 + timedelta(seconds=30), 'received_at': timezone.now(),
+                'device_id': None, 'seq': None,
+            }])
+        datos = json.loads(self.pedir().content)
+        self.assertEqual(datos['latitudes'][3], 4.6045)
+
+    def test_parametros(self):
+        url = f'/location/{self.mascota.id}/trayecto'
+        self.assertEqual(self.client.get(url, {'metodo': 'spline'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'paso': 0}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'paso': 0.001}).status_code, 400)
+        self.assertWithinQueryBudget(url)
+
+
+def tesela(lat, lon, z):
+    """x, y de la tesela que contiene el punto"""
+    n = 2 ** z
+    y = (1 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2 * n
+    return int((lon + 180) / 360 * n), int(y)
+
+
+class HeatmapTests(SimpleTestCase):
+    def test_histograma_igual_al_conteo_punto_a_punto(self):
+        z, bins = 14, 16
+        x, y = tesela(4.6, -74.08, z)
+        lat_min, lat_max, lon_min, lon_max = tile_bounds(z, x, y)
+        rng = np.random.default_rng(7)
+        lat = rng.uniform(lat_min, lat_max, 500)
+        lon = rng.uniform(lon_min, lon_max, 500)
+        esperado = np.zeros((bins, bins), dtype=np.int64)
+        for la, lo in zip(lat, lon):
+            # Fila 0 arriba: latitud decreciente entre lat_max y lat_min en Mercator
+            fy = (np.arcsinh(np.tan(np.radians(lat_max))) - np.arcsinh(np.tan(np.radians(la)))) / (
+                np.arcsinh(np.tan(np.radians(lat_max))) - np.arcsinh(np.tan(np.radians(lat_min)))
+            )
+            esperado[min(int(fy * bins), bins - 1), min(int((lo - lon_min) / (lon_max - lon_min) * bins), bins - 1)] += 1
+        np.testing.assert_array_equal(histogram(lat, lon, z, x, y, bins), esperado)
+
+    def test_los_bordes_de_la_tesela_se_cuentan(self):
+        lat_min, lat_max, lon_min, lon_max = tile_bounds(3, 2, 3)
+        conteos = histogram([lat_min, lat_max], [lon_min, lon_max], 3, 2, 3, 8)
+        self.assertEqual(conteos.sum(), 2)
+        self.assertEqual(conteos[7, 0], 1)
+        self.assertEqual(conteos[0, 7], 1)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class HeatmapTileViewTests(QueryBudgetTestMixin, TestCase):
+    Z = 14
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.mascota = crear_mascota('Calor')
+        cls.otra = crear_mascota('Frio')
+        cls.t0 = timezone.now().replace(microsecond=0) - timedelta(hours=3)
+        cls.x, cls.y = tesela(4.6, -74.08, cls.Z)
+        for i in range(10):
+            cls.crear(cls.mascota, cls.t0 + timedelta(minutes=i), 4.6 + i / 10_000)
+        cls.crear(cls.otra, cls.t0, 4.6)
+        # Fuera de la tesela
+        cls.crear(cls.mascota, cls.t0, 10.0)
+
+    @staticmethod
+    def crear(mascota, created_at, latitude, longitude=-74.08):
+        location = Location.objects.create(mascota=mascota, latitude=latitude, longitude=longitude)
+        Location.objects.filter(pk=location.pk).update(created_at=created_at)
+        return location
+
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        ajustes = override_settings(LOCATION_HEATMAP_CACHE_DIR=Path(tmp.name))
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def url(self, z=None, x=None, y=None):
+        return f'/location/heatmap/{z or self.Z}/{x or self.x}/{y or self.y}'
+
+    def pedir(self, **params):
+        params.setdefault('desde', (self.t0 - timedelta(hours=1)).isoformat())
+        params.setdefault('hasta', (self.t0 + timedelta(hours=1)).isoformat())
+        return self.client.get(self.url(), params)
+
+    def test_tesela_cacheada_en_disco(self):
+        with self.assertNumQueries(1):
+            datos = self.pedir().json()
+        self.assertEqual((datos['total'], datos['celdas']), (11, 64))
+        self.assertEqual(sum(n for _, _, n in datos['conteos']), 11)
+        # Rango cerrado: la segunda vez no consulta la base
+        with self.assertNumQueries(0):
+            self.assertEqual(self.pedir().json(), datos)
+
+    def test_alcance_mascota_y_dueno(self):
+        self.assertEqual(self.pedir(mascota=self.mascota.id).json()['total'], 10)
+        self.assertEqual(self.pedir(dueno=self.otra.dueño_id).json()['total'], 1)
+
+    def test_solo_lee_los_fixes_nuevos(self):
+        scope = Scope(self.mascota.id)
+        desde = self.t0 - timedelta(hours=1)
+        hasta = timezone.now() + timedelta(hours=1)
+        ahora = timezone.now()
+        self.assertEqual(heatmap_tile(scope, self.Z, self.x, self.y, desde, hasta, now=ahora).sum(), 10)
+        # Un fix ya contado que cambia de lugar no se relee; el nuevo sí se suma
+        Location.objects.filter(mascota=self.mascota, latitude=4.6).update(latitude=10.0)
+        self.crear(self.mascota, ahora, 4.6)
+        with self.assertNumQueries(1):
+            conteos = heatmap_tile(scope, self.Z, self.x, self.y, desde, hasta, now=ahora + timedelta(minutes=1))
+        self.assertEqual(conteos.sum(), 11)
+
+    def test_fix_tardio_recalcula_la_tesela(self):
+        self.pedir()
+        with self.captureOnCommitCallbacks(execute=True):
+            save_locations_in_order([{
+                'mascota_id': self.mascota.id, 'latitude': 4.6005, 'longitude': -74.08,
+                'device_time': self.t0 + timedelta(seconds=30), 'received_at': timezone.now(),
+                'device_id': None, 'seq': None,
+            }])
+        self.assertEqual(self.pedir().json()['total'], 12)
+
+    def test_limpieza_de_teselas_viejas(self):
+        self.pedir()
+        teselas = list(Path(settings.LOCATION_HEATMAP_CACHE_DIR).rglob('*.npz'))
+        self.assertEqual(len(teselas), 1)
+        self.assertEqual(clean_heatmap_cache(), 0)
+        viejo = time.time() - 30 * 86_400
+        os.utime(teselas[0], (viejo, viejo))
+        self.assertEqual(clean_heatmap_cache(), 1)
+        self.assertFalse(teselas[0].exists())
+
+    def test_parametros(self):
+        self.assertEqual(self.client.get(self.url(z=25)).status_code, 400)
+        self.assertEqual(self.client.get(self.url(z=2, x=4, y=1)).status_code, 400)
+        self.assertEqual(self.client.get(self.url(), {'desde': 'ayer'}).status_code, 400)
+        self.assertWithinQueryBudget(self.url())
+
+
+CASA = (4.6000, -74.0800)
+PARQUE = (4.6100, -74.0700)
+
+
+def paseo(inicio):
+    """(created_at, lat, lon) cada minuto: 20 min en casa, 5 min caminando, 20 min en el parque y 5 min de vuelta"""
+    rows = []
+    for minuto in range(50):
+        if minuto < 20:
+            lat, lon = CASA
+        elif minuto < 25:
+            f = (minuto - 19) / 6
+            lat, lon = CASA[0] + f * (PARQUE[0] - CASA[0]), CASA[1] + f * (PARQUE[1] - CASA[1])
+        elif minuto < 45:
+            lat, lon = PARQUE
+        else:
+            f = (minuto - 44) / 6
+            lat, lon = PARQUE[0] + f * (CASA[0] - PARQUE[0]), PARQUE[1] + f * (CASA[1] - PARQUE[1])
+        # Ruido del GPS de unos metros
+        rows.append((inicio + timedelta(minutes=minuto), lat + (minuto % 3) * 0.00003, lon - (minuto % 2) * 0.00003))
+    return rows
+
+
+class StayPointDetectorTests(SimpleTestCase):
+    def visitas(self, *tandas):
+        detector = StayPointDetector(radio=50, min_segundos=600, max_hueco=900)
+        estado = VisitState(mascota_id=1, fixes=0)
+        visitas = {}
+        for rows in tandas:
+            for visita in detector.feed(estado, rows):
+                visitas[id(visita)] = visita
+        return sorted(visitas.values(), key=lambda v: v.llegada)
+
+    def test_casa_y_parque(self):
+        casa, parque = self.visitas(paseo(T0))
+        self.assertFalse(casa.abierta)
+        self.assertEqual((casa.llegada, casa.salida, casa.fixes), (T0, T0 + timedelta(minutes=19), 20))
+        self.assertAlmostEqual(casa.latitude, CASA[0], places=4)
+        self.assertEqual(parque.fixes, 20)
+        self.assertAlmostEqual(parque.longitude, PARQUE[1], places=4)
+        # Al volver caminando la estancia del parque se cerró
+        self.assertFalse(parque.abierta)
+
+    def test_incremental_igual_que_de_una_vez(self):
+        rows = paseo(T0)
+        completas = self.visitas(rows)
+        por_tandas = self.visitas(rows[:7], rows[7:30], rows[30:31], rows[31:])
+        campos = lambda v: (v.llegada, v.salida, v.fixes, round(v.latitude, 9), v.abierta)
+        self.assertEqual([campos(v) for v in por_tandas], [campos(v) for v in completas])
+
+    def test_parada_corta_o_silencio(self):
+        rows = paseo(T0)
+        # Cinco minutos en el parque no son una estancia
+        self.assertEqual(len(self.visitas(rows[:25] + rows[25:30])), 1)
+        # Un silencio largo en casa corta la estancia en dos
+        visitas = self.visitas(rows[:12] + [(t + timedelta(minutes=30), lat, lon) for t, lat, lon in rows[12:20]])
+        self.assertEqual([v.fixes for v in visitas], [12])
+
+
+class DetectVisitsTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mascota = crear_mascota('Visitas')
+        cls.inicio = timezone.now().replace(microsecond=0) - timedelta(hours=2)
+
+    def guardar(self, rows):
+        for created_at, lat, lon in rows:
+            location = Location.objects.create(mascota=self.mascota, latitude=lat, longitude=lon)
+            Location.objects.filter(pk=location.pk).update(created_at=created_at)
+
+    def test_deteccion_incremental_y_endpoint(self):
+        rows = paseo(self.inicio)
+        self.guardar(rows[:37])
+        detect_visits(now=self.inicio + timedelta(minutes=37, seconds=20))
+        casa, parque = Visit.objects.filter(mascota=self.mascota).order_by('llegada')
+        self.assertEqual((casa.fixes, casa.abierta), (20, False))
+        self.assertEqual((parque.fixes, parque.abierta), (12, True))
+
+        # La corrida siguiente solo lee los fixes nuevos y extiende la misma visita
+        self.guardar(rows[37:])
+        with self.assertNumQueries(9):
+            detect_visits(now=self.inicio + timedelta(minutes=60))
+        parque.refresh_from_db()
+        self.assertEqual((parque.fixes, parque.abierta), (20, False))
+        self.assertEqual(Visit.objects.count(), 2)
+
+        response = self.assertWithinQueryBudget(
+            f'/location/{self.mascota.id}/visitas',
+            data={'desde': self.inicio.isoformat(), 'min_minutos': 15}
+        )
+        self.assertEqual([v['id'] for v in response.data], [parque.id, casa.id])
+        self.assertEqual(response.data[0]['duracion_minutos'], 19.0)
+
+    def test_visita_abierta_se_cierra_con_el_collar_en_silencio(self):
+        self.guardar(paseo(self.inicio)[:15])
+        detect_visits(now=self.inicio + timedelta(minutes=15))
+        self.assertTrue(Visit.objects.get().abierta)
+        detect_visits(now=self.inicio + timedelta(minutes=60))
+        self.assertFalse(Visit.objects.get().abierta)
+
+
+class SpatialGridTests(SimpleTestCase):
+    def test_vecinos_iguales_a_la_busqueda_exhaustiva(self):
+        rng = np.random.default_rng(7)
+        # 3000 collares en ~2 x 2 km, cruzando varias filas de la grilla
+        lat = 4.6 + rng.uniform(-0.01, 0.01, 3000)
+        lon = -74.08 + rng.uniform(-0.01, 0.01, 3000)
+        grid = SpatialGrid(50)
+        for i in range(3000):
+            grid.move(i, lat[i], lon[i])
+        for i in range(0, 3000, 150):
+            for radio in (50, 180):
+                distancias = haversine_m(lat[i], lon[i], lat, lon)
+                esperadas = sorted(j for j in np.flatnonzero(distancias <= radio).tolist() if j != i)
+                self.assertEqual(sorted(j for j, _ in grid.within(lat[i], lon[i], radio, excluir=i)), esperadas)
+
+    def test_mover_y_quitar(self):
+        grid = SpatialGrid(50)
+        grid.move('a', 4.6, -74.08)
+        grid.move('b', 4.6002, -74.08)
+        grid.move('a', 4.61, -74.08)
+        self.assertEqual([clave for clave, _ in grid.within(4.6, -74.08, 50)], ['b'])
+        grid.remove('b')
+        self.assertEqual((len(grid), grid.within(4.6, -74.08, 50)), (1, []))
+
+
+def en(segundos, mascota_id, latitude, longitude=-74.08, pk=None):
+    """Fila de FAST_FIELDS de la mascota ``segundos`` después de T0"""
+    momento = T0 + timedelta(seconds=segundos)
+    return (pk or segundos * 1000 + mascota_id, mascota_id, latitude, longitude, momento, None, momento)
+
+
+# Grados de latitud por metro
+M = 1 / 111_320
+
+
+class ProximityEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = ProximityEngine(entrada=25, salida=50, max_edad=600)
+
+    def tipos(self, eventos):
+        return [(e.tipo, e.mascota_a, e.mascota_b) for e in eventos]
+
+    def test_histeresis(self):
+        self.assertEqual(self.engine.feed([en(0, 1, 4.6), en(0, 2, 4.6 + 100 * M)]), [])
+        eventos = self.engine.feed([en(10, 2, 4.6 + 20 * M)])
+        self.assertEqual(self.tipos(eventos), [(ENCUENTRO, 1, 2)])
+        # Entre 25 y 50 m el encuentro sigue abierto sin eventos
+        for segundos, metros in ((20, 40), (30, 10), (40, 45)):
+            self.assertEqual(self.engine.feed([en(segundos, 2, 4.6 + metros * M)]), [])
+        eventos = self.engine.feed([en(50, 1, 4.6 - 30 * M)])
+        self.assertEqual(self.tipos(eventos), [(SEPARACION, 1, 2)])
+        self.assertAlmostEqual(eventos[0].distancia, 10, places=1)
+        self.assertEqual(self.engine.open_pairs(), {})
+
+    def test_mascota_sin_reportar_cierra_el_encuentro(self):
+        self.engine.feed([en(0, 1, 4.6), en(0, 2, 4.6 + 5 * M), en(0, 3, 4.7)])
+        eventos = self.engine.feed([en(700, 3, 4.7)])
+        self.assertEqual(self.tipos(eventos), [(SEPARACION, 1, 2)])
+        self.assertEqual(eventos[0].momento, T0)
+        self.assertEqual(self.engine.stats(), {'mascotas': 1, 'encuentros_abiertos': 0})
+
+    def test_mascotas_cerca(self):
+        self.engine.feed([en(0, 1, 4.6), en(0, 2, 4.6 + 30 * M), en(0, 3, 4.6 + 300 * M), en(0, 4, 4.6 - 90 * M)])
+        cercanas = self.engine.near(1, 100, now=T0 + timedelta(seconds=60))
+        self.assertEqual([(m, round(d)) for m, d, *_ in cercanas], [(2, 30), (4, 90)])
+        self.assertIsNone(self.engine.near(9, 100, now=T0))
+        self.assertIsNone(self.engine.near(1, 100, now=T0 + timedelta(hours=1)))
+
+
+class ProximityViewsTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mascotas = [crear_mascota(f'Cerca{i}') for i in range(3)]
+        for mascota, metros in zip(cls.mascotas, (0, 20, 400)):
+            Location.objects.create(mascota=mascota, latitude=4.6 + metros * M, longitude=-74.08)
+
+    def tearDown(self):
+        recent_tracks.reset()
+        super().tearDown()
+
+    def test_cercanas_desde_la_bd_y_desde_el_motor(self):
+        url = f'/location/{self.mascotas[0].id}/cercanas'
+        desde_bd = self.assertWithinQueryBudget(url, data={'radio': 100}).data
+        self.assertEqual([c['mascota'] for c in desde_bd['cercanas']], [self.mascotas[1].id])
+        self.assertEqual(desde_bd['cercanas'][0]['distancia'], 20.0)
+
+        with mock.patch('location.views.proximity_engine', ProximityEngine()) as engine:
+            engine.feed(Location.objects.values_list(*FAST_FIELDS))
+            recent_tracks.reset(synced_since=timezone.now())
+            with self.assertNumQueries(0):
+                desde_motor = self.client.get(url, {'radio': 100}).data
+        self.assertEqual(desde_motor['cercanas'], desde_bd['cercanas'])
+        self.assertEqual(self.client.get('/location/999/cercanas').status_code, 404)
+
+    def test_el_registro_guarda_los_encuentros(self):
+        engine = ProximityEngine(entrada=25, salida=50)
+        recorder = EncounterRecorder(engine)
+        a, b, _ = (m.id for m in self.mascotas)
+        # Encuentro abierto de antes de reiniciar que ya no sigue
+        Encounter.objects.create(mascota_a_id=a, mascota_b_id=self.mascotas[2].id, inicio=T0, distancia_minima=3)
+        recorder(list(Location.objects.values_list(*FAST_FIELDS)), precarga=True)
+        self.assertEqual(Encounter.objects.filter(fin__isnull=True).count(), 1)
+        momento = timezone.now() + timedelta(minutes=1)
+        recorder([(10**9, b, 4.6 + 80 * M, -74.08, momento, None, momento)])
+        # La conciliación cerró el viejo y abrió el de la precarga; el tick cerró este último
+        self.assertFalse(Encounter.objects.filter(fin__isnull=True).exists())
+        encuentro = Encounter.objects.get(mascota_a_id=a, mascota_b_id=b)
+        self.assertAlmostEqual(encuentro.distancia_minima, 20, places=1)
+
+        response = self.assertWithinQueryBudget(f'/location/{b}/encuentros', data={'desde': T0.isoformat()})
+        self.assertEqual([e['id'] for e in response.data], [encuentro.id])
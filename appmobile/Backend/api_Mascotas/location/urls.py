@@ -1,9 +1,30 @@
 from django.urls import path
-from .views import LocationView, LocationMobileView, get_latest_locations
+from . import async_views
+from .views import (
+    LocationView, LocationMobileView, get_latest_locations, get_latency_report, export_locations,
+    get_device_status, get_degraded_devices, get_fleet_snapshot, fleet_playback,
+    get_resampled_track, get_visits, get_heatmap_tile, get_nearby_pets, get_encounters,
+)
 
 urlpatterns = [
     path('location_list', LocationView.as_view(), name='location'),
     path('<int:mascota_id>/', LocationView.as_view(), name='location-detail'),
+    path('<int:mascota_id>/export', export_locations, name='location-export'),
+    path('<int:mascota_id>/trayecto', get_resampled_track, name='location-track'),
+    path('<int:mascota_id>/visitas', get_visits, name='location-visits'),
+    path('<int:mascota_id>/cercanas', get_nearby_pets, name='location-nearby'),
+    path('<int:mascota_id>/encuentros', get_encounters, name='location-encounters'),
     path('mobile/', LocationMobileView.as_view(), name='location-mobile'),
     path('latest', get_latest_locations, name='get-latest-locations'),
+    path('snapshot', get_fleet_snapshot, name='location-snapshot'),
+    path('playback', fleet_playback, name='location-playback'),
+    path('heatmap/<int:z>/<int:x>/<int:y>', get_heatmap_tile, name='location-heatmap'),
+    path('latencia', get_latency_report, name='location-latency'),
+    path('dispositivos', get_device_status, name='device-status'),
+    path('dispositivos/degradados', get_degraded_devices, name='device-degraded'),
+    # Variantes async (servir con ASGI, ver gunicorn.conf.py)
+    path('async/location_list', async_views.location_list, name='location-async'),
+    path('async/<int:mascota_id>/', async_views.location_list, name='location-detail-async'),
+    path('async/mobile/', async_views.location_mobile, name='location-mobile-async'),
+    path('async/latest', async_views.latest_locations, name='get-latest-locations-async'),
 ]
@@ -0,0 +1,120 @@
+"""
+Validación vectorizada (NumPy) de cada lote de fixes antes de guardarlo.
+
+Se rechazan las coordenadas fuera de rango o en (0, 0) y los fixes con HDOP
+alto o pocos satélites (si el collar los envía), todo en una pasada sobre el
+lote. Después, por mascota y en orden cronológico, cada fix se compara con el
+último fix *aceptado* (del lote o el último guardado): si la velocidad implícita
+supera ``LOCATION_MAX_SPEED_MPS`` va a cuarentena y la referencia no cambia.
+Así una ráfaga de fixes malos se rechaza entera y el resultado no depende de
+cómo se partan los lotes. Los rechazados van a ``LocationQuarantine`` con su motivo.
+"""
+import numpy as np
+from django.conf import settings
+from .models import LocationQuarantine
+
+RADIO_TIERRA_M = 6_371_000
+
+# Resolución del reloj del GPS: evita velocidades infinitas entre fixes del mismo segundo
+MIN_DT_SECONDS = 1.0
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distancia en metros entre arreglos de coordenadas"""
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    a = (
+        np.sin((phi2 - phi1) / 2) ** 2
+        + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * RADIO_TIERRA_M * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def _momento(fix):
+    return (fix['device_time'] or fix['received_at']).timestamp()
+
+
+def _opcional(fixes, campo):
+    return np.array([np.nan if f.get(campo) is None else f[campo] for f in fixes], dtype=float)
+
+
+def validate_fixes(fixes, previos):
+    """
+    Separa un lote en aceptados y rechazados.
+
+    ``previos`` es {mascota_id: (latitude, longitude, momento)} con el último
+    fix guardado de cada mascota. Devuelve (aceptados, [(fix, motivo, detalle)]).
+    """
+    n = len(fixes)
+    if not n:
+        return [], []
+    max_speed = getattr(settings, 'LOCATION_MAX_SPEED_MPS', 40)
+    max_hdop = getattr(settings, 'LOCATION_MAX_HDOP', 5)
+    min_sats = getattr(settings, 'LOCATION_MIN_SATELLITES', 4)
+
+    lat = np.array([f['latitude'] for f in fixes], dtype=float)
+    lon = np.array([f['longitude'] for f in fixes], dtype=float)
+    t = np.array([_momento(f) for f in fixes], dtype=float)
+    mascota = np.array([f['mascota_id'] for f in fixes], dtype=np.int64)
+    hdop = _opcional(fixes, 'hdop')
+    satelites = _opcional(fixes, 'satelites')
+
+    motivo = np.full(n, '', dtype=object)
+    detalle = np.full(n, '', dtype=object)
+
+    # Chequeos por fix, en orden de prioridad (las comparaciones con NaN dan False)
+    chequeos = (
+        (LocationQuarantine.MOTIVO_FUERA_DE_RANGO,
+         ~(np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180))),
+        (LocationQuarantine.MOTIVO_ORIGEN, (np.abs(lat) < 1e-6) & (np.abs(lon) < 1e-6)),
+        (LocationQuarantine.MOTIVO_HDOP, hdop > max_hdop),
+        (LocationQuarantine.MOTIVO_SATELITES, satelites < min_sats),
+    )
+    for codigo, mascara in chequeos:
+        motivo[mascara & (motivo == '')] = codigo
+    calidad = np.isin(motivo, [LocationQuarantine.MOTIVO_HDOP, LocationQuarantine.MOTIVO_SATELITES])
+    for i in np.flatnonzero(calidad).tolist():
+        detalle[i] = f"hdop={fixes[i].get('hdop')}, satelites={fixes[i].get('satelites')}"
+
+    # Chequeo de velocidad contra el último fix aceptado de cada mascota
+    aceptado = dict(previos)
+    for i in np.lexsort((t, mascota)).tolist():
+        if motivo[i]:
+            continue
+        m = int(mascota[i])
+        ref = aceptado.get(m)
+        if ref is not None:
+            dt = max(abs(t[i] - ref[2]), MIN_DT_SECONDS)
+            v = float(haversine_m(ref[0], ref[1], lat[i], lon[i])) / dt
+            if v > max_speed:
+                motivo[i] = LocationQuarantine.MOTIVO_VELOCIDAD
+                detalle[i] = f'{v:.1f} m/s desde el último fix aceptado (máximo {max_speed} m/s)'
+                continue
+        aceptado[m] = (lat[i], lon[i], t[i])
+
+    aceptados = [fix for fix, ok in zip(fixes, motivo == '') if ok]
+    rechazados = [
+        (fixes[i], motivo[i], detalle[i])
+        for i in np.flatnonzero(motivo != '').tolist()
+    ]
+    return aceptados, rechazados
+
+
+def quarantine(rechazados):
+    """Guarda los fixes rechazados con su motivo"""
+    return LocationQuarantine.objects.bulk_create([
+        LocationQuarantine(
+            mascota_id=fix['mascota_id'],
+            latitude=fix['latitude'],
+            longitude=fix['longitude'],
+            device_time=fix['device_time'],
+            received_at=fix['received_at'],
+            device_id=fix.get('device_id'),
+            seq=fix.get('seq'),
+            hdop=fix.get('hdop'),
+            satelites=fix.get('satelites'),
+            motivo=motivo,
+            detalle=detalle,
+        )
+        for fix, motivo, detalle in rechazados
+    ])
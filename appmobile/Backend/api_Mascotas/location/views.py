@@ -2,17 +2,129 @@ from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Location
-from .serializer import LocationSerializer
+from .models import Encounter, Location, Visit
+from .serializer import EncounterSerializer, LocationSerializer, VisitSerializer
+from .fast import FAST_FIELDS, CREATED_AT, DEVICE_TIME, render_locations
+from .export import FORMATOS, export_chunks, gzip_chunks
+from .params import parse_time_param
+from .telemetry import degraded_devices, device_aggregates
+from .recent import recent_tracks
+from .resample import METODOS, cached_track
+from .heatmap import Scope, heatmap_tile, render_tile
+from .proximity import near_from_rows, proximity_engine
+from .snapshot import fleet_snapshot, frame_count, parse_max_edad, playback_chunks
+from django.http import HttpResponse, StreamingHttpResponse
+from .deadband import deadband_filter
+from .ingest import save_location_in_order
+from .latency import (
+    ETAPA_BROKER_BD,
+    ETAPA_DISPOSITIVO_BROKER,
+    latency_tracker,
+    parse_device_time,
+    record_delivery,
+    summarize,
+)
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.utils import timezone
 from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F, Q
 from rest_framework.decorators import api_view
+from api_Mascotas.query_budget import query_budget
 
 # Create your views here.
 
+def existing_location(validated_data):
+    """La ubicación ya guardada con la misma identidad de fix: (device_id, seq) o (mascota, device_time)"""
+    device_id = validated_data.get('device_id')
+    seq = validated_data.get('seq')
+    if device_id and seq is not None:
+        return Location.objects.filter(device_id=device_id, seq=seq).first()
+    if validated_data.get('device_time'):
+        return Location.objects.filter(
+            mascota=validated_data['mascota'],
+            device_time=validated_data['device_time']
+        ).first()
+    return None
+
+def save_location(serializer, received_at):
+    """
+    Guarda la ubicación validada por la misma ingesta que el bridge (orden y cuarentena).
+
+    Devuelve (location, creada, motivo): un reenvío devuelve la ubicación ya guardada
+    y un fix rechazado por la validación devuelve (None, False, motivo).
+    """
+    validated = serializer.validated_data
+    existente = existing_location(validated)
+    if existente:
+        return existente, False, None
+    try:
+        location, motivo = save_location_in_order(
+            validated['mascota'].pk,
+            validated['latitude'],
+            validated['longitude'],
+            device_time=validated.get('device_time'),
+            received_at=received_at,
+            device_id=validated.get('device_id'),
+            seq=validated.get('seq')
+        )
+    except IntegrityError:
+        # Otro request guardó el mismo fix entre la consulta y el INSERT
+        location, motivo = None, None
+    if location is not None:
+        return location, True, None
+    if motivo is not None:
+        return None, False, motivo
+    return existing_location(validated), False, None
+
+def last_location_query(mascota_id):
+    return Location.objects.filter(mascota_id=mascota_id).order_by('-created_at').values_list(*FAST_FIELDS)
+
+def recent_locations_query(minutos, mascota_id=None, last_id=0):
+    """Ubicaciones de los últimos ``minutos`` (máximo 100), opcionalmente de una mascota y posteriores a ``last_id``"""
+    query = Location.objects.filter(created_at__gte=timezone.now() - timedelta(minutes=minutos))
+    if last_id > 0:
+        query = query.filter(id__gt=last_id)
+    if mascota_id:
+        query = query.filter(mascota_id=mascota_id)
+    return query.order_by('-created_at').values_list(*FAST_FIELDS)[:100]
+
+def recent_locations(minutos, mascota_id=None, last_id=0):
+    """Ventana reciente desde el buffer en memoria si la cubre; si no, desde la BD"""
+    rows = recent_tracks.recent(minutos, mascota_id, last_id)
+    if rows is None:
+        rows = list(recent_locations_query(minutos, mascota_id, last_id))
+    return rows
+
+def last_location(mascota_id):
+    encontrada, row = recent_tracks.last(mascota_id)
+    return row if encontrada else last_location_query(mascota_id).first()
+
+def mobile_location_data(payload):
+    """Datos de la app móvil (latitud/longitud en español) con los nombres del serializer"""
+    return {
+        'latitude': payload.get('latitud'),
+        'longitude': payload.get('longitud'),
+        'mascota': payload.get('mascota'),
+        'device_time': parse_device_time(payload.get('device_time')),
+        'device_id': payload.get('device_id'),
+        'seq': payload.get('seq')
+    }
+
+def rejected_response(motivo):
+    return Response(
+        {
+            'mensaje': 'Ubicación rechazada por la validación',
+            'motivo': motivo,
+            'almacenada': False
+        },
+        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+    )
+
 class LocationView(APIView):
+    @query_budget(1)
     def get(self, request, *args, **kwargs):
         try:
             # Parámetros de la solicitud
@@ -23,36 +135,21 @@ class LocationView(APIView):
             if mascota_id:
                 # Si solo queremos la última ubicación
                 if request.query_params.get('ultima', 'false').lower() == 'true':
-                    location = Location.objects.filter(
-                        mascota_id=mascota_id
-                    ).order_by('-created_at').first()
+                    location = last_location(mascota_id)
                     
                     if location:
-                        serializer = LocationSerializer(location)
-                        return Response(serializer.data)
+                        record_delivery([(location[CREATED_AT], location[DEVICE_TIME])])
+                        return Response(render_locations([location])[0])
                     return Response(
                         {'mensaje': 'No se encontró ubicación para esta mascota'},
                         status=status.HTTP_404_NOT_FOUND
                     )
                 
                 # Si queremos el historial reciente de una mascota
-                time_limit = timezone.now() - timedelta(minutes=minutos)
-                locations = Location.objects.filter(
-                    mascota_id=mascota_id,
-                    created_at__gte=time_limit
-                ).order_by('-created_at')[:100]  # Máximo 100 ubicaciones
-                
-                serializer = LocationSerializer(locations, many=True)
-                return Response(serializer.data)
+                return Response(render_locations(recent_locations(minutos, mascota_id)))
             
             # Si no se especifica mascota, devolver ubicaciones recientes de todas las mascotas
-            time_limit = timezone.now() - timedelta(minutes=minutos)
-            locations = Location.objects.filter(
-                created_at__gte=time_limit
-            ).order_by('-created_at')[:100]  # Máximo 100 ubicaciones
-            
-            serializer = LocationSerializer(locations, many=True)
-            return Response(serializer.data)
+            return Response(render_locations(recent_locations(minutos)))
             
         except Exception as e:
             print(f"Error en LocationView.get: {str(e)}")
@@ -62,14 +159,25 @@ class LocationView(APIView):
             )
 
     def post(self, request, *args, **kwargs):
+        received_at = timezone.now()
         # Crear nueva ubicación sin desactivar las anteriores
         serializer = LocationSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            location, created, motivo = save_location(serializer, received_at)
+            if motivo:
+                return rejected_response(motivo)
+            if not created:
+                return Response(
+                    {
+                        'mensaje': 'Ubicación ya registrada',
+                        'data': LocationSerializer(location).data
+                    },
+                    status=status.HTTP_200_OK
+                )
             return Response(
                 {
                     'mensaje': 'Ubicación registrada con éxito',
-                    'data': serializer.data
+                    'data': LocationSerializer(location).data
                 },
                 status=status.HTTP_201_CREATED
             )
@@ -94,16 +202,13 @@ class LocationView(APIView):
 @method_decorator(csrf_exempt, name='dispatch')
 class LocationMobileView(APIView):
     def post(self, request, *args, **kwargs):
+        received_at = timezone.now()
         try:
             # Ya no llamamos a clean_old_locations aquí
             # self.clean_old_locations(request.data.get('mascota'))
             
             # Obtener datos de la app móvil
-            data = {
-                'latitude': request.data.get('latitud'),
-                'longitude': request.data.get('longitud'),
-                'mascota': request.data.get('mascota')
-            }
+            data = mobile_location_data(request.data)
 
             # Verificar que la mascota existe
             if not data['mascota']:
@@ -115,11 +220,46 @@ class LocationMobileView(APIView):
             # Crear nueva ubicación
             serializer = LocationSerializer(data=data)
             if serializer.is_valid():
-                serializer.save()
+                validated = serializer.validated_data
+                # Un reenvío se reconoce antes del filtro de movimiento: ya está almacenado
+                existente = existing_location(validated)
+                if existente:
+                    return Response(
+                        {
+                            'mensaje': 'Ubicación ya registrada',
+                            'data': LocationSerializer(existente).data
+                        },
+                        status=status.HTTP_200_OK
+                    )
+                # Con la mascota quieta solo se guarda un fix por latido
+                if not deadband_filter.should_store(
+                    validated['mascota'].pk,
+                    validated['latitude'],
+                    validated['longitude'],
+                    validated.get('device_time') or received_at
+                ):
+                    return Response(
+                        {
+                            'mensaje': 'Mascota sin movimiento, ubicación no almacenada',
+                            'almacenada': False
+                        },
+                        status=status.HTTP_200_OK
+                    )
+                location, created, motivo = save_location(serializer, received_at)
+                if motivo:
+                    return rejected_response(motivo)
+                if not created:
+                    return Response(
+                        {
+                            'mensaje': 'Ubicación ya registrada',
+                            'data': LocationSerializer(location).data
+                        },
+                        status=status.HTTP_200_OK
+                    )
                 return Response(
                     {
                         'mensaje': 'Ubicación recibida y almacenada correctamente',
-                        'data': serializer.data
+                        'data': LocationSerializer(location).data
                     },
                     status=status.HTTP_201_CREATED
                 )
@@ -150,39 +290,348 @@ class LocationMobileView(APIView):
                 created_at__lt=week_ago
             ).delete()
 
+@query_budget(1)
 @api_view(['GET'])
 def get_latest_locations(request):
     try:
         # Obtener parámetros de la solicitud
-        last_id = request.query_params.get('last_id', 0)
+        last_id = int(request.query_params.get('last_id', 0) or 0)
         mascota_id = request.query_params.get('mascota_id')
         minutos = int(request.query_params.get('minutos', 30))  # Por defecto 30 minutos
         
-        # Calcular el tiempo límite (normalmente 30 minutos atrás)
-        time_limit = timezone.now() - timedelta(minutes=minutos)
+        # Últimos X minutos, posteriores a last_id, máximo 100 ubicaciones
+        latest_locations = recent_locations(minutos, mascota_id, last_id)
         
-        # Iniciar la consulta base
-        query = Location.objects.filter(
-            created_at__gte=time_limit  # Solo ubicaciones de los últimos X minutos
+        print(f"Obteniendo ubicaciones de los últimos {minutos} minutos. Encontradas: {len(latest_locations)}")
+        
+        # Solo las ubicaciones nuevas para el cliente cuentan como entrega
+        if last_id > 0:
+            record_delivery((row[CREATED_AT], row[DEVICE_TIME]) for row in latest_locations)
+        
+        return Response(render_locations(latest_locations))
+    except Exception as e:
+        print(f"Error in get_latest_locations: {str(e)}")
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+def export_locations(request, mascota_id):
+    """Exporta en streaming el historial de una mascota como GeoJSON, GPX o CSV"""
+    formato = request.query_params.get('formato', 'geojson').lower()
+    if formato not in FORMATOS:
+        return Response(
+            {'error': f"Formato no soportado. Opciones: {', '.join(FORMATOS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        desde = parse_time_param(request.query_params.get('desde'))
+        hasta = parse_time_param(request.query_params.get('hasta'), end_of_day=True)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    content_type, extension = FORMATOS[formato]
+    filename = f'mascota_{mascota_id}.{extension}'
+    chunks = export_chunks(formato, mascota_id, desde, hasta)
+    
+    # Compresión opcional al vuelo
+    if request.query_params.get('gzip', 'false').lower() in ('1', 'true'):
+        response = StreamingHttpResponse(gzip_chunks(chunks), content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse(chunks, content_type=f'{content_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@query_budget(1)
+@api_view(['GET'])
+def get_fleet_snapshot(request):
+    """Última posición de cada mascota en o antes de ``momento`` (por defecto ahora)"""
+    try:
+        momento = parse_time_param(request.query_params.get('momento')) or timezone.now()
+        max_edad = parse_max_edad(request.query_params.get('max_edad'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        ubicaciones = render_locations(fleet_snapshot(momento, max_edad))
+        return Response({'momento': momento, 'total': len(ubicaciones), 'ubicaciones': ubicaciones})
+    except Exception as e:
+        print(f"Error in get_fleet_snapshot: {str(e)}")
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@api_view(['GET'])
+def fleet_playback(request):
+    """Fotos de la flota cada ``paso`` segundos entre ``desde`` y ``hasta``, en streaming NDJSON"""
+    try:
+        desde = parse_time_param(request.query_params.get('desde'))
+        hasta = parse_time_param(request.query_params.get('hasta'), end_of_day=True)
+        paso = timedelta(seconds=int(request.query_params.get('paso', 60)))
+        max_edad = parse_max_edad(request.query_params.get('max_edad'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if not desde or not hasta or hasta < desde:
+        return Response(
+            {'error': 'Se requieren desde y hasta, con desde anterior a hasta'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if paso <= timedelta(0):
+        return Response({'error': 'paso debe ser mayor que 0'}, status=status.HTTP_400_BAD_REQUEST)
+    max_fotos = getattr(settings, 'LOCATION_PLAYBACK_MAX_FRAMES', 1440)
+    if frame_count(desde, hasta, paso) > max_fotos:
+        return Response(
+            {'error': f'El rango pide más de {max_fotos} fotos, aumenta el paso'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return StreamingHttpResponse(
+        playback_chunks(desde, hasta, paso, max_edad),
+        content_type='application/x-ndjson'
+    )
+
+
+@query_budget(2)
+@api_view(['GET'])
+def get_resampled_track(request, mascota_id):
+    """Trayecto de la mascota remuestreado cada ``paso`` segundos para animarlo sin saltos"""
+    try:
+        hasta = parse_time_param(request.query_params.get('hasta'), end_of_day=True) or timezone.now()
+        desde = parse_time_param(request.query_params.get('desde')) or hasta - timedelta(hours=1)
+        paso = timedelta(seconds=float(request.query_params.get('paso', 5)))
+        max_hueco = request.query_params.get('max_hueco')
+        max_hueco = timedelta(seconds=float(max_hueco)) if max_hueco else None
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    metodo = request.query_params.get('metodo', 'lineal').lower()
+    if metodo not in METODOS:
+        return Response(
+            {'error': f"Método no soportado. Opciones: {', '.join(METODOS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if hasta < desde or paso <= timedelta(0):
+        return Response(
+            {'error': 'desde debe ser anterior a hasta y paso mayor que 0'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    max_muestras = getattr(settings, 'LOCATION_RESAMPLE_MAX_SAMPLES', 86_400)
+    if (hasta - desde) / paso >= max_muestras:
+        return Response(
+            {'error': f'El rango pide más de {max_muestras} muestras, aumenta el paso'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        return HttpResponse(
+            cached_track(mascota_id, desde, hasta, paso, metodo, max_hueco),
+            content_type='application/json'
+        )
+    except Exception as e:
+        print(f"Error in get_resampled_track: {str(e)}")
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@query_budget(1)
+@api_view(['GET'])
+def get_heatmap_tile(request, z, x, y):
+    """Tesela z/x/y del mapa de calor de una mascota (``mascota``), de un dueño (``dueno``) o de la flota"""
+    max_zoom = getattr(settings, 'LOCATION_HEATMAP_MAX_ZOOM', 18)
+    if z > max_zoom or x >= 2 ** z or y >= 2 ** z:
+        return Response(
+            {'error': f'Tesela inválida: zoom entre 0 y {max_zoom}, x e y menores que 2^zoom'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        mascota_id = int(request.query_params.get('mascota') or 0) or None
+        dueño_id = int(request.query_params.get('dueno') or 0) or None
+        # Rangos de días completos: la misma tesela se reutiliza durante todo el día
+        hasta = parse_time_param(request.query_params.get('hasta'), end_of_day=True) or timezone.localtime().replace(
+            hour=23, minute=59, second=59, microsecond=999999
+        )
+        dias = getattr(settings, 'LOCATION_HEATMAP_DAYS', 7)
+        desde = parse_time_param(request.query_params.get('desde')) or (hasta - timedelta(days=dias)).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        ) + timedelta(days=1)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if hasta < desde:
+        return Response({'error': 'desde debe ser anterior a hasta'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        conteos = heatmap_tile(Scope(mascota_id, dueño_id), z, x, y, desde, hasta)
+        return Response(render_tile(conteos, z, x, y))
+    except Exception as e:
+        print(f"Error in get_heatmap_tile: {str(e)}")
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@query_budget(1)
+@api_view(['GET'])
+def get_visits(request, mascota_id):
+    """Estancias de la mascota (lugares donde pasó tiempo) entre ``desde`` y ``hasta``, por defecto hoy"""
+    try:
+        desde = parse_time_param(request.query_params.get('desde')) or timezone.localtime().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        hasta = parse_time_param(request.query_params.get('hasta'), end_of_day=True)
+        min_minutos = float(request.query_params.get('min_minutos', 0))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        visitas = Visit.objects.filter(mascota_id=mascota_id, salida__gte=desde)
+        if hasta:
+            visitas = visitas.filter(llegada__lte=hasta)
+        if min_minutos > 0:
+            visitas = visitas.filter(salida__gte=F('llegada') + timedelta(minutes=min_minutos))
+        return Response(VisitSerializer(visitas.order_by('-llegada'), many=True).data)
+    except Exception as e:
+        print(f"Error in get_visits: {str(e)}")
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@query_budget(1)
+@api_view(['GET'])
+def get_nearby_pets(request, mascota_id):
+    """Mascotas a ``radio`` metros o menos de la mascota, según sus últimas posiciones"""
+    try:
+        radio = float(request.query_params.get('radio', getattr(settings, 'LOCATION_PROXIMITY_METERS', 25)))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if not 0 < radio <= getattr(settings, 'LOCATION_PROXIMITY_MAX_RADIUS', 5_000):
+        return Response({'error': 'radio fuera de rango'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        # El motor del proceso está al día mientras el listener del buffer de recientes lo esté
+        if recent_tracks.synced_since is not None:
+            cercanas = proximity_engine.near(mascota_id, radio)
+        else:
+            max_edad = proximity_engine.max_edad
+            cercanas = near_from_rows(fleet_snapshot(timezone.now(), max_edad), mascota_id, radio)
+        if cercanas is None:
+            return Response(
+                {'mensaje': 'La mascota no tiene una ubicación reciente'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response({
+            'mascota': mascota_id,
+            'radio': radio,
+            'cercanas': [
+                {'mascota': otra, 'distancia': round(distancia, 1), 'latitude': lat, 'longitude': lon, 'momento': momento}
+                for otra, distancia, lat, lon, momento in cercanas
+            ],
+        })
+    except Exception as e:
+        print(f"Error in get_nearby_pets: {str(e)}")
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@query_budget(1)
+@api_view(['GET'])
+def get_encounters(request, mascota_id):
+    """Encuentros de la mascota con otras desde ``desde`` (por defecto las últimas 24 horas)"""
+    try:
+        desde = parse_time_param(request.query_params.get('desde')) or timezone.now() - timedelta(days=1)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        encuentros = (
+            Encounter.objects.filter(Q(mascota_a_id=mascota_id) | Q(mascota_b_id=mascota_id))
+            .filter(Q(fin__isnull=True) | Q(fin__gte=desde))
+            .order_by('-inicio')[:200]
         )
+        return Response(EncounterSerializer(encuentros, many=True).data)
+    except Exception as e:
+        print(f"Error in get_encounters: {str(e)}")
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@query_budget(1)
+@api_view(['GET'])
+def get_latency_report(request):
+    """Percentiles de latencia por etapa: ingesta desde la BD y entrega desde este proceso"""
+    try:
+        minutos = int(request.query_params.get('minutos', 15))
+        time_limit = timezone.now() - timedelta(minutes=minutos)
         
-        # Filtrar por ID (opcional)
-        if last_id and int(last_id) > 0:
-            query = query.filter(id__gt=int(last_id))
-            
-        # Filtrar por mascota si se proporciona
-        if mascota_id:
-            query = query.filter(mascota_id=mascota_id)
+        # Las etapas de ingesta se calculan con las marcas guardadas en cada fix
+        rows = Location.objects.filter(
+            created_at__gte=time_limit,
+            received_at__isnull=False
+        ).filter(
+            # Los fixes tardíos guardados como historial tienen created_at retroactivo
+            created_at__gte=F('received_at')
+        ).order_by('-created_at').values_list('device_time', 'received_at', 'created_at')[:5000]
         
-        # Ordenar y limitar resultados
-        latest_locations = query.select_related('mascota').order_by('-created_at')[:100]  # Máximo 100 ubicaciones
+        dispositivo_broker = []
+        broker_bd = []
+        for device_time, received_at, created_at in rows:
+            if device_time:
+                dispositivo_broker.append((received_at - device_time).total_seconds())
+            broker_bd.append((created_at - received_at).total_seconds())
         
-        print(f"Obteniendo ubicaciones de los últimos {minutos} minutos. Encontradas: {latest_locations.count()}")
+        # Las etapas de entrega solo se conocen en el proceso que sirvió los polls
+        etapas = latency_tracker.summary()
+        etapas[ETAPA_DISPOSITIVO_BROKER] = summarize(dispositivo_broker)
+        etapas[ETAPA_BROKER_BD] = summarize(broker_bd)
         
-        serializer = LocationSerializer(latest_locations, many=True)
-        return Response(serializer.data)
+        return Response({
+            'minutos': minutos,
+            'etapas': etapas,
+            # Fixes descartados por el filtro de movimiento en este proceso
+            'filtro_movimiento': deadband_filter.stats(),
+            'buffer_recientes': recent_tracks.stats(),
+        })
     except Exception as e:
-        print(f"Error in get_latest_locations: {str(e)}")
+        print(f"Error in get_latency_report: {str(e)}")
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@query_budget(1)
+@api_view(['GET'])
+def get_device_status(request):
+    """Resumen del enlace de cada collar en los últimos ``minutos`` (RSSI, batería, reconexiones, fallos)"""
+    try:
+        minutos = int(request.query_params.get('minutos', 60))
+        desde = timezone.now() - timedelta(minutes=minutos)
+        return Response({'minutos': minutos, 'dispositivos': device_aggregates(desde)})
+    except Exception as e:
+        print(f"Error in get_device_status: {str(e)}")
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@query_budget(1)
+@api_view(['GET'])
+def get_degraded_devices(request):
+    """Collares con el enlace degradado: causan reintentos y ráfagas en la ingesta"""
+    try:
+        minutos = int(request.query_params.get('minutos', 60))
+        now = timezone.now()
+        degradados = degraded_devices(now - timedelta(minutes=minutos), now)
+        return Response({'minutos': minutos, 'total': len(degradados), 'dispositivos': degradados})
+    except Exception as e:
+        print(f"Error in get_degraded_devices: {str(e)}")
         return Response(
             {'error': str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -0,0 +1,151 @@
+"""
+Detección incremental de estancias (stay points): dónde pasó tiempo cada mascota.
+
+Los fixes de una mascota se agrupan en orden cronológico mientras caigan en la
+celda de la grilla del centroide del grupo o en una vecina (celdas de
+``LOCATION_VISIT_RADIUS_M``) y sin un silencio mayor que
+``LOCATION_VISIT_MAX_GAP_SECONDS``. Un grupo que dura al menos
+``LOCATION_VISIT_MIN_SECONDS`` es una ``Visit`` (centroide, llegada, salida y
+número de fixes). Queda abierta mientras la mascota siga en el lugar.
+
+``detect_visits`` (tarea periódica) procesa solo los fixes nuevos desde la
+corrida anterior. El grupo en curso de cada mascota queda en ``VisitState``, así
+una estancia de horas no obliga a releer sus fixes. Consultar las visitas de un
+día cuesta unas pocas filas en vez de recorrer todo el historial.
+"""
+import logging
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from .grid import grid_cell, grid_cells
+from .models import Location, Visit, VisitState
+
+logger = logging.getLogger(__name__)
+
+ADVISORY_LOCK_NAMESPACE = 0x5649
+# Las filas nuevas toman created_at en el INSERT: se espera a que las transacciones en curso confirmen
+MARGEN_CONFIRMACION = timedelta(seconds=30)
+
+
+class StayPointDetector:
+    """Agrupa los fixes de una mascota sobre su ``VisitState`` y abre, extiende o cierra sus ``Visit``"""
+
+    def __init__(self, radio=None, min_segundos=None, max_hueco=None):
+        self.radio = radio or getattr(settings, 'LOCATION_VISIT_RADIUS_M', 50)
+        self.min_segundos = min_segundos or getattr(settings, 'LOCATION_VISIT_MIN_SECONDS', 600)
+        self.max_hueco = max_hueco or getattr(settings, 'LOCATION_VISIT_MAX_GAP_SECONDS', 900)
+
+    def feed(self, state, rows):
+        """Procesa filas (created_at, latitude, longitude) en orden; devuelve las Visit nuevas o modificadas"""
+        # Un fix tardío anterior al grupo en curso no reescribe estancias ya resueltas
+        rows = [row for row in rows if state.salida is None or row[0] > state.salida]
+        if not rows:
+            return []
+        lat = np.array([row[1] for row in rows], dtype=float)
+        lon = np.array([row[2] for row in rows], dtype=float)
+        filas, columnas = grid_cells(lat, lon, self.radio)
+        tocadas = {}
+        celda = grid_cell(state.latitude, state.longitude, self.radio) if state.fixes else None
+        for k, row in enumerate(rows):
+            momento = row[0]
+            if state.fixes:
+                cerca = max(abs(int(filas[k]) - celda[0]), abs(int(columnas[k]) - celda[1])) <= 1
+                if cerca and (momento - state.salida).total_seconds() <= self.max_hueco:
+                    n = state.fixes
+                    state.latitude = (state.latitude * n + lat[k]) / (n + 1)
+                    state.longitude = (state.longitude * n + lon[k]) / (n + 1)
+                    state.fixes = n + 1
+                    state.salida = momento
+                    celda = grid_cell(state.latitude, state.longitude, self.radio)
+                    self._confirmar(state, tocadas)
+                    continue
+                if state.visita is not None:
+                    state.visita.abierta = False
+                    tocadas[id(state.visita)] = state.visita
+            # Empieza un grupo nuevo en este fix; el anterior, si no duró lo suficiente, se descarta
+            state.latitude, state.longitude = float(lat[k]), float(lon[k])
+            state.llegada = state.salida = momento
+            state.fixes = 1
+            state.visita = None
+            celda = (int(filas[k]), int(columnas[k]))
+        return list(tocadas.values())
+
+    def _confirmar(self, state, tocadas):
+        if (state.salida - state.llegada).total_seconds() < self.min_segundos:
+            return
+        visita = state.visita
+        if visita is None:
+            visita = state.visita = Visit(mascota_id=state.mascota_id, abierta=True)
+        visita.latitude = float(state.latitude)
+        visita.longitude = float(state.longitude)
+        visita.llegada = state.llegada
+        visita.salida = state.salida
+        visita.fixes = state.fixes
+        tocadas[id(visita)] = visita
+
+
+def _lock_detector():
+    """Una sola corrida a la vez (varios workers de Celery)"""
+    if connection.vendor != 'postgresql':
+        return True
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_xact_lock(%s, 0)', [ADVISORY_LOCK_NAMESPACE])
+        return cursor.fetchone()[0]
+
+
+def detect_visits(now=None, detector=None):
+    """Procesa los fixes nuevos de todas las mascotas; devuelve cuántas visitas se crearon o actualizaron"""
+    now = now or timezone.now()
+    detector = detector or StayPointDetector()
+    horizonte = now - MARGEN_CONFIRMACION
+    minimo = now - timedelta(hours=getattr(settings, 'LOCATION_VISIT_LOOKBACK_HOURS', 6))
+    with transaction.atomic():
+        if not _lock_detector():
+            logger.info("⏭️ Detección de visitas en curso en otro worker")
+            return 0
+        # Cada corrida deja procesado_hasta = su horizonte en las mascotas que procesó:
+        # el máximo es el horizonte de la corrida anterior
+        desde = VisitState.objects.aggregate(desde=Max('procesado_hasta'))['desde'] or minimo
+        desde = max(desde, minimo)
+        rows = (
+            Location.objects.filter(created_at__gt=desde, created_at__lte=horizonte)
+            .order_by('mascota_id', 'created_at', 'id')
+            .values_list('mascota_id', 'created_at', 'latitude', 'longitude')
+        )
+        por_mascota = {}
+        for mascota_id, *row in rows.iterator(chunk_size=5000):
+            por_mascota.setdefault(mascota_id, []).append(row)
+
+        estados = {
+            estado.mascota_id: estado
+            for estado in VisitState.objects.filter(mascota_id__in=por_mascota).select_related('visita')
+        } if por_mascota else {}
+        nuevos = []
+        tocadas = []
+        for mascota_id, fixes in por_mascota.items():
+            estado = estados.get(mascota_id)
+            if estado is None:
+                estado = VisitState(mascota_id=mascota_id, fixes=0)
+                nuevos.append(estado)
+            tocadas.extend(detector.feed(estado, fixes))
+            estado.procesado_hasta = horizonte
+
+        creadas = [visita for visita in tocadas if visita.pk is None]
+        Visit.objects.bulk_update(
+            [visita for visita in tocadas if visita.pk is not None],
+            ['latitude', 'longitude', 'llegada', 'salida', 'fixes', 'abierta'],
+        )
+        Visit.objects.bulk_create(creadas)
+        campos = ['procesado_hasta', 'latitude', 'longitude', 'llegada', 'salida', 'fixes', 'visita']
+        VisitState.objects.bulk_create(nuevos)
+        VisitState.objects.bulk_update(list(estados.values()), campos)
+        # Collar en silencio: la estancia terminó con su último fix
+        Visit.objects.filter(
+            abierta=True, salida__lt=horizonte - timedelta(seconds=detector.max_hueco)
+        ).update(abierta=False)
+    if tocadas:
+        logger.info(f"📍 {len(tocadas)} visitas detectadas o actualizadas en {len(por_mascota)} mascotas")
+    return len(tocadas)
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.3 on 2026-10-19 18:15
+
+import api_Mascotas.search
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("dueño", "0002_busqueda"),
+        ("mascotas", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="mascota",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.CombinedSearchVector(
+                    django.contrib.postgres.search.SearchVector(
+                        api_Mascotas.search.Normalizar("nombre"),
+                        config="simple",
+                        weight="A",
+                    ),
+                    "||",
+                    django.contrib.postgres.search.SearchVector(
+                        api_Mascotas.search.Normalizar("especie"),
+                        api_Mascotas.search.Normalizar("raza"),
+                        config="simple",
+                        weight="B",
+                    ),
+                    django.contrib.postgres.search.SearchConfig("simple"),
+                ),
+                name="mascota_busqueda_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="mascota",
+            index=models.Index(fields=["nombre"], name="mascota_nombre_idx"),
+        ),
+    ]
@@ -1,5 +1,10 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
 from datetime import datetime
+from api_Mascotas.search import search_vector
+
+# Documento de búsqueda de mascotas (ver api_Mascotas/search.py)
+MASCOTA_BUSQUEDA = (['nombre'], ['especie', 'raza'])
 
 # Create your models here.
 class Mascota(models.Model):
@@ -13,10 +18,36 @@ class Mascota(models.Model):
     fecha_nacimiento = models.DateField(null=True, blank=True)
     fecha_creacion = models.DateTimeField(default=datetime.now)
     dueño = models.ForeignKey('dueño.Dueño', on_delete=models.CASCADE, related_name='mascotas')
+
+    class Meta:
+        indexes = [
+            GinIndex(search_vector(*MASCOTA_BUSQUEDA), name='mascota_busqueda_idx'),
+            models.Index(fields=['nombre'], name='mascota_nombre_idx'),
+        ]
     
     @property
     def ultima_ubicacion(self):
+        # Usar la ubicación precargada con prefetch_ultima_ubicacion() si existe
+        if hasattr(self, 'ubicaciones_recientes'):
+            return self.ubicaciones_recientes[0] if self.ubicaciones_recientes else None
         return self.locations.order_by('-created_at').first()
     
     def __str__(self):
         return self.nombre
+
+
+def prefetch_ultima_ubicacion():
+    """Prefetch de la última ubicación de cada mascota en una sola consulta (DISTINCT ON)"""
+    from location.models import Location
+    return models.Prefetch(
+        'locations',
+        queryset=Location.objects.order_by('mascota_id', '-created_at').distinct('mascota_id'),
+        to_attr='ubicaciones_recientes'
+    )
+
+
+def tiene_imagen():
+    """Anotación booleana: la mascota tiene imagen, sin leer la columna base64"""
+    return models.ExpressionWrapper(
+        models.Q(imagen__isnull=False) & ~models.Q(imagen=''), output_field=models.BooleanField()
+    )
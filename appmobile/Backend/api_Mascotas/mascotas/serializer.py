@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from .models import Mascota
-from dueño.serializer import DueñoSimpleSerializer
+from dueño.serializer import DueñoSimpleSerializer, ImagenUrlField
 from location.serializer import LocationSerializer
 
 class MascotaSerializer(serializers.ModelSerializer):
@@ -14,7 +14,7 @@ class MascotaSerializer(serializers.ModelSerializer):
 
     def get_ultima_ubicacion(self, obj):
         # Obtener la última ubicación por fecha de creación
-        ultima_location = obj.locations.order_by('-created_at').first()
+        ultima_location = obj.ultima_ubicacion
         if ultima_location:
             return {
                 'id': ultima_location.id,
@@ -27,4 +27,14 @@ class MascotaSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         data = super().to_representation(instance)
         data['fecha_creacion'] = instance.fecha_creacion.strftime('%Y-%m-%d')
-        return data
\ No newline at end of file
+        return data
+
+
+class MascotaBusquedaSerializer(serializers.ModelSerializer):
+    dueño_info = DueñoSimpleSerializer(source='dueño', read_only=True)
+    imagen_url = ImagenUrlField()
+    relevancia = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Mascota
+        fields = ['id', 'nombre', 'especie', 'raza', 'imagen_url', 'dueño', 'dueño_info', 'relevancia']
@@ -1,3 +1,99 @@
+import base64
+from django.db import connection
 from django.test import TestCase
+from api_Mascotas.query_budget import QueryBudgetTestMixin
+from dueño.models import Dueño
+from location.models import Location
+from api_Mascotas.search import search, search_vector
+from .models import MASCOTA_BUSQUEDA, Mascota
 
 # Create your tests here.
+
+class MascotaQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        dueño = Dueño.objects.create(
+            nombre='Ana', apellido='Gómez', email='ana@example.com',
+            telefono='3000000000', direccion='Calle 1', ciudad='Bogotá'
+        )
+        for i in range(5):
+            mascota = Mascota.objects.create(
+                nombre=f'Mascota {i}', peso=10, edad=3, especie='Perro',
+                raza='Criollo', dueño=dueño
+            )
+            for j in range(3):
+                Location.objects.create(mascota=mascota, latitude=4.6 + j / 1000, longitude=-74.08)
+        cls.mascota = mascota
+
+    def test_lista_dentro_del_presupuesto(self):
+        response = self.assertWithinQueryBudget('/mascotas/mascotas_list')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 5)
+        self.assertIsNotNone(response.data[0]['ultima_ubicacion'])
+
+    def test_detalle_dentro_del_presupuesto(self):
+        response = self.assertWithinQueryBudget(f'/mascotas/mascotas_id/{self.mascota.id}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_imagen_por_url(self):
+        contenido = b'\xff\xd8\xff' + b'1' * 100
+        Mascota.objects.filter(id=self.mascota.id).update(imagen=base64.b64encode(contenido).decode())
+        url = f'/mascotas/mascotas_imagen/{self.mascota.id}'
+        response = self.assertWithinQueryBudget(url)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response.content, contenido)
+        # Revalidación sin volver a enviar la imagen
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get('/mascotas/mascotas_imagen/999999').status_code, 404)
+
+    def test_nombre_repetido_no_falla(self):
+        Mascota.objects.create(nombre='Mascota 0', peso=5, edad=1, especie='Gato', raza='Persa', dueño=self.mascota.dueño)
+        response = self.client.get('/mascotas/mascotas_list', {'nombre': 'Mascota 0'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['especie'], 'Perro')
+
+
+class MascotaBusquedaTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        dueño = Dueño.objects.create(
+            nombre='Ana', apellido='Gómez', email='ana@example.com',
+            telefono='3000000000', direccion='Calle 1', ciudad='Bogotá'
+        )
+        for nombre, especie, raza in (
+            ('Ñoño', 'Perro', 'Criollo'), ('Lúna', 'Gato', 'Siamés'), ('Max', 'Perro', 'Luna Azul'),
+            ('Luna', 'Perro', 'Pug'), ('Toby', 'Perro', 'Beagle'),
+        ):
+            Mascota.objects.create(nombre=nombre, peso=5, edad=1, especie=especie, raza=raza, dueño=dueño)
+
+    def buscar(self, q, **params):
+        return self.client.get('/mascotas/mascotas_buscar', {'q': q, **params})
+
+    def test_sin_tildes_ni_mayusculas_y_por_prefijo(self):
+        self.assertEqual([m['nombre'] for m in self.buscar('nono').data['results']], ['Ñoño'])
+        self.assertEqual([m['nombre'] for m in self.buscar('SIAMES').data['results']], ['Lúna'])
+        self.assertEqual([m['nombre'] for m in self.buscar('bea').data['results']], ['Toby'])
+        self.assertEqual([m['nombre'] for m in self.buscar('perro pu').data['results']], ['Luna'])
+
+    def test_el_nombre_pesa_mas_que_la_raza(self):
+        nombres = [m['nombre'] for m in self.buscar('luna').data['results']]
+        self.assertEqual(nombres[2], 'Max')
+        self.assertEqual(set(nombres[:2]), {'Luna', 'Lúna'})
+
+    def test_paginada_y_dentro_del_presupuesto(self):
+        response = self.assertWithinQueryBudget('/mascotas/mascotas_buscar', data={'q': 'perro', 'tamano': 2})
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+        self.assertEqual(response.data['results'][0]['dueño_info']['apellido'], 'Gómez')
+        self.assertNotIn('imagen', response.data['results'][0])
+        self.assertEqual(self.buscar("'&|!").data['count'], 0)
+
+    def test_usa_el_indice(self):
+        mascotas = search(Mascota.objects.all(), search_vector(*MASCOTA_BUSQUEDA), 'luna')
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            sql, params = mascotas.query.sql_with_params()
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertIn('mascota_busqueda_idx', plan)
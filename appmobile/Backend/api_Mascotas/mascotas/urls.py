@@ -1,14 +1,16 @@
 from django.urls import path
 from django.contrib import admin
-from .views import MascotaView
+from .views import MascotaView, buscar_mascotas, mascota_imagen
 from .models import Mascota
 
 admin.site.register(Mascota)
 
 urlpatterns = [
-    path('mascotas_list', MascotaView.as_view() ),
+    path('mascotas_list', MascotaView.as_view(), name='mascotas_list'),
     path('mascotas_create', MascotaView.as_view()),
     path('mascotas_update/<int:pk>', MascotaView.as_view(), name='mascotas_update'),
     path('mascotas_delete/<int:pk>', MascotaView.as_view(), name='mascotas_delete'),
     path('mascotas_id/<int:pk>', MascotaView.as_view(), name='mascotas_id'),
+    path('mascotas_buscar', buscar_mascotas, name='mascotas_buscar'),
+    path('mascotas_imagen/<int:pk>', mascota_imagen, name='mascotas_imagen'),
 ]
@@ -1,22 +1,33 @@
 import json
 import base64
+import hashlib
 from django.shortcuts import render
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from rest_framework.decorators import api_view
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
-from mascotas.models import Mascota
-from mascotas.serializer import MascotaSerializer
+from mascotas.models import MASCOTA_BUSQUEDA, Mascota, prefetch_ultima_ubicacion, tiene_imagen
+from mascotas.serializer import MascotaBusquedaSerializer, MascotaSerializer
+from api_Mascotas.search import SearchPagination, search, search_vector
+from api_Mascotas.query_budget import query_budget
 
 
 # Create your views here.
 
 class MascotaView(APIView):
+    def get_queryset(self):
+        # Dueño y última ubicación en consultas fijas, sin importar cuántas mascotas haya
+        return Mascota.objects.select_related('dueño').prefetch_related(prefetch_ultima_ubicacion())
+
+    @query_budget(2)
     def get(self, request, *args, **kwargs):
         # Verificar si se proporciona un 'pk' o un 'nombre'
         if 'pk' in kwargs:
             id = kwargs['pk']
             try:
-                mascota = Mascota.objects.get(id=id)
+                mascota = self.get_queryset().get(id=id)
                 serializer = MascotaSerializer(mascota)
                 return Response(serializer.data)
             except Mascota.DoesNotExist:
@@ -28,20 +39,21 @@ class MascotaView(APIView):
                 )
         elif 'nombre' in request.query_params:
             nombre = request.query_params['nombre']
-            try:
-                mascota = Mascota.objects.get(nombre=nombre)
-                serializer = MascotaSerializer(mascota)
-                return Response(serializer.data)
-            except Mascota.DoesNotExist:
+            # Puede haber varias mascotas con el mismo nombre: se devuelve la más antigua.
+            # Para buscar por partes del nombre usar mascotas_buscar
+            mascota = self.get_queryset().filter(nombre=nombre).order_by('id').first()
+            if mascota is None:
                 return Response(
                     {
                         'message': 'Mascota no encontrada',
                     },
                     status=status.HTTP_404_NOT_FOUND
                 )
+            serializer = MascotaSerializer(mascota)
+            return Response(serializer.data)
         else:
             # Este bloque maneja la lista de todas las mascotas
-            mascotas = Mascota.objects.all()
+            mascotas = self.get_queryset()
             serializer = MascotaSerializer(mascotas, many=True)
             return Response(serializer.data)
     
@@ -169,4 +181,51 @@ class MascotaView(APIView):
                 'data': mi_mascotta
             },
             status=status.HTTP_200_OK
-        )
\ No newline at end of file
+        )
+
+
+@query_budget(2)
+@api_view(['GET'])
+def buscar_mascotas(request):
+    """Mascotas por nombre, especie o raza (``q``), paginadas y por relevancia"""
+    mascotas = Mascota.objects.select_related('dueño').defer('imagen').annotate(tiene_imagen=tiene_imagen())
+    mascotas = search(mascotas, search_vector(*MASCOTA_BUSQUEDA), request.query_params.get('q'))
+    paginator = SearchPagination()
+    pagina = paginator.paginate_queryset(mascotas, request)
+    serializer = MascotaBusquedaSerializer(pagina, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
+
+
+# Firmas de los formatos que sube la app; el resto se entrega como binario
+FIRMAS_IMAGEN = (
+    (b'\x89PNG', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF8', 'image/gif'),
+)
+
+
+def tipo_imagen(contenido):
+    if contenido[:4] == b'RIFF' and contenido[8:12] == b'WEBP':
+        return 'image/webp'
+    return next((tipo for firma, tipo in FIRMAS_IMAGEN if contenido.startswith(firma)), 'application/octet-stream')
+
+
+@query_budget(1)
+@api_view(['GET'])
+def mascota_imagen(request, pk):
+    """Imagen de la mascota (guardada en base64) como archivo, para usarla por URL"""
+    imagen = Mascota.objects.filter(id=pk).values_list('imagen', flat=True).first()
+    if not imagen:
+        return Response({'message': 'Imagen no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+    etag = f'"{hashlib.md5(imagen.encode()).hexdigest()}"'
+    if request.headers.get('If-None-Match') == etag:
+        return HttpResponseNotModified(headers={'ETag': etag})
+    try:
+        contenido = base64.b64decode(imagen)
+    except ValueError:
+        return Response({'message': 'Imagen inválida'}, status=status.HTTP_404_NOT_FOUND)
+    response = HttpResponse(contenido, content_type=tipo_imagen(contenido))
+    response['ETag'] = etag
+    # El navegador revalida con If-None-Match: la imagen puede cambiar con un PUT
+    patch_cache_control(response, no_cache=True)
+    return response
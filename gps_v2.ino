@@ -4,6 +4,7 @@
 #include <WiFiClientSecure.h>  // Para conexiones SSL
 #include <ArduinoJson.h>
 #include <PubSubClient.h>
+#include <Preferences.h>  // NVS: contador de arranques para el número de secuencia
 
 // Configuración de pines GPS
 #define RXD2 16
@@ -11,11 +12,14 @@
 HardwareSerial neogps(1);
 char datoCmd = 0;
 
+// Batería: pin ADC con divisor resistivo 1:2 hacia la LiPo; -1 si no está cableada
+#define PIN_BATERIA -1
+
 // Modo NMEA - Cambiar a 0 para modo normal después de depurar
 #define NMEA 0  // Procesamiento normal de datos GPS
 
 // Versión del firmware
-#define VERSION "1.0.2"
+#define VERSION "1.2.0"
 
 // ID de mascota (estático)
 const int ID_MASCOTA = 3;
@@ -37,7 +41,11 @@ char mqtt_system_topic[50] = "sistema";  // Topic para mensajes del sistema
 char mqtt_client_id[50] = "ESP32_Mascota_3"; // ID único para este dispositivo
 
 // Intervalos de envío de datos (milisegundos)
-const long intervalo_envio = 10000; // Enviar cada 10 segundos
+// El backend lo ajusta según el movimiento de la mascota (topic dispositivos/<device_id>/config)
+long intervalo_envio = 10000; // Enviar cada 10 segundos hasta recibir otro valor
+const long intervalo_envio_min = 2000;
+const long intervalo_envio_max = 300000;
+char mqtt_config_topic[64]; // dispositivos/<device_id>/config, se arma en setup()
 unsigned long ultimo_envio = 0;
 
 // Variables para reconexión MQTT
@@ -83,6 +91,16 @@ const char* root_ca = \
 WiFiClientSecure espClient;
 PubSubClient client(espClient);
 TinyGPSPlus gps;
+Preferences preferencias;
+
+// Identidad del fix para que el backend descarte los reenvíos:
+// device_id = MAC del ESP32, seq = (arranque << 32) | contador, monótono aun tras reinicios
+char device_id[18];
+uint32_t contadorArranques = 0;
+uint32_t contadorFixes = 0;
+
+// Publicaciones de fixes fallidas desde el arranque (telemetría del enlace en el heartbeat)
+uint32_t fallosPublicacion = 0;
 
 //------------------------------------------------------------------------------------------------------------------------------------------
 
@@ -102,6 +120,34 @@ void callback(char* topic, byte* payload, unsigned int length) {
   // Si es un mensaje del sistema, procesarlo
   if (String(topic) == mqtt_system_topic) {
     procesarMensajeSistema(mensaje);
+  } else if (String(topic) == mqtt_config_topic) {
+    procesarConfiguracion(mensaje);
+  }
+}
+
+// Configuración enviada por el backend a este collar
+void procesarConfiguracion(String mensaje) {
+  StaticJsonDocument<128> doc;
+  DeserializationError error = deserializeJson(doc, mensaje);
+  
+  if (error) {
+    Serial.print("Error parseando configuración: ");
+    Serial.println(error.c_str());
+    return;
+  }
+  
+  if (doc.containsKey("comando") && String((const char*)doc["comando"]) == "intervalo") {
+    long nuevo = constrain((long)doc["intervalo_ms"], intervalo_envio_min, intervalo_envio_max);
+    if (nuevo != intervalo_envio) {
+      intervalo_envio = nuevo;
+      // Solo se escribe en flash cuando cambia
+      preferencias.begin("gps", false);
+      preferencias.putLong("intervalo", intervalo_envio);
+      preferencias.end();
+    }
+    Serial.print("Intervalo de envío: ");
+    Serial.print(intervalo_envio);
+    Serial.println(" ms");
   }
 }
 
@@ -155,6 +201,24 @@ void setup()
   Serial.print("Versión: ");
   Serial.println(VERSION);
   
+  // Identidad del dispositivo y contador de arranques (una escritura en flash por arranque)
+  // MAC de fábrica (eFuse): disponible aunque el WiFi todavía no esté iniciado
+  uint64_t mac = ESP.getEfuseMac();
+  snprintf(device_id, sizeof(device_id), "%02X:%02X:%02X:%02X:%02X:%02X",
+           (uint8_t)(mac), (uint8_t)(mac >> 8), (uint8_t)(mac >> 16),
+           (uint8_t)(mac >> 24), (uint8_t)(mac >> 32), (uint8_t)(mac >> 40));
+  preferencias.begin("gps", false);
+  contadorArranques = preferencias.getUInt("arranques", 0) + 1;
+  preferencias.putUInt("arranques", contadorArranques);
+  // Último intervalo enviado por el backend: se conserva tras un reinicio
+  intervalo_envio = preferencias.getLong("intervalo", intervalo_envio);
+  preferencias.end();
+  snprintf(mqtt_config_topic, sizeof(mqtt_config_topic), "dispositivos/%s/config", device_id);
+  Serial.print("Dispositivo: ");
+  Serial.print(device_id);
+  Serial.print(" - Arranque #");
+  Serial.println(contadorArranques);
+  
   // Iniciar GPS con baudios más comunes para módulos GPS
   neogps.begin(9600, SERIAL_8N1, RXD2, TXD2);
   Serial.println("GPS configurado a 9600 baudios");
@@ -165,6 +229,8 @@ void setup()
   
   // Configurar callback para mensajes MQTT
   client.setCallback(callback);
+  // El fix con identidad, calidad e intervalo supera los 256 bytes por defecto de PubSubClient
+  client.setBufferSize(512);
   
   // Conectar WiFi si hay credenciales
   if (strlen(ssid) > 0) {
@@ -337,6 +403,16 @@ void verificarConexiones() {
   }
 }
 
+// Carga estimada de la batería (0-100) o -1 si no hay pin de medición
+int leerBateria() {
+  if (PIN_BATERIA < 0) {
+    return -1;
+  }
+  // Divisor 1:2: el pin ve la mitad del voltaje; LiPo entre 3.3 V (vacía) y 4.2 V (llena)
+  float voltaje = analogReadMilliVolts(PIN_BATERIA) * 2 / 1000.0;
+  return constrain((int)((voltaje - 3.3) / (4.2 - 3.3) * 100), 0, 100);
+}
+
 // Enviar heartbeat periódicamente
 void enviarHeartbeat() {
   if (!usar_wifi || WiFi.status() != WL_CONNECTED || !client.connected()) {
@@ -347,13 +423,23 @@ void enviarHeartbeat() {
   if (tiempoActual - ultimo_heartbeat >= intervalo_heartbeat) {
     ultimo_heartbeat = tiempoActual;
     
-    // Crear JSON de heartbeat
-    StaticJsonDocument<200> doc;
+    // Crear JSON de heartbeat (el backend guarda el estado del enlace de cada collar)
+    StaticJsonDocument<384> doc;
     doc["tipo"] = "heartbeat";
     doc["cliente_id"] = mqtt_client_id;
+    doc["device_id"] = device_id;
     doc["mascota"] = ID_MASCOTA;
     doc["version"] = VERSION;
     doc["uptime"] = tiempoActual / 1000;  // Segundos desde inicio
+    doc["rssi"] = WiFi.RSSI();
+    doc["fallos_publicacion"] = fallosPublicacion;
+    if (gps.satellites.isValid()) {
+      doc["satelites"] = gps.satellites.value();
+    }
+    int bateria = leerBateria();
+    if (bateria >= 0) {
+      doc["bateria"] = bateria;
+    }
     
     if (datosGPSValidos) {
       doc["latitude"] = ultimaLatitud;
@@ -361,7 +447,7 @@ void enviarHeartbeat() {
     }
     
     // Enviar al topic del sistema
-    char buffer[256];
+    char buffer[384];
     serializeJson(doc, buffer);
     
     Serial.print("Enviando heartbeat: ");
@@ -711,10 +797,17 @@ void reconnectMQTT() {
       Serial.print("Suscrito al topic de sistema: ");
       Serial.println(mqtt_system_topic);
       
+      // Topic propio de configuración (el último valor queda retenido en el broker)
+      client.subscribe(mqtt_config_topic, 1);
+      Serial.print("Suscrito al topic de configuración: ");
+      Serial.println(mqtt_config_topic);
+      
       // Enviar mensaje de estado al conectar
       StaticJsonDocument<256> doc;
       doc["tipo"] = "conexion";
       doc["cliente_id"] = mqtt_client_id;
+      doc["device_id"] = device_id;
+      doc["fallos_publicacion"] = fallosPublicacion;
       doc["mascota"] = ID_MASCOTA;
       doc["version"] = VERSION;
       doc["rssi"] = WiFi.RSSI();
@@ -758,8 +851,19 @@ void enviarDatosGPS() {
   }
   
   // Crear JSON con el formato solicitado
-  StaticJsonDocument<128> doc;
+  StaticJsonDocument<384> doc;
   doc["mascota"] = ID_MASCOTA;
+  doc["device_id"] = device_id;
+  doc["seq"] = ((uint64_t)contadorArranques << 32) | contadorFixes++;
+  
+  // Hora UTC del GPS para medir la latencia desde el dispositivo hasta el cliente
+  char device_time[24];
+  if (gps.date.isValid() && gps.time.isValid() && gps.date.year() > 2000) {
+    snprintf(device_time, sizeof(device_time), "%04d-%02d-%02dT%02d:%02d:%02dZ",
+             gps.date.year(), gps.date.month(), gps.date.day(),
+             gps.time.hour(), gps.time.minute(), gps.time.second());
+    doc["device_time"] = device_time;
+  }
   
   if (!datosGPSValidos) {
     Serial.println("No hay datos GPS válidos, enviando coordenadas (0,0)");
@@ -770,7 +874,17 @@ void enviarDatosGPS() {
     doc["longitude"] = ultimaLongitud;
   }
   
-  char buffer[256];
+  // Calidad del fix: el backend deja en cuarentena los de HDOP alto o pocos satélites
+  if (gps.hdop.isValid()) {
+    doc["hdop"] = gps.hdop.hdop();
+  }
+  if (gps.satellites.isValid()) {
+    doc["satelites"] = gps.satellites.value();
+  }
+  // Intervalo en uso: el backend solo envía uno nuevo cuando difiere
+  doc["intervalo"] = intervalo_envio;
+  
+  char buffer[384];
   serializeJson(doc, buffer);
   
   // Enviar datos por MQTT
@@ -780,6 +894,7 @@ void enviarDatosGPS() {
   if (client.publish(mqtt_topic, buffer)) {
     Serial.println("Datos enviados con éxito a EMQX");
   } else {
+    fallosPublicacion++;
     Serial.println("Error al enviar datos a EMQX");
   }
 }